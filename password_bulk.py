@@ -0,0 +1,163 @@
+"""Generates passwords in bulk from the operating system's CSPRNG.
+
+Random bytes are drawn from `os.urandom` in large blocks and mapped to the
+alphabet with rejection sampling done by numpy over the whole block: bytes
+at or above the largest multiple of the alphabet size are dropped, so every
+character stays equally likely, and the rest are reduced modulo the size.
+"""
+import argparse
+import os
+from string import ascii_letters, digits, punctuation
+from time import perf_counter
+from typing import Callable
+
+import numpy as np
+
+# Extra bytes drawn over the expected need, so one draw is almost always
+# enough
+MARGIN: float = 1.05
+
+
+def make_alphabet(numbers: bool = True, special: bool = True) -> str:
+    """
+    Characters passwords are drawn from, like `pass_gen()`
+
+    :param numbers: default True, False if passwords won't hold numbers
+    :type numbers: bool
+    :param special: default True, False if passwords won't hold special
+                    characters
+    :type special: bool
+    :return: letters, then digits and punctuation as requested
+    :rtype: str
+    """
+    return (ascii_letters + (digits if numbers else "")
+            + (punctuation if special else ""))
+
+
+def sample_indices(count: int, size: int,
+                   randbytes: Callable[[int], bytes] = os.urandom
+                   ) -> np.ndarray:
+    """
+    Uniform random indices below `size`, without modulo bias
+
+    :param count: indices wanted
+    :type count: int
+    :param size: alphabet size, from 1 to 256
+    :type size: int
+    :param randbytes: source of random bytes
+    :type randbytes: Callable[[int], bytes]
+    :return: `count` indices as uint8
+    :rtype: np.ndarray
+    """
+    if not 1 <= size <= 256:
+        raise ValueError("Alphabet size must be between 1 and 256")
+    # Largest multiple of size that fits in a byte
+    limit: int = 256 - 256 % size
+    chunks: list[np.ndarray] = []
+    missing: int = count
+    while missing > 0:
+        draw: int = int(missing * 256 / limit * MARGIN) + 16
+        block: np.ndarray = np.frombuffer(randbytes(draw), dtype=np.uint8)
+        if limit < 256:
+            block = block[block < limit]
+        chunks.append(block[:missing])
+        missing -= len(chunks[-1])
+    if not chunks:
+        return np.empty(0, dtype=np.uint8)
+    indices: np.ndarray = (chunks[0] if len(chunks) == 1
+                           else np.concatenate(chunks))
+    if size < 256:
+        indices = indices % size
+
+    return indices
+
+
+def bulk_passwords(count: int, length: int, numbers: bool = True,
+                   special: bool = True, alphabet: str | None = None,
+                   randbytes: Callable[[int], bytes] = os.urandom
+                   ) -> list[str]:
+    """
+    Generates `count` passwords of `length` characters at once
+
+    Every character is drawn independently and uniformly from the alphabet,
+    so unlike `pass_gen()` no class of characters is guaranteed to appear.
+
+    :param count: passwords wanted
+    :type count: int
+    :param length: characters per password
+    :type length: int
+    :param numbers: default True, False if passwords won't hold numbers
+    :type numbers: bool
+    :param special: default True, False if passwords won't hold special
+                    characters
+    :type special: bool
+    :param alphabet: ASCII characters to draw from, overrides `numbers` and
+                     `special` if given
+    :type alphabet: str | None
+    :param randbytes: source of random bytes, `os.urandom` by default
+    :type randbytes: Callable[[int], bytes]
+    :return: random passwords
+    :rtype: list[str]
+    """
+    if length <= 0:
+        return [""] * count
+    if alphabet is None:
+        alphabet = make_alphabet(numbers, special)
+    table: np.ndarray = np.frombuffer(alphabet.encode("ascii"),
+                                      dtype=np.uint8)
+    indices: np.ndarray = sample_indices(count * length, len(table),
+                                         randbytes)
+    text: str = table[indices].tobytes().decode("ascii")
+
+    return [text[i:i + length] for i in range(0, len(text), length)]
+
+
+def password_block(count: int, length: int, alphabet: str,
+                   randbytes: Callable[[int], bytes] = os.urandom) -> bytes:
+    """
+    `count` passwords of `length` characters, one per line, ready to write
+
+    :param count: passwords wanted
+    :type count: int
+    :param length: characters per password
+    :type length: int
+    :param alphabet: ASCII characters to draw from
+    :type alphabet: str
+    :param randbytes: source of random bytes, `os.urandom` by default
+    :type randbytes: Callable[[int], bytes]
+    :return: newline terminated passwords
+    :rtype: bytes
+    """
+    table: np.ndarray = np.frombuffer(alphabet.encode("ascii"),
+                                      dtype=np.uint8)
+    block: np.ndarray = np.full((count, length + 1), ord("\n"),
+                                dtype=np.uint8)
+    indices: np.ndarray = sample_indices(count * length, len(table),
+                                         randbytes)
+    block[:, :length] = table[indices].reshape(count, length)
+
+    return block.tobytes()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Time bulk password generation"
+    )
+    parser.add_argument("-n", "--count", type=int, default=1_000_000)
+    parser.add_argument("-l", "--length", type=int, default=16)
+    parser.add_argument("--no-numbers", action="store_true")
+    parser.add_argument("--no-special", action="store_true")
+    args = parser.parse_args()
+
+    start: float = perf_counter()
+    passwords: list[str] = bulk_passwords(args.count, args.length,
+                                          not args.no_numbers,
+                                          not args.no_special)
+    elapsed: float = perf_counter() - start
+    print(f"{len(passwords)} passwords of {args.length} characters in "
+          f"{elapsed:.3f} s ({len(passwords) / elapsed:,.0f} passwords/s)")
+    print("e.g.", passwords[0])
+
+
+if __name__ == "__main__":
+    main()
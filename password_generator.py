@@ -1,12 +1,22 @@
 """Creates random passwords based on user desired length, numbers
 and special characters"""
 
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from string import ascii_letters, digits, punctuation
 from random import choice, shuffle
+from typing import BinaryIO
+
+from password_bulk import make_alphabet, password_block
 
 ALL_LETTERS: list[str] = list(ascii_letters)
 NUMBERS: list[str] = list(digits)
 SPECIAL_CHARS: list[str] = list(punctuation)
+# Passwords generated per task of the non-interactive mode
+CHUNK: int = 100_000
 
 
 def pass_gen(length: int, numbers: bool = True, special: bool = True) -> str:
@@ -67,9 +77,99 @@ def user_requirements() -> None:
     print(pass_gen(int(length), numbers, special))
 
 
+def stream(out: BinaryIO, count: int, length: int, numbers: bool = True,
+           special: bool = True, workers: int | None = None,
+           chunk: int = CHUNK) -> None:
+    """
+    Writes `count` passwords, one per line, generated in chunks
+
+    Chunks are generated by worker processes, each reading its own
+    `os.urandom`, and written in the order they were requested. Only a few
+    chunks are in flight at any time, so memory stays the same for any
+    count.
+
+    :param out: where to write the passwords
+    :type out: BinaryIO
+    :param count: passwords wanted
+    :type count: int
+    :param length: characters per password
+    :type length: int
+    :param numbers: default True, False if passwords won't hold numbers
+    :type numbers: bool
+    :param special: default True, False if passwords won't hold special
+                    characters
+    :type special: bool
+    :param workers: generating processes, one per core if None
+    :type workers: int | None
+    :param chunk: passwords per chunk
+    :type chunk: int
+    :return: None
+    :rtype: NoneType
+    """
+    workers = workers or os.cpu_count() or 1
+    alphabet: str = make_alphabet(numbers, special)
+    sizes = (min(chunk, count - start) for start in range(0, count, chunk))
+    if workers == 1:
+        for size in sizes:
+            out.write(password_block(size, length, alphabet))
+        out.flush()
+        return
+    pending: deque[Future] = deque()
+    with ProcessPoolExecutor(workers) as pool:
+        try:
+            for size in sizes:
+                pending.append(pool.submit(password_block, size, length,
+                                           alphabet))
+                if len(pending) >= 2 * workers:
+                    out.write(pending.popleft().result())
+            while pending:
+                out.write(pending.popleft().result())
+            out.flush()
+        except BaseException:
+            # Nobody reads the chunks still queued, e.g. once the reader of
+            # a pipe is gone
+            pool.shutdown(cancel_futures=True)
+            raise
+
+
 def main():
     """Run main function"""
-    user_requirements()
+    parser = argparse.ArgumentParser(
+        description="Random passwords, asked interactively unless a count "
+                    "is given"
+    )
+    parser.add_argument("-n", "--count", type=int,
+                        help="passwords to write, one per line")
+    parser.add_argument("-l", "--length", type=int, default=16)
+    parser.add_argument("--no-numbers", action="store_true")
+    parser.add_argument("--no-special", action="store_true")
+    parser.add_argument("-o", "--output", help="file to write, stdout if "
+                                               "not given")
+    parser.add_argument("-w", "--workers", type=int,
+                        help="generating processes, one per core by default")
+    parser.add_argument("--chunk", type=int, default=CHUNK,
+                        help="passwords per chunk")
+    args = parser.parse_args()
+
+    if args.count is None:
+        user_requirements()
+        return
+    if (args.count < 0 or args.length < 1 or args.chunk < 1
+            or (args.workers is not None and args.workers < 1)):
+        parser.error("count, length, workers and chunk must be positive")
+    options = dict(numbers=not args.no_numbers, special=not args.no_special,
+                   workers=args.workers, chunk=args.chunk)
+    if args.output is None:
+        try:
+            stream(sys.stdout.buffer, args.count, args.length, **options)
+        except BrokenPipeError:
+            # The reader went away, like `head`: stop without a traceback,
+            # and without another one when Python flushes stdout on exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit(1)
+        return
+    with open(args.output, "wb") as out:
+        stream(out, args.count, args.length, **options)
 
 
 if __name__ == '__main__':
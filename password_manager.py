@@ -1,14 +1,22 @@
 # import json
 import sys
 from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import os
 from os.path import exists
-import base64
 import time
+from vault_commit import commit
+from vault_export import decrypt_chunk, export
+from vault_import import import_entries, read_entries
+from vault_index import index_key, lookup, update_index
+from vault_kdf import calibrate, derive, dump_params
+from vault_mmap import MappedVault
+from vault_search import NameIndex, SearchIndex, update_search
+from vault_sqlite import VAULT_DB, SQLiteVault
 # Organize and store your passwords as an encrypted format
 
+# Entries shown at once by `view()`
+PAGE: int = 50
+
 
 def save_Mpw(password: str) -> list[bytes]:
     """
@@ -30,7 +38,9 @@ def save_Mpw(password: str) -> list[bytes]:
 
 # os.urandom() uses system entropy sources for better random generation
 def create_key_from_password(password: bytes, file: str, mpw_k: bytes,
-                             salt: bytes = os.urandom(16)) -> None:
+                             salt: bytes | None = None,
+                             algorithm: str = "pbkdf2",
+                             params: dict[str, int] | None = None) -> None:
     """
     Creates main key and stores it mpw and its key
 
@@ -40,26 +50,42 @@ def create_key_from_password(password: bytes, file: str, mpw_k: bytes,
     :type file: str
     :param mpw_k: Second returned value from `save_Mpw()` function
     :type mpw_k: bytes
-    :param salt: Default set to 16 characters
-    :type salt: bytes
+    :param salt: Default set to 16 random bytes
+    :type salt: bytes | None
+    :param algorithm: Key derivation, 'pbkdf2' or 'scrypt'
+    :type algorithm: str
+    :param params: KDF parameters, calibrated on this machine if None
+    :type params: dict[str, int] | None
     :return: None
     :rtype: NoneType
     """
+    salt = salt or os.urandom(16)
+    # The higher the cost, slower the algorithm, safer
+    params = params or calibrate(algorithm)
     # Creates the main key to store and visualize file content
-    # Key Derivation Function
-    kdf = PBKDF2HMAC(  # Derives a key from a password, using a salt and iter
-        algorithm=hashes.SHA256(),  # cryptographic hash function 256 bits
-        length=32,
-        salt=salt,  # aleatory string of characters
-        iterations=600000  # The higher the number, slower the algorithm, safer
-    )
-    # base64 converts bytes that have binary or text data into ASCII characters
-    key = base64.urlsafe_b64encode(kdf.derive(password))
+    key = derive(password, salt, algorithm, params)
 
     with open(file, "wb") as key_file:
         key_file.write(key + "\n".encode())
         key_file.write(password + "\n".encode())
         key_file.write(mpw_k + "\n".encode())
+        # Older files stop here, which means PBKDF2 at 600000 iterations
+        key_file.write(dump_params(algorithm, params, salt) + "\n".encode())
+
+
+def read_key(file: str) -> bytes:
+    """
+    Reads main key from file
+
+    :param file: Name of `.key` file
+    :type file: str
+    :return: main key, base64 encoded
+    :rtype: bytes
+    """
+    with open(file, "rb") as file_key:
+        data = file_key.read()
+        content = data.decode().split("\n")
+    return content[0].encode()
 
 
 def load_key(file: str) -> Fernet:
@@ -71,11 +97,7 @@ def load_key(file: str) -> Fernet:
     :return: Fernet handle to decrypt keys file
     :rtype: Fernet
     """
-    with open(file, "rb") as file_key:
-        data = file_key.read()
-        content = data.decode().split("\n")
-    key: bytes = content[0].encode()
-    return Fernet(key)
+    return Fernet(read_key(file))
 
 
 def validate_mpw(fer: Fernet, file: str) -> bytes:
@@ -112,33 +134,205 @@ def MPw_validation_saving(mpw: str, fer: Fernet, file: str) -> bool:
     return validate_mpw(fer, file) == mpw.encode()
 
 
-def add(fer: Fernet) -> None:
+def add(fer: Fernet, idx_key: bytes | None = None,
+        vault: SQLiteVault | None = None,
+        names: NameIndex | None = None) -> None:
     """
     Store and encrypt users input
 
     :param fer: Encrypts user input
     :type fer:
+    :param idx_key: returned value from `index_key()`, keeps the account
+                    index up to date if given
+    :type idx_key: bytes | None
+    :param vault: SQLite vault used instead of 'keys.txt' if given
+    :type vault: SQLiteVault | None
+    :param names: search index of the session, kept up to date if given
+    :type names: NameIndex | None
     :return: None
     :rtype: NoneType
     """
     usr: str = input("Account: ")
     pwd: str = input("Password: ")
-    with open("keys.txt", "a") as file:
-        # Writes to the file in a string like format the encrypted version
-        # of the password previously encoded in utf-8
-        file.write(usr + "|" + fer.encrypt(pwd.encode()).decode() + "\n")
+    if vault is not None:
+        vault.add(usr, fer.encrypt(pwd.encode()))
+        if names is not None:
+            names.insert(usr)
+        return
+    # Writes to the file in a string like format the encrypted version
+    # of the password previously encoded in utf-8, locked and synced
+    commit((usr + "|" + fer.encrypt(pwd.encode()).decode() + "\n").encode())
+    if idx_key is not None:
+        update_index(idx_key)
+    refresh_search(fer, names)
+
+
+def bulk_add(fer: Fernet, idx_key: bytes,
+             vault: SQLiteVault | None = None,
+             names: NameIndex | None = None) -> None:
+    """
+    Store and encrypt every account and password of a CSV or JSON file
+
+    :param fer: Encrypts user input
+    :type fer: Fernet
+    :param idx_key: returned value from `index_key()` function
+    :type idx_key: bytes
+    :param vault: SQLite vault used instead of 'keys.txt' if given
+    :type vault: SQLiteVault | None
+    :param names: search index of the session, kept up to date if given
+    :type names: NameIndex | None
+    :return: None
+    :rtype: NoneType
+    """
+    source: str = input("Import from (.csv or .json): ")
+    if not exists(source):
+        print(f"Unable to find '{source}'")
+        return
+    try:
+        if vault is not None:
+            entries: list[tuple[str, str]] = list(read_entries(source))
+            count: int = vault.add_many((usr, fer.encrypt(pwd.encode()))
+                                        for usr, pwd in entries)
+            if names is not None:
+                for usr, _ in entries:
+                    names.insert(usr)
+            print(f"Imported {count} entries")
+            return
+        count, rate = import_entries(fer, read_entries(source))
+    except (ValueError, OSError) as error:
+        # keys.txt is only replaced once every entry made it
+        print(f"Unable to import '{source}': {error}")
+        return
+    update_index(idx_key)
+    refresh_search(fer, names)
+    print(f"Imported {count} entries ({rate:,.0f} entries/s)")
+
+
+def refresh_search(fer: Fernet, names: NameIndex | None = None) -> None:
+    """
+    Brings the search index up to date with keys.txt, the one of the session
+    if there is one, else only keys.search
+
+    :param fer: Fernet wrapper from main key
+    :type fer: Fernet
+    :param names: search index of the session
+    :type names: NameIndex | None
+    :return: None
+    :rtype: NoneType
+    """
+    if isinstance(names, SearchIndex):
+        names.update()
+    else:
+        update_search(fer)
+
+
+def find(fer: Fernet, idx_key: bytes,
+         vault: SQLiteVault | None = None) -> None:
+    """
+    Read the password(s) of a single account through the account index
+
+    :param fer: Decrypts user input
+    :type fer: Fernet
+    :param idx_key: returned value from `index_key()` function
+    :type idx_key: bytes
+    :param vault: SQLite vault used instead of 'keys.txt' if given
+    :type vault: SQLiteVault | None
+    :return: None
+    :rtype: NoneType
+    """
+    if vault is None and not exists("./keys.txt"):
+        print("No entries currently found in file. Add some first.")
+        return
+    usr: str = input("Account: ")
+    if vault is not None:
+        passwords: list[str] = [fer.decrypt(token).decode()
+                                for token in vault.get(usr)]
+    else:
+        passwords = lookup(fer, idx_key, usr)
+    if not passwords:
+        print(f"No entry found for '{usr}'")
+    for pwd in passwords:
+        print(usr, pwd)
+
+
+def search(fer: Fernet, vault: SQLiteVault | None = None,
+           names: NameIndex | None = None) -> NameIndex | None:
+    """
+    List account names by prefix or close to the query, typos included,
+    without decrypting any password
+
+    :param fer: Decrypts the search index
+    :type fer: Fernet
+    :param vault: SQLite vault used instead of 'keys.txt' if given
+    :type vault: SQLiteVault | None
+    :param names: search index of the session, built if None
+    :type names: NameIndex | None
+    :return: search index to reuse for the next queries of the session
+    :rtype: NameIndex | None
+    """
+    if vault is None and not exists("./keys.txt"):
+        print("No entries currently found in file. Add some first.")
+        return names
+    query: str = input("Search: ")
+    if names is None:
+        names = (SearchIndex(fer) if vault is None
+                 else NameIndex(vault.accounts()))
+    elif isinstance(names, SearchIndex):
+        # Catches lines appended by another shell, only reading those
+        names.update()
+    found: list[str] = names.search(query)
+    if not found:
+        print(f"No account matching '{query}'")
+    for name in found:
+        print(name)
+
+    return names
+
+
+def update(fer: Fernet, vault: SQLiteVault) -> None:
+    """
+    Replace the password of an account in the SQLite vault
+
+    :param fer: Encrypts user input
+    :type fer: Fernet
+    :param vault: SQLite vault holding the account
+    :type vault: SQLiteVault
+    :return: None
+    :rtype: NoneType
+    """
+    usr: str = input("Account: ")
+    pwd: str = input("New password: ")
+    if vault.update(usr, fer.encrypt(pwd.encode())) == 0:
+        print(f"No entry found for '{usr}'")
+
 
+def delete(vault: SQLiteVault) -> None:
+    """
+    Remove an account from the SQLite vault
 
-def view(fer: Fernet) -> None:  # Add secondary selection to return just one
+    :param vault: SQLite vault holding the account
+    :type vault: SQLiteVault
+    :return: None
+    :rtype: NoneType
+    """
+    usr: str = input("Account: ")
+    print(f"Removed {vault.delete(usr)} entries for '{usr}'")
+
+
+def view(fer: Fernet, vault: SQLiteVault | None = None) -> None:
     """
     Read unencrypted data
 
     :param fer: Decrypts user input
     :type fer:
+    :param vault: SQLite vault used instead of 'keys.txt' if given
+    :type vault: SQLiteVault | None
     :return: None
     :rtype: NoneType
     """
-    if not exists("./keys.txt"):
+    if vault is not None:
+        export(fer, sys.stdout, lines=vault.lines())
+    elif not exists("./keys.txt"):
         print("Unable to find 'keys.txt', creating it", end='')
         with open("keys.txt", "w") as file:
             for n in range(3):
@@ -149,11 +343,64 @@ def view(fer: Fernet) -> None:  # Add secondary selection to return just one
         if os.path.getsize("./keys.txt") < 1:
             print("No entries currently found in file. Add some first.")
         else:
-            with open("keys.txt", "r") as file:
-                for line in file.readlines():
-                    data: str = line.rstrip()
-                    usr, pwd = data.split("|")
-                    print(usr, fer.decrypt(pwd.encode()).decode())
+            # Maps the file and decrypts one page of entries at a time
+            with MappedVault() as entries:
+                start: int = 0
+                while start < len(entries):
+                    page: list[bytes] = entries.page(start, PAGE)
+                    print(decrypt_chunk(fer, page), end='')
+                    start += len(page)
+                    if start == len(entries):
+                        break
+                    answer: str = input(f"{start}/{len(entries)} shown, "
+                                        "Enter for more, entry number to "
+                                        "jump, Q to stop: ").lower()
+                    if answer == "q":
+                        break
+                    if answer.isdigit():
+                        start = max(int(answer) - 1, 0)
+
+
+def export_file(fer: Fernet, vault: SQLiteVault | None = None) -> None:
+    """
+    Write every account and password to a file, in plaintext or encrypted
+    with the key of another `.key` file
+
+    :param fer: Decrypts user input
+    :type fer: Fernet
+    :param vault: SQLite vault used instead of 'keys.txt' if given
+    :type vault: SQLiteVault | None
+    :return: None
+    :rtype: NoneType
+    """
+    if vault is None and not exists("./keys.txt"):
+        print("No entries currently found in file. Add some first.")
+        return
+    out: str = input("Export to: ")
+    other: str = input("Encrypt with key file (Enter for plaintext): ")
+    target: Fernet | None = load_key(other) if other else None
+    with open(out, "w") as file:
+        export(fer, file, target=target,
+               lines=None if vault is None else vault.lines())
+    print(f"Exported to '{out}'")
+
+
+def unlock(mpw: str, file: str) -> bytes | None:
+    """
+    Validates the MPass and returns the main key, reading `.key` file once
+
+    :param mpw: Most recent master password entered
+    :type mpw: str
+    :param file: Name of `.key` file
+    :type file: str
+    :return: main key, None if the MPass is wrong
+    :rtype: bytes | None
+    """
+    with open(file, "rb") as fl:
+        content = fl.read().split("\n".encode())
+    if Fernet(content[2]).decrypt(content[1]) != mpw.encode():
+        return None
+    return content[0]
 
 
 def read_mpw(file: str) -> Fernet:
@@ -172,25 +419,50 @@ def read_mpw(file: str) -> Fernet:
     return fer
 
 
-def add_view(fer: Fernet) -> None:
+def add_view(fer: Fernet, idx_key: bytes,
+             vault: SQLiteVault | None = None) -> None:
     """
     Create and read account/site and password
 
     :param fer: Fernet wrapper from main key
     :type fer: Fernet
+    :param idx_key: returned value from `index_key()` function
+    :type idx_key: bytes
+    :param vault: SQLite vault used instead of 'keys.txt' if given, which
+                  also allows updating and deleting entries
+    :type vault: SQLiteVault | None
     :return: None
     :rtype: NoneType
     """
+    modes: str = ("V, F, S, E, I or A" if vault is None
+                  else "V, F, S, E, I, U, D or A")
+    # Built by the first search, then kept up to date for the session
+    names: NameIndex | None = None
     # Invalid entry will terminate the program
     while True:
-        # Ask the user whether add or read the password(s)
-        mode: str = input("V or A: ").lower()
+        # Ask the user whether add, find or read the password(s)
+        mode: str = input(f"{modes}: ").lower()
         if mode == "q":
             break
         if mode == "v":
-            view(fer)
+            view(fer, vault)
+        elif mode == "f":
+            find(fer, idx_key, vault)
+        elif mode == "s":
+            names = search(fer, vault, names)
+        elif mode == "e":
+            export_file(fer, vault)
+        elif mode == "i":
+            bulk_add(fer, idx_key, vault, names)
+        elif mode == "u" and vault is not None:
+            update(fer, vault)
+        elif mode == "d" and vault is not None:
+            delete(vault)
+            # Names can't be taken out of the index, the next search
+            # rebuilds it
+            names = None
         elif mode == "a":
-            add(fer)
+            add(fer, idx_key, vault, names)
         else:
             print("Invalid")
             sys.exit()
@@ -205,8 +477,9 @@ def main() -> None:
         mpw, mpw_key = save_Mpw(m_pwd)
         print("Key file missing in current directory.\n"
               f"Creating key as '{file}'", end='')
-        # Stores main key, mpw and mpw key
-        create_key_from_password(mpw, file, mpw_key)
+        # Stores main key, mpw and mpw key, KEYS_KDF picks the derivation
+        kdf: str = os.environ.get("KEYS_KDF", "pbkdf2")
+        create_key_from_password(mpw, file, mpw_key, algorithm=kdf)
         for n in range(3):
             print(".", end='', flush=True)
             time.sleep(1)
@@ -217,13 +490,14 @@ def main() -> None:
             print('.', end='', flush=True)
             time.sleep(1)
         print()
-        # Read stored mpw key
-        fer = read_mpw(file)
         # Reads and validates mpw to get access to main key
-        if MPw_validation_saving(m_pwd, fer, file):
-            # Handle for initializing
-            key: Fernet = load_key(file)
-            add_view(key)
+        main_key: bytes | None = unlock(m_pwd, file)
+        if main_key is not None:
+            # The SQLite vault takes over once keys.txt was migrated into it
+            vault: SQLiteVault | None = None
+            if exists(VAULT_DB):
+                vault = SQLiteVault()
+            add_view(Fernet(main_key), index_key(main_key), vault)
         else:
             # Wrong password will terminate the program
             print("Invalid MPass")
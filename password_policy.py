@@ -0,0 +1,277 @@
+"""Password policies with per-class minimum and maximum counts.
+
+A policy splits its alphabet into classes (lower, upper, digits, special and
+anything else a custom alphabet brings) and bounds how many characters of
+each a password holds. Passwords are generated in a single pass, without
+generating and retrying:
+
+1. How many characters each class gets is drawn class by class, weighted by
+   how many compliant passwords have those counts. The weights come from a
+   table built once per policy, counting the ways to fill the remaining
+   positions with the remaining classes.
+2. The class of every position is a random arrangement of those counts.
+3. Every position gets a random character of its class.
+
+That draws uniformly among every password meeting the policy, with the
+operating system's CSPRNG, and costs the same however strict the policy is.
+The table is kept as logarithms in floating point, so the weights of the
+counts are exact to about one part in 10**13, whatever the length.
+"""
+import argparse
+import os
+from random import SystemRandom
+from string import ascii_lowercase, ascii_uppercase, digits, punctuation
+
+import numpy as np
+
+from password_bulk import sample_indices
+
+CLASSES: dict[str, str] = {
+    "lower": ascii_lowercase,
+    "upper": ascii_uppercase,
+    "digits": digits,
+    "special": punctuation,
+}
+# Characters easily mistaken for one another
+AMBIGUOUS: str = "O0oIl1|`'"
+
+_random: SystemRandom = SystemRandom()
+
+
+def classify(alphabet: str) -> dict[str, str]:
+    """
+    Characters of an alphabet grouped by class
+
+    :param alphabet: characters allowed, duplicates ignored
+    :type alphabet: str
+    :return: class name and its characters, 'other' for unknown ones
+    :rtype: dict[str, str]
+    """
+    groups: dict[str, str] = {}
+    for char in dict.fromkeys(alphabet):
+        name: str = next((name for name, chars in CLASSES.items()
+                          if char in chars), "other")
+        groups[name] = groups.get(name, "") + char
+    return groups
+
+
+class Policy:
+    """
+    Length, alphabet and per-class bounds of the passwords to generate
+    """
+
+    def __init__(self, length: int = 16,
+                 min_counts: dict[str, int] | None = None,
+                 max_counts: dict[str, int] | None = None,
+                 exclude: str = "", alphabet: str | None = None) -> None:
+        if length < 0:
+            raise ValueError("Length must be positive")
+        if alphabet is None:
+            alphabet = "".join(CLASSES.values())
+        if not alphabet.isascii():
+            raise ValueError("Alphabet must be ASCII")
+        self.length: int = length
+        self.classes: dict[str, str] = classify(
+            "".join(char for char in alphabet if char not in exclude)
+        )
+        min_counts = min_counts or {}
+        max_counts = max_counts or {}
+        for name in {*min_counts, *max_counts} - {*CLASSES, "other"}:
+            raise ValueError(f"Unknown class {name!r}")
+        for name, count in [*min_counts.items(), *max_counts.items()]:
+            if (not isinstance(count, int) or isinstance(count, bool)
+                    or count < 0):
+                raise ValueError(f"Count of {name} must be a positive "
+                                 f"integer, not {count!r}")
+        for name in min_counts.keys() & max_counts.keys():
+            if min_counts[name] > max_counts[name]:
+                raise ValueError(f"Minimum of {name} above its maximum")
+        self.names: list[str] = list(self.classes)
+        self.lows: list[int] = [min_counts.get(name, 0)
+                                for name in self.names]
+        self.highs: list[int] = [min(max_counts.get(name, length), length)
+                                 for name in self.names]
+        for name, low in min_counts.items():
+            if low > 0 and name not in self.classes:
+                raise ValueError(f"No {name} character left in the alphabet")
+        self.tables: list[np.ndarray] = [
+            np.frombuffer(self.classes[name].encode("ascii"), dtype=np.uint8)
+            for name in self.names
+        ]
+        self.log_factorials: np.ndarray = np.concatenate(
+            ([0.0], np.cumsum(np.log(np.arange(1, length + 1))))
+        )
+        self.ways: list[np.ndarray] = self.count_ways()
+        # Cumulative weights of the counts of a class, by class and
+        # positions left, filled as they are reached
+        self.cumulative: dict[tuple[int, int], np.ndarray] = {}
+        if self.ways[0][length] == -np.inf:
+            raise ValueError(f"No password of {length} characters meets "
+                             "the policy")
+
+    def weights(self, i: int, left: int, ways: np.ndarray) -> np.ndarray:
+        """
+        Log of the compliant ways to fill `left` positions for every count
+        class `i` may take, from its minimum up
+
+        :param i: class index
+        :type i: int
+        :param left: positions to fill
+        :type left: int
+        :param ways: log of the ways to fill every length with the classes
+                     after `i`
+        :type ways: np.ndarray
+        :return: one log weight per count
+        :rtype: np.ndarray
+        """
+        counts: np.ndarray = np.arange(self.lows[i],
+                                       min(self.highs[i], left) + 1)
+        # log(comb(left, count) * size ** count)
+        return (self.log_factorials[left] - self.log_factorials[counts]
+                - self.log_factorials[left - counts]
+                + counts * np.log(len(self.tables[i])) + ways[left - counts])
+
+    def count_ways(self) -> list[np.ndarray]:
+        """
+        Log of the compliant ways to fill `r` positions with classes `i`
+        onwards
+
+        :return: `ways[i][r]` for every class and remaining length
+        :rtype: list[np.ndarray]
+        """
+        ways: list[np.ndarray] = [np.full(self.length + 1, -np.inf)
+                                  for _ in range(len(self.names) + 1)]
+        ways[-1][0] = 0.0
+        for i in range(len(self.names) - 1, -1, -1):
+            for left in range(self.length + 1):
+                terms: np.ndarray = self.weights(i, left, ways[i + 1])
+                if terms.size:
+                    ways[i][left] = np.logaddexp.reduce(terms)
+        return ways
+
+    def counts(self) -> list[int]:
+        """
+        Characters given to each class, drawn with the weight of every
+        possible split
+
+        :return: one count per class, in the order of `self.names`
+        :rtype: list[int]
+        """
+        counts: list[int] = []
+        left: int = self.length
+        for i in range(len(self.names)):
+            cumulative: np.ndarray | None = self.cumulative.get((i, left))
+            if cumulative is None:
+                cumulative = np.cumsum(np.exp(
+                    self.weights(i, left, self.ways[i + 1])
+                    - self.ways[i][left]
+                ))
+                self.cumulative[i, left] = cumulative
+            pick: float = _random.random() * cumulative[-1]
+            count: int = self.lows[i] + min(
+                int(np.searchsorted(cumulative, pick, side="right")),
+                len(cumulative) - 1
+            )
+            counts.append(count)
+            left -= count
+        return counts
+
+    def generate(self) -> str:
+        """
+        A random password meeting the policy
+
+        :return: password of `self.length` characters
+        :rtype: str
+        """
+        chars: np.ndarray = np.empty(self.length, dtype=np.uint8)
+        start: int = 0
+        for table, count in zip(self.tables, self.counts()):
+            chars[start:start + count] = table[
+                sample_indices(count, len(table))
+            ]
+            start += count
+        # Sorting by random keys shuffles the positions, ties between 64 bit
+        # keys are too unlikely to bias it
+        keys: np.ndarray = np.frombuffer(os.urandom(8 * self.length),
+                                         dtype=np.uint64)
+        return chars[np.argsort(keys)].tobytes().decode("ascii")
+
+    def generate_many(self, count: int) -> list[str]:
+        """
+        `count` random passwords meeting the policy
+
+        :param count: passwords wanted
+        :type count: int
+        :return: passwords
+        :rtype: list[str]
+        """
+        return [self.generate() for _ in range(count)]
+
+    def check(self, password: str) -> bool:
+        """
+        Whether a password meets the policy
+
+        :param password: password to check
+        :type password: str
+        :return: True if length, alphabet and every count comply
+        :rtype: bool
+        """
+        if len(password) != self.length:
+            return False
+        for name, low, high in zip(self.names, self.lows, self.highs):
+            count: int = sum(char in self.classes[name] for char in password)
+            if not low <= count <= high:
+                return False
+        return all(any(char in chars for chars in self.classes.values())
+                   for char in password)
+
+
+def parse_counts(values: list[str]) -> dict[str, int]:
+    """
+    `class=count` arguments as a dictionary
+
+    :param values: arguments like `digits=2`
+    :type values: list[str]
+    :return: class name and count
+    :rtype: dict[str, int]
+    """
+    counts: dict[str, int] = {}
+    for value in values:
+        name, _, count = value.partition("=")
+        counts[name] = int(count)
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Generate passwords meeting a composition policy"
+    )
+    parser.add_argument("-l", "--length", type=int, default=16)
+    parser.add_argument("-n", "--count", type=int, default=1)
+    parser.add_argument("--min", nargs="*", default=[], metavar="CLASS=N",
+                        help=f"least characters of a class: "
+                             f"{', '.join(CLASSES)} or other")
+    parser.add_argument("--max", nargs="*", default=[], metavar="CLASS=N",
+                        help="most characters of a class")
+    parser.add_argument("--exclude", default="",
+                        help="characters never used")
+    parser.add_argument("--no-ambiguous", action="store_true",
+                        help=f"also exclude {AMBIGUOUS}")
+    parser.add_argument("--alphabet", help="characters allowed, every "
+                                           "printable ASCII by default")
+    args = parser.parse_args()
+
+    try:
+        policy: Policy = Policy(
+            args.length, parse_counts(args.min), parse_counts(args.max),
+            args.exclude + (AMBIGUOUS if args.no_ambiguous else ""),
+            args.alphabet
+        )
+    except ValueError as error:
+        parser.error(str(error))
+    for password in policy.generate_many(args.count):
+        print(password)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,535 @@
+"""Scores password strength in batches.
+
+Passwords are laid out as rows of a byte matrix, padded with zeros, so every
+check runs over the whole batch at once with numpy:
+
+- charset entropy, from the classes of characters a password uses;
+- sequences (`abc`, `987`), repeats (`aaa`) and keyboard walks (`qwe`,
+  `zxc`), three or more characters long, and repeated units (`abcabc`, up
+  to `MAX_PERIOD` bytes long), counted as adding no entropy;
+- membership in a common-password list, kept as a sorted array of 64 bit
+  hashes of the lowercased entries and looked up with binary search.
+
+Passwords are UTF-8, their length counts characters rather than bytes.
+Sequences, repeats and walks compare single bytes, so they only catch ASCII
+characters; a repeated non-ASCII character is caught as a repeated unit of
+its bytes. Only the first `MAX_WIDTH` bytes of a password are checked for
+patterns and hashed. Longer ones score on their full length, with the
+characters and patterns past those bytes in the same proportion as in them.
+"""
+import argparse
+import sys
+from getpass import getpass
+from os.path import exists
+from time import perf_counter
+from typing import BinaryIO, Iterator
+
+import numpy as np
+from cryptography.fernet import Fernet
+
+from vault_index import KEYS_FILE
+from vault_sqlite import VAULT_DB, SQLiteVault
+
+MAX_WIDTH: int = 64
+# Longest repeated unit looked for, in bytes
+MAX_PERIOD: int = 12
+# Bytes read at a time when streaming a file
+BLOCK: int = 4 << 20
+# Entropy in bits from which a password gets each score, 0 below the first
+THRESHOLDS: tuple[int, ...] = (28, 36, 60, 128)
+# Class bits and how many characters each class holds
+LOWER, UPPER, DIGIT, SPECIAL, OTHER = 1, 2, 4, 8, 16
+POOL_SIZES: dict[int, int] = {LOWER: 26, UPPER: 26, DIGIT: 10, SPECIAL: 33,
+                              OTHER: 100}
+KEYBOARD: tuple[tuple[str, str], ...] = (
+    ("`1234567890-=", "~!@#$%^&*()_+"),
+    ("qwertyuiop[]\\", "QWERTYUIOP{}|"),
+    ("asdfghjkl;'", 'ASDFGHJKL:"'),
+    ("zxcvbnm,./", "ZXCVBNM<>?"),
+)
+# Seen in most leaked password lists, used when no list is given
+COMMON: tuple[str, ...] = (
+    "123456", "password", "12345678", "qwerty", "123456789", "12345",
+    "1234", "111111", "1234567", "dragon", "123123", "baseball", "abc123",
+    "football", "monkey", "letmein", "696969", "shadow", "master", "666666",
+    "qwertyuiop", "123321", "mustang", "1234567890", "michael", "654321",
+    "superman", "1qaz2wsx", "7777777", "121212", "000000", "qazwsx",
+    "123qwe", "killer", "trustno1", "jordan", "jennifer", "zxcvbnm",
+    "asdfgh", "hunter", "buster", "soccer", "harley", "batman", "andrew",
+    "tigger", "sunshine", "iloveyou", "2000", "charlie", "robert", "thomas",
+    "hockey", "ranger", "daniel", "starwars", "klaster", "112233", "george",
+    "computer", "michelle", "jessica", "pepper", "1111", "zxcvbn", "555555",
+    "11111111", "131313", "freedom", "777777", "pass", "maggie", "159753",
+    "aaaaaa", "ginger", "princess", "joshua", "cheese", "amanda", "summer",
+    "love", "ashley", "nicole", "chelsea", "biteme", "matthew", "access",
+    "yankees", "987654321", "dallas", "austin", "thunder", "taylor",
+    "matrix", "admin", "welcome", "passw0rd", "password1", "qwerty123",
+)
+
+FNV_OFFSET: np.uint64 = np.uint64(0xcbf29ce484222325)
+FNV_PRIME: np.uint64 = np.uint64(0x100000001b3)
+
+
+def class_table() -> np.ndarray:
+    """
+    Class bit of every byte value
+
+    :return: 256 class bits, bytes above ASCII count as OTHER
+    :rtype: np.ndarray
+    """
+    table: np.ndarray = np.full(256, OTHER, dtype=np.uint8)
+    for value in range(128):
+        char: str = chr(value)
+        table[value] = (LOWER if char.islower() else UPPER if char.isupper()
+                        else DIGIT if char.isdigit() else SPECIAL)
+    return table
+
+
+def walk_table() -> np.ndarray:
+    """
+    Whether two bytes are neighbouring keys of a QWERTY keyboard
+
+    :return: 256 x 256 booleans
+    :rtype: np.ndarray
+    """
+    keys: dict[int, tuple[int, int]] = {}
+    for row, layers in enumerate(KEYBOARD):
+        for layer in layers:
+            for column, char in enumerate(layer):
+                keys[ord(char)] = (row, column)
+    table: np.ndarray = np.zeros((256, 256), dtype=bool)
+    for first, (row, column) in keys.items():
+        for second, (other_row, other_column) in keys.items():
+            # Rows are staggered, a key touches the one above it and the
+            # one above to the right
+            shift: int = column - other_column
+            table[first, second] = (
+                (row == other_row and abs(shift) == 1)
+                or (other_row == row - 1 and shift in (0, -1))
+                or (other_row == row + 1 and shift in (0, 1))
+            )
+    return table
+
+
+CLASS_OF: np.ndarray = class_table()
+WALKS: np.ndarray = walk_table()
+# Pool size of every combination of class bits
+POOLS: np.ndarray = np.array([
+    sum(size for bit, size in POOL_SIZES.items() if bits & bit)
+    for bits in range(32)
+])
+LOG_POOLS: np.ndarray = np.log2(np.maximum(POOLS, 1))
+LOWERCASE: np.ndarray = np.arange(256, dtype=np.uint8)
+LOWERCASE[ord("A"):ord("Z") + 1] += 32
+
+
+def to_matrix(block: bytes) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Newline terminated passwords as a zero padded byte matrix
+
+    :param block: passwords, one per line, the last one ending with a newline
+    :type block: bytes
+    :return: one row per password and the full length of each
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    data: np.ndarray = np.frombuffer(block, dtype=np.uint8)
+    ends: np.ndarray = np.flatnonzero(data == ord("\n"))
+    starts: np.ndarray = np.concatenate(([0], ends[:-1] + 1))
+    lengths: np.ndarray = ends - starts
+    width: int = min(int(lengths.max(initial=0)), MAX_WIDTH)
+    columns: np.ndarray = np.arange(width)
+    inside: np.ndarray = columns < lengths[:, None]
+    # Padding points at the newline, which `inside` then blanks
+    positions: np.ndarray = np.where(inside, starts[:, None] + columns,
+                                     ends[:, None])
+    chars: np.ndarray = np.where(inside, data[positions], 0).astype(np.uint8)
+
+    return chars, lengths
+
+
+def hash_rows(chars: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    FNV-1a hashes of the lowercased rows of a byte matrix
+
+    :param chars: zero padded passwords, as from `to_matrix()`
+    :type chars: np.ndarray
+    :param lengths: full length of each password
+    :type lengths: np.ndarray
+    :return: one 64 bit hash per row
+    :rtype: np.ndarray
+    """
+    lowered: np.ndarray = LOWERCASE[chars]
+    hashes: np.ndarray = np.full(len(chars), FNV_OFFSET, dtype=np.uint64)
+    for column in range(chars.shape[1]):
+        mixed: np.ndarray = (hashes ^ lowered[:, column]) * FNV_PRIME
+        hashes = np.where(column < lengths, mixed, hashes)
+    return hashes
+
+
+def read_blocks(source: BinaryIO, size: int = BLOCK) -> Iterator[bytes]:
+    """
+    Reads a file in blocks ending on a line boundary
+
+    :param source: binary file of newline separated lines
+    :type source: BinaryIO
+    :param size: bytes read at a time
+    :type size: int
+    :return: generator of newline terminated blocks
+    :rtype: Iterator[bytes]
+    """
+    rest: bytes = b""
+    while data := source.read(size):
+        data = rest + data
+        cut: int = data.rfind(b"\n") + 1
+        rest = data[cut:]
+        if cut:
+            yield data[:cut]
+    if rest:
+        yield rest + b"\n"
+
+
+class CommonPasswords:
+    """
+    Set of common passwords, stored as sorted 64 bit hashes
+
+    Case is ignored and a false match has odds of about one in 2**64 per
+    listed password, for 8 bytes per entry.
+    """
+
+    def __init__(self, hashes: np.ndarray) -> None:
+        self.hashes: np.ndarray = np.unique(hashes)
+
+    @classmethod
+    def from_lines(cls, block: bytes) -> "CommonPasswords":
+        """
+        Builds the set from newline terminated passwords
+
+        :param block: passwords, one per line
+        :type block: bytes
+        :return: set holding them
+        :rtype: CommonPasswords
+        """
+        return cls(hash_rows(*to_matrix(block)))
+
+    @classmethod
+    def from_file(cls, path: str) -> "CommonPasswords":
+        """
+        Builds the set from a password list, one per line
+
+        :param path: path of the list, e.g. a leaked password dump
+        :type path: str
+        :return: set holding its passwords
+        :rtype: CommonPasswords
+        """
+        with open(path, "rb") as source:
+            return cls(np.concatenate(
+                [hash_rows(*to_matrix(block.replace(b"\r", b"")))
+                 for block in read_blocks(source)]
+                or [np.empty(0, dtype=np.uint64)]
+            ))
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Which hashes belong to the set
+
+        :param hashes: hashes from `hash_rows()`
+        :type hashes: np.ndarray
+        :return: one boolean per hash
+        :rtype: np.ndarray
+        """
+        if not len(self.hashes):
+            return np.zeros(len(hashes), dtype=bool)
+        found: np.ndarray = np.searchsorted(self.hashes, hashes)
+        found[found == len(self.hashes)] = 0
+        return self.hashes[found] == hashes
+
+
+DEFAULT_COMMON: CommonPasswords = CommonPasswords.from_lines(
+    "".join(f"{password}\n" for password in COMMON).encode()
+)
+
+
+def in_runs(pairs: np.ndarray) -> np.ndarray:
+    """
+    Flagged pairs of neighbouring characters that belong to a run of three
+    characters or more
+
+    :param pairs: one boolean per pair of neighbouring characters
+    :type pairs: np.ndarray
+    :return: one boolean per pair, True if in a run
+    :rtype: np.ndarray
+    """
+    before: np.ndarray = np.zeros_like(pairs)
+    before[:, 1:] = pairs[:, :-1]
+    after: np.ndarray = np.zeros_like(pairs)
+    after[:, :-1] = pairs[:, 1:]
+    return pairs & (before | after)
+
+
+def repeated_units(chars: np.ndarray, period: int) -> np.ndarray:
+    """
+    Characters repeating the one `period` bytes before them, where a whole
+    unit of `period` bytes is repeated at least once
+
+    :param chars: zero padded passwords, as from `to_matrix()`
+    :type chars: np.ndarray
+    :param period: length of the unit in bytes
+    :type period: int
+    :return: one boolean per character, True if repeated
+    :rtype: np.ndarray
+    """
+    repeated: np.ndarray = np.zeros(chars.shape, dtype=bool)
+    count: int = chars.shape[1] - period
+    if count < period:
+        return repeated
+    # `same[:, j]` compares character `j + period` with character `j`
+    same: np.ndarray = ((chars[:, period:] == chars[:, :-period])
+                        & (chars[:, period:] != 0))
+    # Only rows with a whole unit's worth of matches can repeat one
+    rows: np.ndarray = np.flatnonzero(
+        np.count_nonzero(same, axis=1) >= period
+    )
+    if not len(rows):
+        return repeated
+    same = same[rows]
+    totals: np.ndarray = np.zeros((len(rows), count + 1), dtype=np.int8)
+    totals[:, 1:] = same.cumsum(axis=1, dtype=np.int8)
+    # Windows of `period` matches in a row, by the column they start at
+    whole: np.ndarray = np.zeros((len(rows), count + 1), dtype=np.int8)
+    whole[:, 1:count - period + 2] = (
+        totals[:, period:] - totals[:, :count - period + 1] == period
+    ).cumsum(axis=1, dtype=np.int8)
+    whole[:, count - period + 2:] = whole[:, count - period + 1:
+                                          count - period + 2]
+    # A match belongs to a whole unit if a window starts at most `period - 1`
+    # columns before it
+    earliest: np.ndarray = np.maximum(np.arange(count) - period + 1, 0)
+    repeated[rows, period:] = whole[:, 1:] - whole[:, earliest] > 0
+    return repeated
+
+
+def score_matrix(chars: np.ndarray, lengths: np.ndarray,
+                 common: CommonPasswords = DEFAULT_COMMON
+                 ) -> dict[str, np.ndarray]:
+    """
+    Scores passwords laid out as a byte matrix
+
+    :param chars: zero padded passwords, as from `to_matrix()`
+    :type chars: np.ndarray
+    :param lengths: full length of each password
+    :type lengths: np.ndarray
+    :param common: passwords scoring 0 whatever their entropy
+    :type common: CommonPasswords
+    :return: 'bits' of charset entropy, 'effective' bits once patterns are
+             removed, characters in 'sequence', 'repeat' and 'walk' runs
+             and in repeated 'units', 'common' and a 'score' from 0 to 4,
+             one value per password
+    :rtype: dict[str, np.ndarray]
+    """
+    bits: np.ndarray = np.bitwise_or.reduce(CLASS_OF[chars]
+                                            * (chars != 0), axis=1)
+    per_char: np.ndarray = LOG_POOLS[bits]
+    # UTF-8 continuation bytes add no character
+    continuation: np.ndarray = (chars & 0xC0) == 0x80
+    seen: np.ndarray = np.maximum(np.minimum(lengths, chars.shape[1]), 1)
+    # Bytes past the ones checked count like the ones checked
+    scale: np.ndarray = lengths / seen
+    characters: np.ndarray = (seen - np.count_nonzero(continuation, axis=1)
+                              ) * scale
+    entropy: np.ndarray = characters * per_char
+
+    first: np.ndarray = chars[:, :-1]
+    second: np.ndarray = chars[:, 1:]
+    real: np.ndarray = second != 0
+    steps: np.ndarray = second.astype(np.int16) - first
+    same_class: np.ndarray = CLASS_OF[first] == CLASS_OF[second]
+    sequence: np.ndarray = in_runs(real & same_class & (np.abs(steps) == 1))
+    repeat: np.ndarray = in_runs(real & (steps == 0))
+    walk: np.ndarray = in_runs(real & WALKS[first, second])
+    units: np.ndarray = np.zeros(chars.shape, dtype=bool)
+    for period in range(2, MAX_PERIOD + 1):
+        units |= repeated_units(chars, period)
+    # Every character of a run after its first is predictable, as is every
+    # character of a repeated unit
+    predictable: np.ndarray = units.copy()
+    predictable[:, 1:] |= sequence | repeat | walk
+    patterned: np.ndarray = np.count_nonzero(predictable & ~continuation,
+                                             axis=1) * scale
+    effective: np.ndarray = entropy - patterned * per_char
+
+    found: np.ndarray = common.contains(hash_rows(chars, lengths))
+    effective[found] = 0.0
+    score: np.ndarray = np.searchsorted(np.array(THRESHOLDS), effective,
+                                        side="right")
+
+    return {
+        "bits": entropy,
+        "effective": effective,
+        "sequence": sequence.sum(axis=1),
+        "repeat": repeat.sum(axis=1),
+        "walk": walk.sum(axis=1),
+        "units": np.count_nonzero(units & ~continuation, axis=1),
+        "common": found,
+        "score": score,
+    }
+
+
+def score(passwords: list[str],
+          common: CommonPasswords = DEFAULT_COMMON) -> dict[str, np.ndarray]:
+    """
+    Scores a batch of passwords, see `score_matrix()`
+
+    :param passwords: passwords without newlines
+    :type passwords: list[str]
+    :param common: passwords scoring 0 whatever their entropy
+    :type common: CommonPasswords
+    :return: one array per measure, one value per password
+    :rtype: dict[str, np.ndarray]
+    """
+    block: bytes = "".join(f"{password}\n" for password in passwords).encode()
+    return score_matrix(*to_matrix(block), common)
+
+
+def score_stream(source: BinaryIO, out: BinaryIO,
+                 common: CommonPasswords = DEFAULT_COMMON,
+                 size: int = BLOCK) -> np.ndarray:
+    """
+    Scores a file of passwords a block at a time, writing one score per line
+
+    :param source: binary file, one password per line
+    :type source: BinaryIO
+    :param out: binary file receiving the scores, in the same order
+    :type out: BinaryIO
+    :param common: passwords scoring 0 whatever their entropy
+    :type common: CommonPasswords
+    :param size: bytes read at a time
+    :type size: int
+    :return: passwords seen with each score, 0 to 4
+    :rtype: np.ndarray
+    """
+    totals: np.ndarray = np.zeros(len(THRESHOLDS) + 1, dtype=np.int64)
+    digits: np.ndarray = np.frombuffer(b"01234", dtype=np.uint8)
+    for block in read_blocks(source, size):
+        chars, lengths = to_matrix(block.replace(b"\r", b""))
+        scores: np.ndarray = score_matrix(chars, lengths, common)["score"]
+        lines: np.ndarray = np.full((len(scores), 2), ord("\n"),
+                                    dtype=np.uint8)
+        lines[:, 0] = digits[scores]
+        out.write(lines.tobytes())
+        totals += np.bincount(scores, minlength=len(totals))
+    return totals
+
+
+def vault_lines(keys_file: str = KEYS_FILE,
+                db: str = VAULT_DB) -> Iterator[bytes]:
+    """
+    Entries of the vault in use, as keys.txt lines
+
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param db: path of the SQLite vault, used instead of keys.txt if found
+    :type db: str
+    :return: generator of `account|token` lines, none if there's no vault
+    :rtype: Iterator[bytes]
+    """
+    if exists(db):
+        with SQLiteVault(db) as vault:
+            yield from vault.lines()
+    elif exists(keys_file):
+        with open(keys_file, "rb") as keys:
+            yield from keys
+
+
+def audit_vault(fer: Fernet, keys_file: str = KEYS_FILE,
+                common: CommonPasswords = DEFAULT_COMMON,
+                db: str = VAULT_DB) -> list[tuple[str, int]]:
+    """
+    Scores every password of the vault in use
+
+    :param fer: Fernet wrapper from main key
+    :type fer: Fernet
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param common: passwords scoring 0 whatever their entropy
+    :type common: CommonPasswords
+    :param db: path of the SQLite vault, used instead of keys.txt if found
+    :type db: str
+    :return: account and score of every entry, weakest first
+    :rtype: list[tuple[str, int]]
+    """
+    accounts: list[str] = []
+    passwords: list[str] = []
+    for line in vault_lines(keys_file, db):
+        usr, _, pwd = line.rstrip().partition(b"|")
+        if usr:
+            accounts.append(usr.decode())
+            passwords.append(fer.decrypt(pwd).decode())
+    scores: np.ndarray = score(passwords, common)["score"]
+    return sorted(zip(accounts, scores.tolist()), key=lambda pair: pair[1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Score password strength, one password per line"
+    )
+    parser.add_argument("input", nargs="?",
+                        help="file of passwords, standard input if omitted")
+    parser.add_argument("-o", "--output",
+                        help="file receiving one score per line, standard "
+                             "output if omitted")
+    parser.add_argument("-c", "--common",
+                        help="list of common passwords, one per line")
+    parser.add_argument("--vault", action="store_true",
+                        help="audit the passwords of the vault instead")
+    parser.add_argument("--key-file", default="key.key")
+    args = parser.parse_args()
+
+    start: float = perf_counter()
+    common: CommonPasswords = (CommonPasswords.from_file(args.common)
+                               if args.common else DEFAULT_COMMON)
+    print(f"{len(common):,} common passwords loaded in "
+          f"{perf_counter() - start:.2f} s", file=sys.stderr)
+
+    if args.vault:
+        # Imported here so this module stays free of the interactive script
+        from password_manager import unlock
+
+        key: bytes | None = unlock(getpass("Enter MPass: "), args.key_file)
+        if key is None:
+            print("Invalid MPass")
+            return
+        audit: list[tuple[str, int]] = audit_vault(Fernet(key),
+                                                   common=common)
+        if not audit:
+            print("No entries currently found in file. Add some first.")
+        for account, value in audit:
+            print(f"{value} {account}")
+        return
+
+    source: BinaryIO = (open(args.input, "rb") if args.input
+                        else sys.stdin.buffer)
+    out: BinaryIO = (open(args.output, "wb") if args.output
+                     else sys.stdout.buffer)
+    start = perf_counter()
+    try:
+        totals: np.ndarray = score_stream(source, out, common)
+    finally:
+        if args.input:
+            source.close()
+        if args.output:
+            out.close()
+        else:
+            out.flush()
+    elapsed: float = perf_counter() - start
+    total: int = int(totals.sum())
+    print(f"{total:,} passwords in {elapsed:.2f} s "
+          f"({total / max(elapsed, 1e-9):,.0f} passwords/s)", file=sys.stderr)
+    for value, count in enumerate(totals.tolist()):
+        print(f"score {value}: {count:,}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+"""Statistical uniformity checks of the password generators.
+
+Every engine is sampled and its output tested, with chi-square statistics
+over numpy histograms, against the distribution its construction promises:
+
+- per position: how often each character appears at each position;
+- per class: how often each class appears, and each character within it;
+- bigrams: how often each pair of characters appears side by side.
+
+`bulk_passwords()` draws each character uniformly from the alphabet and
+`Policy` draws uniformly among the passwords meeting it. Expected pair
+frequencies follow from how many characters of each class a password holds,
+as positions are shuffled rather than drawn independently.
+
+`pass_gen()` is checked twice. Against the uniform alphabet it is a known
+bias: it draws the same number of characters from every class, so a third
+of its output is digits, and it rounds the length up to a whole round of
+classes. That bias is reported on every run and fails it with `--strict`.
+Against its own construction it must pass, which catches a broken shuffle.
+
+A chi-square statistic is turned into a z-score with the Wilson-Hilferty
+approximation and the run fails when any z-score passes the limit. A control
+engine with a known modulo bias must be caught, proving the samples are
+enough to catch a bias of that size.
+"""
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from math import ceil, sqrt
+from string import ascii_letters, digits, punctuation
+from time import perf_counter
+from typing import Callable
+
+import numpy as np
+
+from password_bulk import bulk_passwords, make_alphabet
+from password_generator import pass_gen
+from password_policy import AMBIGUOUS, Policy
+
+# z-score above which a statistic counts as bias, about one in 3.5 million
+# by chance
+Z_LIMIT: float = 5.0
+# Passwords generated per task
+CHUNK: int = 5_000
+# What a check expects: no bias, the control's bias, or a bias already known
+UNIFORM, CONTROL, KNOWN = "uniform", "control", "known"
+
+
+class Model:
+    """
+    Expected distribution of a generator: the share of each class at any
+    position and side by side, characters being uniform within their class
+    """
+
+    def __init__(self, classes: list[str], shares: np.ndarray,
+                 pairs: np.ndarray, length: int,
+                 fixed: bool = False) -> None:
+        self.classes: list[str] = classes
+        self.alphabet: np.ndarray = np.frombuffer(
+            "".join(classes).encode("ascii"), dtype=np.uint8
+        )
+        self.sizes: np.ndarray = np.array([len(chars) for chars in classes])
+        # Class index of every character of the alphabet
+        self.class_of: np.ndarray = np.repeat(np.arange(len(classes)),
+                                              self.sizes)
+        self.shares: np.ndarray = shares
+        self.pairs: np.ndarray = pairs
+        self.length: int = length
+        # Every password holds the same count of each class
+        self.fixed: bool = fixed
+
+    def chars(self) -> np.ndarray:
+        """
+        Probability of every character of the alphabet at a position
+
+        :return: one probability per character, in alphabet order
+        :rtype: np.ndarray
+        """
+        return (self.shares / self.sizes)[self.class_of]
+
+    def bigrams(self) -> np.ndarray:
+        """
+        Probability of every pair of characters at two neighbouring
+        positions
+
+        :return: alphabet x alphabet probabilities
+        :rtype: np.ndarray
+        """
+        per_pair: np.ndarray = self.pairs / np.outer(self.sizes, self.sizes)
+        return per_pair[np.ix_(self.class_of, self.class_of)]
+
+
+def uniform_model(alphabet: str, length: int) -> Model:
+    """
+    Every character drawn independently and uniformly from the alphabet
+
+    :param alphabet: characters drawn from
+    :type alphabet: str
+    :param length: characters per password
+    :type length: int
+    :return: expected distribution
+    :rtype: Model
+    """
+    shares: np.ndarray = np.array([1.0])
+    return Model([alphabet], shares, np.outer(shares, shares), length)
+
+
+def shuffled_model(classes: list[str], counts: np.ndarray,
+                   products: np.ndarray, fixed: bool = False) -> Model:
+    """
+    Classes given counts, then positions shuffled
+
+    :param classes: characters of each class
+    :type classes: list[str]
+    :param counts: expected characters of each class per password
+    :type counts: np.ndarray
+    :param products: expected product of the counts of every two classes
+    :type products: np.ndarray
+    :param fixed: whether the counts are the same in every password
+    :type fixed: bool
+    :return: expected distribution
+    :rtype: Model
+    """
+    length: int = int(round(counts.sum()))
+    # Two distinct positions of the same class can't hold the same slot
+    pairs: np.ndarray = ((products - np.diag(counts))
+                         / (length * (length - 1)))
+    return Model(classes, counts / length, pairs, length, fixed)
+
+
+def pass_gen_model(length: int, numbers: bool = True,
+                   special: bool = True) -> Model:
+    """
+    Distribution `pass_gen()` promises: as many characters from every class,
+    rounded up to a whole round of classes
+
+    :param length: length asked for
+    :type length: int
+    :param numbers: whether numbers are asked for
+    :type numbers: bool
+    :param special: whether special characters are asked for
+    :type special: bool
+    :return: expected distribution
+    :rtype: Model
+    """
+    classes: list[str] = ([ascii_letters] + ([digits] if numbers else [])
+                          + ([punctuation] if special else []))
+    rounds: int = ceil(length / len(classes))
+    counts: np.ndarray = np.full(len(classes), float(rounds))
+    return shuffled_model(classes, counts, np.outer(counts, counts), True)
+
+
+def policy_model(policy: Policy) -> Model:
+    """
+    Distribution a `Policy` promises, from every split of its length between
+    classes and the odds of each
+
+    :param policy: policy sampled
+    :type policy: Policy
+    :return: expected distribution
+    :rtype: Model
+    """
+    counts: np.ndarray = np.zeros(len(policy.names))
+    products: np.ndarray = np.zeros((len(policy.names), len(policy.names)))
+
+    def walk(i: int, left: int, odds: float, split: list[int]) -> None:
+        if i == len(policy.names):
+            vector: np.ndarray = np.array(split, dtype=float)
+            counts[:] += odds * vector
+            products[:] += odds * np.outer(vector, vector)
+            return
+        weights: np.ndarray = np.exp(policy.weights(i, left,
+                                                    policy.ways[i + 1])
+                                     - policy.ways[i][left])
+        for offset, weight in enumerate(weights.tolist()):
+            if weight > 0:
+                count: int = policy.lows[i] + offset
+                walk(i + 1, left - count, odds * weight, split + [count])
+
+    walk(0, policy.length, 1.0, [])
+    return shuffled_model([policy.classes[name] for name in policy.names],
+                          counts, products)
+
+
+def modulo_passwords(count: int, length: int) -> list[str]:
+    """
+    Control engine, reducing random bytes modulo the alphabet size without
+    rejecting any: the first 256 % 94 characters come up 3/2 as often
+
+    :param count: passwords wanted
+    :type count: int
+    :param length: characters per password
+    :type length: int
+    :return: biased passwords
+    :rtype: list[str]
+    """
+    table: np.ndarray = np.frombuffer(make_alphabet().encode(),
+                                      dtype=np.uint8)
+    indices: np.ndarray = np.frombuffer(os.urandom(count * length),
+                                        dtype=np.uint8) % len(table)
+    text: str = table[indices].tobytes().decode("ascii")
+    return [text[i:i + length] for i in range(0, len(text), length)]
+
+
+def sample_chunk(engine: str, count: int) -> bytes:
+    """
+    Generates passwords with one of the `ENGINES`, joined together
+
+    :param engine: name of the engine
+    :type engine: str
+    :param count: passwords wanted
+    :type count: int
+    :return: passwords without separators, all of the same length
+    :rtype: bytes
+    """
+    return "".join(ENGINES[engine][0](count)).encode("ascii")
+
+
+def sample(engine: str, count: int, length: int,
+           workers: int | None = None) -> np.ndarray:
+    """
+    Generates passwords in parallel, in chunks of `CHUNK`
+
+    :param engine: name of the engine
+    :type engine: str
+    :param count: passwords wanted
+    :type count: int
+    :param length: characters per password the engine produces
+    :type length: int
+    :param workers: processes, one per CPU by default
+    :type workers: int | None
+    :return: one row of bytes per password
+    :rtype: np.ndarray
+    """
+    workers = workers or os.cpu_count() or 1
+    blocks: list[bytes] = []
+    with ProcessPoolExecutor(workers) as pool:
+        pending: deque[Future] = deque()
+        for start in range(0, count, CHUNK):
+            pending.append(pool.submit(sample_chunk, engine,
+                                       min(CHUNK, count - start)))
+            if len(pending) > 2 * workers:
+                blocks.append(pending.popleft().result())
+        blocks.extend(future.result() for future in pending)
+    return np.frombuffer(b"".join(blocks), dtype=np.uint8).reshape(-1, length)
+
+
+def chi_square(observed: np.ndarray, expected: np.ndarray) -> tuple[float,
+                                                                    int]:
+    """
+    Pearson's chi-square statistic of observed counts
+
+    :param observed: counts of every cell
+    :type observed: np.ndarray
+    :param expected: expected counts of the same cells
+    :type expected: np.ndarray
+    :return: statistic and degrees of freedom, infinite if a cell expected
+             empty isn't
+    :rtype: tuple[float, int]
+    """
+    possible: np.ndarray = expected > 0
+    if observed[~possible].any():
+        return float("inf"), 1
+    stat: float = float((((observed - expected) ** 2)[possible]
+                         / expected[possible]).sum())
+    return stat, max(int(possible.sum()) - 1, 1)
+
+
+def z_score(stat: float, freedom: int) -> float:
+    """
+    Chi-square statistic as a standard normal z-score (Wilson-Hilferty)
+
+    :param stat: chi-square statistic
+    :type stat: float
+    :param freedom: degrees of freedom
+    :type freedom: int
+    :return: z-score, large when the counts are too far from expected
+    :rtype: float
+    """
+    spread: float = 2 / (9 * freedom)
+    return ((stat / freedom) ** (1 / 3) - (1 - spread)) / sqrt(spread)
+
+
+def check(model: Model, chars: np.ndarray) -> list[tuple[str, float, int,
+                                                         float]]:
+    """
+    Chi-square tests of sampled passwords against a model
+
+    :param model: expected distribution
+    :type model: Model
+    :param chars: one row of bytes per password
+    :type chars: np.ndarray
+    :return: name, statistic, degrees of freedom and z-score of each test
+    :rtype: list[tuple[str, float, int, float]]
+    """
+    count, length = chars.shape
+    results: list[tuple[str, float, int, float]] = []
+    if length != model.length:
+        # The characters are still tested, at the positions there are
+        results.append((f"length {length} instead of {model.length}",
+                        float("inf"), 1, float("inf")))
+    # Index of every byte in the alphabet, anything else past its end
+    index: np.ndarray = np.full(256, len(model.alphabet), dtype=np.int64)
+    index[model.alphabet] = np.arange(len(model.alphabet))
+    cells: int = len(model.alphabet) + 1
+    codes: np.ndarray = index[chars]
+    probabilities: np.ndarray = np.append(model.chars(), 0.0)
+
+    def record(name: str, observed: np.ndarray,
+               expected: np.ndarray) -> None:
+        stat, freedom = chi_square(observed, expected)
+        results.append((name, stat, freedom, z_score(stat, freedom)))
+
+    positions: np.ndarray = np.bincount(
+        (codes + np.arange(length) * cells).ravel(), minlength=length * cells
+    ).reshape(length, cells)
+    for position in range(length):
+        record(f"position {position}", positions[position],
+               probabilities * count)
+
+    totals: np.ndarray = positions.sum(axis=0)
+    foreign: int = int(totals[-1])
+    class_totals: np.ndarray = np.bincount(model.class_of,
+                                           weights=totals[:-1],
+                                           minlength=len(model.classes))
+    # Shares can't vary with a single class or counts fixed by construction
+    if len(model.classes) > 1 and not model.fixed:
+        record("class shares", np.append(class_totals, foreign),
+               np.append(model.shares, 0.0) * count * length)
+    for number, chars_of in enumerate(model.classes):
+        members: np.ndarray = model.class_of == number
+        record(f"within {chars_of[:6]}...", totals[:-1][members],
+               np.full(members.sum(), class_totals[number] / members.sum()))
+
+    pairs: np.ndarray = np.bincount(
+        (codes[:, :-1] * cells + codes[:, 1:]).ravel(),
+        minlength=cells * cells
+    ).reshape(cells, cells)
+    expected: np.ndarray = np.zeros((cells, cells))
+    expected[:-1, :-1] = model.bigrams() * count * (length - 1)
+    record("bigrams", pairs.ravel(), expected.ravel())
+
+    return results
+
+
+POLICY: Policy = Policy(12, {"digits": 2, "special": 1}, {"upper": 3},
+                        exclude=AMBIGUOUS)
+# Engine name: generator of `count` passwords, characters per password,
+# default sample size and the models it is checked against, each with what
+# the check expects
+ENGINES: dict[str, tuple[Callable[[int], list[str]], int, int,
+                         list[tuple[str, Model, str]]]] = {
+    "pass_gen": (lambda count: [pass_gen(16) for _ in range(count)],
+                 pass_gen_model(16).length, 100_000,
+                 [("alphabet", uniform_model(make_alphabet(), 16), KNOWN),
+                  ("construction", pass_gen_model(16), UNIFORM)]),
+    "bulk": (lambda count: bulk_passwords(count, 16), 16, 2_000_000,
+             [("alphabet", uniform_model(make_alphabet(), 16), UNIFORM)]),
+    "policy": (POLICY.generate_many, POLICY.length, 100_000,
+               [("policy", policy_model(POLICY), UNIFORM)]),
+    "control": (lambda count: modulo_passwords(count, 16), 16, 50_000,
+                [("alphabet", uniform_model(make_alphabet(), 16), CONTROL)]),
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Check the password generators for statistical bias"
+    )
+    parser.add_argument("engines", nargs="*", default=list(ENGINES),
+                        metavar="ENGINE",
+                        help=f"any of {', '.join(ENGINES)}, all by default")
+    parser.add_argument("-s", "--scale", type=float, default=1.0,
+                        help="multiplies every sample size")
+    parser.add_argument("-z", "--limit", type=float, default=Z_LIMIT,
+                        help="z-score counting as bias")
+    parser.add_argument("--strict", action="store_true",
+                        help="fail on known biases too")
+    parser.add_argument("-w", "--workers", type=int)
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="print every test, not only the worst")
+    args = parser.parse_args()
+    for engine in set(args.engines) - set(ENGINES):
+        parser.error(f"unknown engine {engine!r}")
+
+    failed: list[str] = []
+    known: list[str] = []
+    checks: int = 0
+    start: float = perf_counter()
+    for engine in args.engines:
+        _, length, size, models = ENGINES[engine]
+        begin: float = perf_counter()
+        chars: np.ndarray = sample(engine, max(int(size * args.scale), 1),
+                                   length, args.workers)
+        print(f"{engine}: {chars.size:,} characters in "
+              f"{perf_counter() - begin:.1f} s")
+        for label, model, expected in models:
+            checks += 1
+            results = check(model, chars)
+            # A length mismatch is infinite, the worst character test still
+            # tells how far off the characters are
+            broken: list[str] = [test[0] for test in results
+                                 if test[3] == float("inf")]
+            worst: tuple[str, float, int, float] = max(
+                [test for test in results if test[3] != float("inf")]
+                or results, key=lambda test: test[3]
+            )
+            detected: bool = bool(broken) or worst[3] > args.limit
+            if expected == UNIFORM:
+                status: str = "FAIL" if detected else "ok"
+            elif expected == CONTROL:
+                status = "ok" if detected else "FAIL, bias missed"
+            elif detected:
+                status = "FAIL, known bias" if args.strict else "known bias"
+                known.append(f"{engine} vs {label}")
+            else:
+                status = "ok, known bias gone"
+            print(f"  vs {label}: worst {worst[0]} z={worst[3]:.2f}"
+                  + "".join(f", {name}" for name in broken)
+                  + f" ({'biased' if detected else 'uniform'}) {status}")
+            if args.verbose:
+                for name, stat, freedom, z in results:
+                    print(f"    {name}: chi2={stat:.1f} df={freedom} "
+                          f"z={z:.2f}")
+            if status.startswith("FAIL"):
+                failed.append(f"{engine} vs {label}")
+
+    print(f"{checks - len(failed)}/{checks} checks ok in "
+          f"{perf_counter() - start:.1f} s")
+    if known:
+        print(f"Known bias: {', '.join(known)}")
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
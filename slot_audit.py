@@ -0,0 +1,271 @@
+"""Append-only binary audit log of every spin and its memory-mapped reader.
+
+The log starts with a header describing the reel geometry, followed by one
+fixed-width little-endian record per spin:
+
+    reels      REELS * ROWS bytes of symbol ids, as `predefined_symbols`
+    lines      u8, lines bet in
+    bet        u32, bet per line
+    earnings   u64, earnings of the spin
+    winning    u64, bit n set when line n won
+
+Records are gathered in memory and appended in large writes. The reader maps
+the file as a NumPy structured array, so aggregates never parse a record in
+Python.
+"""
+import argparse
+import os
+import struct
+
+import numpy as np
+
+from slot_machine import REELS, ROWS, SYMBOLS, Spin
+
+MAGIC: bytes = b"SLOTLOG\x01"
+# Magic, reels and rows, padded to 16 bytes
+HEADER: struct.Struct = struct.Struct("<8sHH4x")
+# Pending bytes that trigger a write
+BUFFER_SIZE: int = 1 << 16
+
+
+def record_format(reels: int, rows: int) -> struct.Struct:
+    """
+    Layout of a single spin record
+
+    :param reels: constant value of total reels
+    :type reels: int
+    :param rows: constant value of total rows
+    :type rows: int
+    :return: packer of a record
+    :rtype: struct.Struct
+    """
+    return struct.Struct(f"<{reels * rows}sBIQQ")
+
+
+def record_dtype(reels: int, rows: int) -> np.dtype:
+    """
+    Same layout as `record_format()`, as a NumPy structured type
+
+    :param reels: constant value of total reels
+    :type reels: int
+    :param rows: constant value of total rows
+    :type rows: int
+    :return: dtype of a record
+    :rtype: np.dtype
+    """
+    return np.dtype([("reels", np.uint8, (reels * rows,)),
+                     ("lines", np.uint8), ("bet", "<u4"),
+                     ("earnings", "<u8"), ("winning", "<u8")])
+
+
+class AuditLog:
+    """
+    Buffered appender of spins, given as `audit` to a `SlotSession`
+    """
+
+    def __init__(self, path: str, reels: int = REELS, rows: int = ROWS,
+                 fsync: bool = False) -> None:
+        self.path: str = path
+        self.fsync: bool = fsync
+        self.packer: struct.Struct = record_format(reels, rows)
+        self.pending: bytearray = bytearray()
+        header: bytes = HEADER.pack(MAGIC, reels, rows)
+        handle: int = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.file = open(handle, "r+b")
+        existing: bytes = self.file.read(HEADER.size)
+        # A header cut short by a crash while creating the log is rewritten
+        if len(existing) < HEADER.size and header.startswith(existing):
+            self.file.seek(0)
+            self.file.truncate()
+            self.file.write(header)
+        elif existing != header:
+            self.file.close()
+            raise ValueError(f"'{path}' is not a {reels}x{rows} spin log")
+        else:
+            # Drops a record cut short by a crash, so the next ones line up
+            size: int = self.file.seek(0, os.SEEK_END) - HEADER.size
+            self.file.truncate(HEADER.size + size - size % self.packer.size)
+            self.file.seek(0, os.SEEK_END)
+
+    def __enter__(self) -> "AuditLog":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, spins: list[Spin]) -> None:
+        """
+        Queues spins, appending them to the file once the buffer fills up
+
+        :param spins: spins returned by `SlotSession.spin()`
+        :type spins: list[Spin]
+        :return: None
+        :rtype: NoneType
+        """
+        pack = self.packer.pack
+        for spin in spins:
+            winning: int = 0
+            for line in spin.winning_lines:
+                winning |= 1 << line
+            self.pending += pack(spin.reels, spin.lines, spin.bet,
+                                 spin.earnings, winning)
+        if len(self.pending) >= BUFFER_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Appends every queued spin to the file in a single write
+
+        :return: None
+        :rtype: NoneType
+        """
+        if self.pending:
+            self.file.write(self.pending)
+            self.pending.clear()
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        """
+        Flushes and closes the log
+
+        :return: None
+        :rtype: NoneType
+        """
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+def read_header(path: str) -> tuple[int, int]:
+    """
+    Reel geometry recorded in the header of a log
+
+    :param path: path of the log
+    :type path: str
+    :return: reels and rows
+    :rtype: tuple[int, int]
+    """
+    with open(path, "rb") as file:
+        header: bytes = file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"'{path}' is too short for a spin log header")
+    magic, reels, rows = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError(f"'{path}' is not a spin log")
+    return reels, rows
+
+
+def straight_paylines(reels: int = REELS,
+                      rows: int = ROWS) -> tuple[tuple[int, ...], ...]:
+    """
+    One payline per row, straight across the reels, as `slot_machine.PAYLINES`
+
+    :param reels: constant value of total reels
+    :type reels: int
+    :param rows: constant value of total rows
+    :type rows: int
+    :return: row of every reel along each payline
+    :rtype: tuple[tuple[int, ...], ...]
+    """
+    return tuple((row,) * reels for row in range(rows))
+
+
+def read_log(path: str) -> np.ndarray:
+    """
+    Maps the records of a log into memory without copying them
+
+    A record cut short at the end of the file, by a crash in the middle of
+    a write, is left out.
+
+    :param path: path of the log
+    :type path: str
+    :return: structured array of records, fields as in `record_dtype()`
+    :rtype: np.ndarray
+    """
+    reels, rows = read_header(path)
+    dtype: np.dtype = record_dtype(reels, rows)
+    count: int = (os.path.getsize(path) - HEADER.size) // dtype.itemsize
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+
+    return np.memmap(path, dtype=dtype, mode="r", offset=HEADER.size,
+                     shape=(count,))
+
+
+def summarize(records: np.ndarray, reels: int = REELS, rows: int = ROWS,
+              paylines: tuple[tuple[int, ...], ...] | None = None) -> dict:
+    """
+    RTP, hit frequency and how often every symbol won a line
+
+    The total bet of a spin is `lines * bet`, which `bet_or_cash` also pays
+    every winning line with, so earnings are compared against it.
+
+    :param records: returned value from `read_log()` function
+    :type records: np.ndarray
+    :param reels: reels of the log, from `read_header()`
+    :type reels: int
+    :param rows: rows of the log, from `read_header()`
+    :type rows: int
+    :param paylines: row of every reel along each payline, straight lines
+                     across the geometry of the log if None
+    :type paylines: tuple[tuple[int, ...], ...] | None
+    :return: aggregates of the log
+    :rtype: dict
+    """
+    if records.dtype["reels"].shape != (reels * rows,):
+        raise ValueError(f"Records are not from a {reels}x{rows} spin log")
+    if paylines is None:
+        paylines = straight_paylines(reels, rows)
+    for line in paylines:
+        if len(line) != reels or not all(0 <= row < rows for row in line):
+            raise ValueError(f"Payline {line} does not fit {reels}x{rows} "
+                             "reels")
+    spins: int = len(records)
+    wagered: int = int((records["bet"].astype(np.uint64)
+                        * records["lines"]).sum())
+    earned: int = int(records["earnings"].sum())
+    winning = records["winning"]
+    hits = np.zeros(len(SYMBOLS), dtype=np.int64)
+    for line, rows_in_line in enumerate(paylines):
+        won = (winning >> np.uint64(line)) & np.uint64(1)
+        # The first reel of a payline holds the symbol that won it, and its
+        # rows come first in a record
+        symbols = records["reels"][:, rows_in_line[0]]
+        hits += np.bincount(symbols, weights=won,
+                            minlength=len(SYMBOLS)).astype(np.int64)
+
+    return {
+        "spins": spins,
+        "wagered": wagered,
+        "earned": earned,
+        "rtp": earned / wagered if wagered else 0.0,
+        "hit_frequency": (float(np.count_nonzero(winning)) / spins
+                          if spins else 0.0),
+        "symbol_hit_rate": {name: int(count) / spins if spins else 0.0
+                            for name, count in zip(SYMBOLS, hits)},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log")
+    args = parser.parse_args()
+
+    try:
+        reels, rows = read_header(args.log)
+        stats: dict = summarize(read_log(args.log), reels, rows)
+    except ValueError as error:
+        parser.error(str(error))
+    print(f"Spins:         {stats['spins']:,}")
+    print(f"Wagered:       ${stats['wagered']:,}")
+    print(f"Earned:        ${stats['earned']:,}")
+    print(f"RTP:           {stats['rtp']:.4%}")
+    print(f"Hit frequency: {stats['hit_frequency']:.4%}")
+    for name, rate in stats["symbol_hit_rate"].items():
+        print(f"{name:>12}: {rate:.6%} of spins")
+
+
+if __name__ == "__main__":
+    main()
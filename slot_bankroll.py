@@ -0,0 +1,247 @@
+"""Bankroll simulation of whole `bet_or_cash` sessions over a process pool.
+
+Every session starts from a deposit, asks a betting policy for the lines and
+bet of each spin (or whether to cash out) and stops once funds can no longer
+cover the minimum bet. Sessions draw from their own random stream, derived
+from the seed and the session number, so the results do not depend on how
+many processes ran them.
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import Callable
+
+import numpy as np
+
+from slot_machine import (MAX_BET, MAX_LINES, MIN_BET, MIN_LINES, REELS,
+                          ROWS, SYMBOLS)
+from slot_simulator import draw_reels, payout_table, reel_table, score_draws
+
+# Spins drawn at once for a session, doubling on every refill since most
+# sessions are short
+FIRST_BLOCK: int = 32
+MAX_BLOCK: int = 4096
+# Sessions handed to a worker process per task
+BATCH: int = 2000
+
+# A policy gets the current funds and spins played so far, and returns the
+# lines and bet per line of the next spin or None to cash out
+Policy = Callable[[int, int], tuple[int, int] | None]
+
+
+class FlatBet:
+    """
+    Same lines and bet every spin, lowered when funds can't cover it, until
+    reaching a target or a maximum number of spins
+    """
+
+    def __init__(self, lines: int = MAX_LINES, bet: int = MIN_BET,
+                 target: int | None = None,
+                 max_spins: int | None = None) -> None:
+        if not MIN_LINES <= lines <= MAX_LINES:
+            raise ValueError(f"Lines must be between {MIN_LINES} and "
+                             f"{MAX_LINES}")
+        if not MIN_BET <= bet <= MAX_BET:
+            raise ValueError(f"Bet must be between ${MIN_BET} - ${MAX_BET}")
+        self.lines: int = lines
+        self.bet: int = bet
+        self.target: int | None = target
+        self.max_spins: int | None = max_spins
+
+    def __call__(self, funds: int, spins: int) -> tuple[int, int] | None:
+        if self.target is not None and funds >= self.target:
+            return None
+        if self.max_spins is not None and spins >= self.max_spins:
+            return None
+        lines: int = min(self.lines, funds // MIN_BET)
+        return lines, min(self.bet, funds // lines)
+
+
+class FractionBet(FlatBet):
+    """
+    Bets a fraction of the current funds spread over the lines, within the
+    `MIN_BET`/`MAX_BET` limits
+    """
+
+    def __init__(self, fraction: float, lines: int = MAX_LINES,
+                 target: int | None = None,
+                 max_spins: int | None = None) -> None:
+        super().__init__(lines, MAX_BET, target, max_spins)
+        self.fraction: float = fraction
+
+    def __call__(self, funds: int, spins: int) -> tuple[int, int] | None:
+        choice: tuple[int, int] | None = super().__call__(funds, spins)
+        if choice is None:
+            return None
+        lines, bet = choice
+        wanted: int = int(funds * self.fraction) // lines
+        return lines, max(MIN_BET, min(bet, wanted))
+
+
+def line_tables(symbols: dict = SYMBOLS, reels: int = REELS,
+                rows: int = ROWS) -> list[tuple]:
+    """
+    Payout lookup tables for every number of lines, sharing one reel table
+
+    :param symbols: associated symbol with its unicode representation, count
+                    and value
+    :type symbols: dict[str, dict]
+    :param reels: constant value of total reels
+    :type reels: int
+    :param rows: constant value of total rows
+    :type rows: int
+    :return: tables for `score_draws()`, indexed by lines minus one
+    :rtype: list[tuple]
+    """
+    table: np.ndarray = reel_table(symbols, rows)
+    return [(table, *payout_table(symbols, table, reels, lines))
+            for lines in range(MIN_LINES, MAX_LINES + 1)]
+
+
+def play_session(deposit: int, policy: Policy, rng: np.random.Generator,
+                 tables: list[tuple], reels: int = REELS) -> tuple[int, int]:
+    """
+    Plays a single session the way `bet_or_cash` would
+
+    :param deposit: initial funds of the session
+    :type deposit: int
+    :param policy: chooses the lines and bet of every spin
+    :type policy: Policy
+    :param rng: random stream of this session
+    :type rng: np.random.Generator
+    :param tables: returned value from `line_tables()` function
+    :type tables: list[tuple]
+    :param reels: constant value of total reels
+    :type reels: int
+    :return: final funds and number of spins played
+    :rtype: tuple[int, int]
+    """
+    funds: int = deposit
+    spins: int = 0
+    block: int = FIRST_BLOCK // 2
+    drawn: int = 0
+    payouts: list[list[int]] = []
+    while funds >= MIN_BET:
+        choice: tuple[int, int] | None = policy(funds, spins)
+        if choice is None:
+            break
+        lines, bet = choice
+        if (not MIN_LINES <= lines <= MAX_LINES
+                or not MIN_BET <= bet <= MAX_BET or lines * bet > funds):
+            raise ValueError(f"Policy chose an invalid bet of ${bet} in "
+                             f"{lines} lines with ${funds}")
+        if spins == drawn:
+            block = min(block * 2, MAX_BLOCK)
+            draws: np.ndarray = draw_reels(rng, block, tables[0][0], reels)
+            payouts = [score_draws(draws, line).tolist() for line in tables]
+            drawn += block
+        # Like `score_spin`, every winning line pays the total bet times
+        # its multiplier
+        total_bet: int = lines * bet
+        funds += total_bet * (payouts[lines - 1][spins + block - drawn] - 1)
+        spins += 1
+
+    return funds, spins
+
+
+def play_batch(seed: int, first: int, sessions: int, deposit: int,
+               policy: Policy) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Plays sessions `first` to `first + sessions - 1` of a simulation
+
+    :param seed: seed of the whole simulation
+    :type seed: int
+    :param first: number of the first session of the batch
+    :type first: int
+    :param sessions: sessions in the batch
+    :type sessions: int
+    :param deposit: initial funds of every session
+    :type deposit: int
+    :param policy: chooses the lines and bet of every spin
+    :type policy: Policy
+    :return: final funds and spins played of every session
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    tables: list[tuple] = line_tables()
+    funds = np.empty(sessions, dtype=np.int64)
+    spins = np.empty(sessions, dtype=np.int64)
+    for idx in range(sessions):
+        stream = np.random.SeedSequence(seed, spawn_key=(first + idx,))
+        rng = np.random.default_rng(stream)
+        funds[idx], spins[idx] = play_session(deposit, policy, rng, tables)
+
+    return funds, spins
+
+
+def simulate(sessions: int, deposit: int, policy: Policy, seed: int = 0,
+             workers: int | None = None) -> dict:
+    """
+    Distribution of final funds, session length and ruin probability
+
+    :param sessions: number of sessions to play
+    :type sessions: int
+    :param deposit: initial funds of every session
+    :type deposit: int
+    :param policy: chooses the lines and bet of every spin, must be picklable
+    :type policy: Policy
+    :param seed: seed of the simulation, same seed same results
+    :type seed: int
+    :param workers: processes to use, all the cores if None
+    :type workers: int | None
+    :return: final funds and spins per session, with summary statistics
+    :rtype: dict
+    """
+    starts: range = range(0, sessions, BATCH)
+    sizes: list[int] = [min(BATCH, sessions - first) for first in starts]
+    start: float = perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(play_batch, [seed] * len(sizes), starts,
+                                sizes, [deposit] * len(sizes),
+                                [policy] * len(sizes)))
+    elapsed: float = perf_counter() - start
+
+    funds = np.concatenate([result[0] for result in results])
+    spins = np.concatenate([result[1] for result in results])
+    return {
+        "final_funds": funds,
+        "spins": spins,
+        "ruin_probability": float(np.mean(funds < MIN_BET)),
+        "mean_final_funds": float(funds.mean()),
+        "mean_spins": float(spins.mean()),
+        "sessions_per_second": sessions / elapsed,
+        "spins_per_second": int(spins.sum()) / elapsed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--sessions", type=int, default=100_000)
+    parser.add_argument("-d", "--deposit", type=int, default=100)
+    parser.add_argument("-l", "--lines", type=int, default=MAX_LINES,
+                        choices=range(MIN_LINES, MAX_LINES + 1))
+    parser.add_argument("-b", "--bet", type=int, default=MIN_BET)
+    parser.add_argument("-t", "--target", type=int, default=None,
+                        help="cash out once funds reach this amount")
+    parser.add_argument("-m", "--max-spins", type=int, default=None)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    policy = FlatBet(args.lines, args.bet, args.target, args.max_spins)
+    stats: dict = simulate(args.sessions, args.deposit, policy, args.seed,
+                           args.workers)
+    percentiles: list[int] = [5, 25, 50, 75, 95]
+    funds = np.percentile(stats["final_funds"], percentiles)
+    spins = np.percentile(stats["spins"], percentiles)
+    print(f"Sessions:         {args.sessions:,} on {args.workers} workers")
+    print(f"Ruin probability: {stats['ruin_probability']:.4%}")
+    print(f"Mean final funds: ${stats['mean_final_funds']:,.2f}")
+    print(f"Mean spins:       {stats['mean_spins']:,.2f}")
+    for pct, fund, spin in zip(percentiles, funds, spins):
+        print(f"p{pct:<3} funds ${fund:>10,.0f}   spins {spin:>8,.0f}")
+    print(f"Throughput:       {stats['spins_per_second']:,.0f} spins/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Load generator for `slot_server`.
+
+Opens many concurrent player connections against a running server, spins
+for a while and reports the throughput with the latency percentiles of the
+SPIN commands.
+"""
+import argparse
+import asyncio
+import sys
+from time import perf_counter
+
+from slot_server import HOST, PORT
+
+
+async def player(host: str, port: int, spins: int, batch: int,
+                 deadline: float, latencies: list[float]) -> int:
+    """
+    A single connection spinning until done or the deadline passes
+
+    :param host: address of the server
+    :type host: str
+    :param port: port of the server
+    :type port: int
+    :param spins: SPIN commands to send at most
+    :type spins: int
+    :param batch: spins asked for in every SPIN command
+    :type batch: int
+    :param deadline: `perf_counter()` time at which to stop
+    :type deadline: float
+    :param latencies: collects the round trip of every SPIN command
+    :type latencies: list[float]
+    :return: spins played
+    :rtype: int
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    played: int = 0
+    try:
+        # Deep enough pockets to never run out during the test
+        for command in (b"DEPOSIT 1000000000\n", b"BET 3 5\n"):
+            writer.write(command)
+            reply: bytes = await reader.readline()
+            if not reply.startswith(b"OK"):
+                raise RuntimeError(reply.decode().strip())
+        request: bytes = f"SPIN {batch}\n".encode()
+        for _ in range(spins):
+            if perf_counter() >= deadline:
+                break
+            start: float = perf_counter()
+            writer.write(request)
+            reply = await reader.readline()
+            latencies.append(perf_counter() - start)
+            if not reply.startswith(b"OK"):
+                raise RuntimeError(reply.decode().strip())
+            # Fewer spins come back once the funds run short
+            played += len(reply.split()) - 2
+        writer.write(b"QUIT\n")
+        await reader.readline()
+    finally:
+        writer.close()
+
+    return played
+
+
+def percentile(ordered: list[float], pct: float) -> float:
+    """
+    Nearest rank percentile of already sorted values
+
+    :param ordered: values sorted in ascending order
+    :type ordered: list[float]
+    :param pct: percentile between 0 and 100
+    :type pct: float
+    :return: value at that percentile
+    :rtype: float
+    """
+    if not ordered:
+        return float("nan")
+    rank: int = max(0, round(pct / 100 * len(ordered)) - 1)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+async def run(host: str, port: int, connections: int, spins: int,
+              batch: int, duration: float) -> dict[str, float]:
+    """
+    Runs every player at once and gathers their measurements
+
+    :param host: address of the server
+    :type host: str
+    :param port: port of the server
+    :type port: int
+    :param connections: concurrent players
+    :type connections: int
+    :param spins: SPIN commands per player at most
+    :type spins: int
+    :param batch: spins asked for in every SPIN command
+    :type batch: int
+    :param duration: seconds after which players stop
+    :type duration: float
+    :return: throughput, latency percentiles in milliseconds and failed
+             players
+    :rtype: dict[str, float]
+    """
+    latencies: list[float] = []
+    start: float = perf_counter()
+    # A player failing must not cancel the others and lose their results
+    results: list[int | BaseException] = await asyncio.gather(*(
+        player(host, port, spins, batch, start + duration, latencies)
+        for _ in range(connections)
+    ), return_exceptions=True)
+    elapsed: float = perf_counter() - start
+    latencies.sort()
+    played: list[int] = [result for result in results
+                         if isinstance(result, int)]
+    errors: list[BaseException] = [result for result in results
+                                   if isinstance(result, BaseException)]
+    if errors:
+        print(f"{len(errors):,} players failed, first error: "
+              f"{errors[0]!r}", file=sys.stderr)
+
+    return {
+        "spins": sum(played),
+        "spins_per_second": sum(played) / elapsed,
+        "failed": len(errors),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("-c", "--connections", type=int, default=1000)
+    parser.add_argument("-n", "--spins", type=int, default=100,
+                        help="SPIN commands per connection")
+    parser.add_argument("-b", "--batch", type=int, default=1,
+                        help="spins per SPIN command")
+    parser.add_argument("-d", "--duration", type=float, default=30.0,
+                        help="stop after this many seconds")
+    args = parser.parse_args()
+
+    stats: dict[str, float] = asyncio.run(run(
+        args.host, args.port, args.connections, args.spins, args.batch,
+        args.duration
+    ))
+    print(f"Connections: {args.connections:,}")
+    print(f"Spins:       {stats['spins']:,}")
+    print(f"Throughput:  {stats['spins_per_second']:,.0f} spins/s")
+    print(f"Latency p50: {stats['p50_ms']:.3f} ms")
+    print(f"Latency p99: {stats['p99_ms']:.3f} ms")
+    print(f"Failed:      {stats['failed']:,}")
+
+
+if __name__ == "__main__":
+    main()
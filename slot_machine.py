@@ -1,6 +1,12 @@
 # Create a text based slot machine
-from random import choice
-from typing import Any
+import argparse
+import random
+import sys
+from functools import lru_cache
+from math import perm
+from operator import itemgetter
+from random import Random
+from typing import Any, NamedTuple, TextIO
 from time import sleep
 
 MAX_LINES: int = 3
@@ -63,6 +69,17 @@ SYMBOLS = {
         "value": 6,
     },
 }
+# Spins are handled as symbol ids, the position of the symbol in SYMBOLS. The
+# emoji is only looked up when the spin is displayed
+SYMBOL_UNICODE: tuple[str, ...] = tuple(
+    sym["unicode"] for sym in SYMBOLS.values()
+)
+MULTIPLIERS: tuple[int, ...] = tuple(sym["value"] for sym in SYMBOLS.values())
+# Row shown by every reel along each payline, bet in from the first one down.
+# Straight lines from the top row by default
+PAYLINES: tuple[tuple[int, ...], ...] = tuple(
+    (row,) * REELS for row in range(ROWS)
+)
 
 
 def initial_deposit() -> int:
@@ -147,9 +164,42 @@ def set_bet(funds: int, lines: int) -> list[int]:
     return [total_bet, funds]
 
 
-def predefined_symbols(symbols: dict, reels: int, rows: int) -> list[list]:
+@lru_cache(maxsize=None)
+def reel_draws(total_symbols: int, rows: int) -> tuple[bytes, ...]:
     """
-    Random generated matrix composed of three reels containing the slot symbols
+    Every reel `predefined_symbols` can draw, indexed by the random picks
+
+    A reel picks a position among the symbols left and removes it, one row at
+    a time. Reading those picks as a mixed radix number gives the index of the
+    resulting reel, so the removals only happen once, here.
+
+    :param total_symbols: number of different symbols on a reel
+    :type total_symbols: int
+    :param rows: constant value of total rows
+    :type rows: int
+    :return: symbol ids of every possible reel
+    :rtype: tuple[bytes, ...]
+    """
+    draws: list[bytes] = []
+    sizes: range = range(total_symbols, total_symbols - rows, -1)
+    for index in range(perm(total_symbols, rows)):
+        picks: list[int] = []
+        for size in reversed(sizes):
+            index, pick = divmod(index, size)
+            picks.append(pick)
+        pool: bytearray = bytearray(range(total_symbols))
+        draws.append(bytes(pool.pop(pick) for pick in reversed(picks)))
+
+    return tuple(draws)
+
+
+def predefined_symbols(symbols: dict, reels: int, rows: int,
+                       rng: Random | None = None) -> bytes:
+    """
+    Random generated reels containing the slot symbols, stored as symbol ids
+
+    Consumes the random generator exactly as picking every row with `choice`
+    and removing it from the reel would, so a seed gives the same spin.
 
     :param symbols: associated symbol with its unicode representation, count
                     and value
@@ -158,34 +208,43 @@ def predefined_symbols(symbols: dict, reels: int, rows: int) -> list[list]:
     :type reels: int
     :param rows: constant value of total rows
     :type rows: int
-    :return: matrix containing the reels
-    :rtype: list[list]
+    :param rng: random generator to draw from, the `random` module if None
+    :type rng: Random | None
+    :return: the reels one after the other, `rows` symbol ids each
+    :rtype: bytes
     :example:
-    >>> [['🍉', '🍋', '🍊'], ['🔔', '🍊', '🍒'], ['🍒', '🍑', '🔔']]
+    >>> b'\\x05\\x02\\x01\\x06\\x01\\x00\\x00\\x03\\x06'
     """
-    total_reels: list[list] = []
-    list_of_symbols: list[str] = []
-    for sym in symbols.values():
-        list_of_symbols.append(sym["unicode"])
+    getrandbits = random.getrandbits if rng is None else rng.getrandbits
+    draws: tuple[bytes, ...] = reel_draws(len(symbols), rows)
+    sizes: list[tuple[int, int]] = [
+        (size, size.bit_length())
+        for size in range(len(symbols), len(symbols) - rows, -1)
+    ]
+    spin: list[bytes] = []
     for _ in range(reels):
-        inner_reel: list = []
-        current_list_of_symbols: list[str] = list_of_symbols[:]
-        for _ in range(rows):
-            symbol: str = choice(current_list_of_symbols)
-            current_list_of_symbols.remove(symbol)
-            inner_reel.append(symbol)
+        index: int = 0
+        for size, bits in sizes:
+            pick: int = getrandbits(bits)
+            while pick >= size:
+                pick = getrandbits(bits)
+            index = index * size + pick
+        spin.append(draws[index])
 
-        total_reels.append(inner_reel)
+    return b"".join(spin)
 
-    return total_reels
 
-
-def output_spin(spin: list[list]) -> None:
+def output_spin(spin: bytes, rows: int = ROWS,
+                file: TextIO | None = None) -> None:
     """
     Visual representation of the spin after users action
 
-    :param spin: matrix representing the three reels from the slot machine
-    :type spin: list[list]
+    :param spin: reels from the slot machine, returned by `predefined_symbols`
+    :type spin: bytes
+    :param rows: constant value of total rows
+    :type rows: int
+    :param file: where to print the spin, standard output if None
+    :type file: TextIO | None
     :return: None
     :example:
     >>> \n
@@ -193,97 +252,271 @@ def output_spin(spin: list[list]) -> None:
         🍋 | 🍊 | 🍑\n
         🍊 | 🍒 | 🔔
     """
-    for reel in range(len(spin)):
-        for idx, value in enumerate(spin):
-            if idx != len(spin) - 1:
-                print(value[reel], end=" | ")
+    for row in range(rows):
+        line: bytes = spin[row::rows]
+        for idx, value in enumerate(line):
+            if idx != len(line) - 1:
+                print(SYMBOL_UNICODE[value], end=" | ", file=file)
             else:
-                print(value[reel], end="")
+                print(SYMBOL_UNICODE[value], end="", file=file, flush=True)
             sleep(0.07)
 
-        print()
+        print(file=file)
+
+
+def render_spin(spin: bytes, rows: int = ROWS) -> str:
+    """
+    Same text `output_spin` prints, built at once
+
+    :param spin: reels from the slot machine, returned by `predefined_symbols`
+    :type spin: bytes
+    :param rows: constant value of total rows
+    :type rows: int
+    :return: the rows of the spin, one per line
+    :rtype: str
+    """
+    return "".join(
+        " | ".join([SYMBOL_UNICODE[value] for value in spin[row::rows]]) + "\n"
+        for row in range(rows)
+    )
+
+
+class Spin(NamedTuple):
+    """
+    Outcome of a single spin from a `SlotSession`
+    """
+    reels: bytes
+    lines: int
+    bet: int
+    earnings: int
+    winning_lines: list
+    funds: int
+
+
+class SpinRenderer:
+    """
+    Displays spins like `pull_lever` and `jackpot` do. The turbo mode skips
+    the symbol by symbol animation and writes every frame of a batch at once.
+    """
+
+    def __init__(self, turbo: bool = False,
+                 file: TextIO | None = None) -> None:
+        self.turbo: bool = turbo
+        self.file: TextIO = sys.stdout if file is None else file
+
+    def render(self, spins: list[Spin]) -> None:
+        if self.turbo:
+            self.file.write("".join(
+                render_spin(spin.reels) + "\n"
+                + ("Jackpot!\n" if spin.earnings > 0 else "Not a chance!\n")
+                for spin in spins
+            ))
+            self.file.flush()
+            return
+        for spin in spins:
+            output_spin(spin.reels, file=self.file)
+            print(file=self.file)
+            print("Jackpot!" if spin.earnings > 0 else "Not a chance!",
+                  file=self.file)
+
+
+class SlotSession:
+    """
+    Funds, lines and bet of a player, played without any prompt or output
+    unless given a renderer. Every batch of spins is also handed to the
+    `write` method of `audit` if any, like `slot_audit.AuditLog`
+    """
+
+    def __init__(self, funds: int, rng: Random | None = None,
+                 renderer: SpinRenderer | None = None,
+                 audit: Any = None) -> None:
+        self.funds: int = funds
+        self.lines: int = MIN_LINES
+        self.bet: int = MIN_BET
+        self.rng: Random | None = rng
+        self.renderer: SpinRenderer | None = renderer
+        self.audit: Any = audit
+
+    @property
+    def total_bet(self) -> int:
+        return self.lines * self.bet
+
+    @property
+    def game_over(self) -> bool:
+        return self.funds == 0
+
+    def set_bet(self, lines: int, bet: int) -> None:
+        """
+        Lines and bet per line of the following spins, same rules as
+        `get_number_lines` and `set_bet`
+
+        :param lines: number of lines to bet in
+        :type lines: int
+        :param bet: bet on each line
+        :type bet: int
+        :return: None
+        :rtype: NoneType
+        """
+        if not MIN_LINES <= lines <= MAX_LINES:
+            raise ValueError("Enter a valid number of lines.")
+        if not MIN_BET <= bet <= MAX_BET:
+            raise ValueError(f"Bet must be between ${MIN_BET} - ${MAX_BET}")
+        if lines * bet > self.funds:
+            raise ValueError(f"Insufficient funds for bet. "
+                             f"Current funds: ${self.funds}")
+        self.lines = lines
+        self.bet = bet
+
+    def spin(self, n: int = 1) -> list[Spin]:
+        """
+        Pulls the lever `n` times, stopping early once funds can't cover the
+        total bet
+
+        :param n: number of spins
+        :type n: int
+        :return: every spin played, in order
+        :rtype: list[Spin]
+        """
+        spins: list[Spin] = []
+        for _ in range(n):
+            total_bet: int = self.total_bet
+            if total_bet > self.funds:
+                break
+            reels: bytes = predefined_symbols(SYMBOLS, REELS, ROWS, self.rng)
+            # `bet_or_cash` hands the total bet to `jackpot`
+            earnings, winning_lines = score_spin(reels, total_bet, self.lines)
+            self.funds += earnings - total_bet
+            spins.append(Spin(reels, self.lines, self.bet, earnings,
+                              winning_lines, self.funds))
+        if self.audit is not None and spins:
+            self.audit.write(spins)
+        if self.renderer is not None and spins:
+            self.renderer.render(spins)
 
+        return spins
 
-def pull_lever() -> list[list]:
+
+def pull_lever(session: SlotSession) -> Spin:
     """
     A "spin" takes place generating three different reels with random symbols
 
-    :return: the random values for every slot
-    :rtype: list[str]
+    :param session: the session of the player pulling the lever
+    :type session: SlotSession
+    :return: the outcome of the spin
+    :rtype: Spin
     """
     while True:
         pull: str = input("Pull the lever! (Enter) \n")
         if pull != "":
             continue
-        reel_outcome: list[list] = predefined_symbols(SYMBOLS, REELS, ROWS)
-        output_spin(reel_outcome)
-        print()
         break
 
-    return reel_outcome
+    return session.spin()[0]
 
 
-def multiplier_bonus(symbol: str) -> int:
+def multiplier_bonus(symbol: int) -> int:
     """
     The bonus applied to the bet based on value of the symbol
 
+    :param symbol: id of the symbol
+    :type symbol: int
     :return: value of the symbol
     :rtype: int
     """
-    multiplier: int = 0
-    for data in SYMBOLS.values():
-        if symbol == data["unicode"]:
-            value: Any = data["value"]
-            multiplier = value
+    return MULTIPLIERS[symbol]
 
-    return multiplier
 
+@lru_cache(maxsize=None)
+def payline_getters(paylines: tuple[tuple[int, ...], ...],
+                    rows: int) -> tuple[itemgetter, ...]:
+    """
+    Fetches the symbol ids along every payline out of a spin
 
-def jackpot(all_reels: list[list], bet: int, lines: int) -> list:
+    :param paylines: row of every reel along each payline
+    :type paylines: tuple[tuple[int, ...], ...]
+    :param rows: constant value of total rows
+    :type rows: int
+    :return: one getter per payline, returning a tuple of symbol ids
+    :rtype: tuple[itemgetter, ...]
     """
-    Assess the combinations from the spin in order to return, if any, earnings.
+    return tuple(
+        itemgetter(*[reel * rows + row for reel, row in enumerate(line)])
+        for line in paylines
+    )
+
+
+def score_spin(all_reels: bytes, bet: int, lines: int, rows: int = ROWS,
+               paylines: tuple[tuple[int, ...], ...] = PAYLINES) -> list:
+    """
+    Earnings of a spin and the lines that won them, without any output
 
-    :param all_reels: a group of three random generated reels inside a matrix
-    :type all_reels: list[list]
+    :param all_reels: reels returned by `predefined_symbols`
+    :type all_reels: bytes
     :param bet: the users bet
     :type bet: int
     :param lines: lines selected by the user upon which the bet takes place
     :type lines: int
-    :return: the total earnings after the spin
-    :rtype: int
+    :param rows: constant value of total rows
+    :type rows: int
+    :param paylines: row of every reel along each payline
+    :type paylines: tuple[tuple[int, ...], ...]
+    :return: the total earnings after the spin and the winning lines
+    :rtype: list
     """
     winning_lines: list = []
     earnings: int = 0
-    # Since bet is based on lines, it will only iterate accordingly
+    getters: tuple[itemgetter, ...] = payline_getters(paylines, rows)
+    # Since bet is based on lines, it will only iterate accordingly. A line
+    # wins when every reel shows the symbol of the first reel on it
     for line in range(lines):
-        # Based on the first reel compare to the following reel, same position,
-        # (idx 0, 1, 2) if it is the same symbol. Break if not
-        symbol: str = all_reels[0][line]
-        for reel in all_reels:
-            symbol_to_check: str = reel[line]
-            if symbol != symbol_to_check:
-                break
-        else:
-            earnings += bet * multiplier_bonus(symbol)
+        symbols_in_line: tuple[int, ...] = getters[line](all_reels)
+        symbol: int = symbols_in_line[0]
+        if symbols_in_line.count(symbol) == len(symbols_in_line):
+            earnings += bet * MULTIPLIERS[symbol]
             winning_lines.append(line)
 
+    return [earnings, winning_lines]
+
+
+def jackpot(all_reels: bytes, bet: int, lines: int) -> list:
+    """
+    Assess the combinations from the spin in order to return, if any, earnings.
+
+    :param all_reels: reels returned by `predefined_symbols`
+    :type all_reels: bytes
+    :param bet: the users bet
+    :type bet: int
+    :param lines: lines selected by the user upon which the bet takes place
+    :type lines: int
+    :return: the total earnings after the spin and the winning lines
+    :rtype: list
+    """
+    earnings, winning_lines = score_spin(all_reels, bet, lines)
+
     print("Jackpot!" if earnings > 0 else "Not a chance!")
 
     return [earnings, winning_lines]
 
 
-def bet_or_cash(funds: int) -> int:
+def bet_or_cash(funds: int, renderer: SpinRenderer | None = None,
+                audit: Any = None) -> int:
     """
     Gives the option for the user to keep gambling or cash out as long as the
     user still has funds.
 
     :param funds: current funds from the user
     :type fund: int
+    :param renderer: how spins are displayed, animated if None
+    :type renderer: SpinRenderer | None
+    :param audit: records every spin, see `SlotSession`
+    :type audit: Any
     :return: modified funds value
     :rtype: int
     """
+    session = SlotSession(funds, renderer=renderer or SpinRenderer(),
+                          audit=audit)
     while True:
-        if funds == 0:
+        if session.game_over:
             print("Game over!")
             break
         choice: str = input("Play or quit [P/Q] ").lower()
@@ -291,29 +524,34 @@ def bet_or_cash(funds: int) -> int:
             break
         elif choice == "p":
             lines: int = get_number_lines()
-            bet, current_funds = set_bet(funds, lines)
-            new_funds, w_lines = jackpot(pull_lever(), bet, lines)
-            funds = current_funds + new_funds
-            print(f"You're new funds are ${funds}.")
-            if len(w_lines) > 0:
-                print("You won on lines", *w_lines)
+            total_bet, _ = set_bet(session.funds, lines)
+            session.set_bet(lines, total_bet // lines)
+            spin: Spin = pull_lever(session)
+            print(f"You're new funds are ${spin.funds}.")
+            if len(spin.winning_lines) > 0:
+                print("You won on lines", *spin.winning_lines)
         else:
             continue
-    return funds
+    return session.funds
 
 
-def start_game() -> None:
+def start_game(renderer: SpinRenderer | None = None,
+               audit: Any = None) -> None:
     """
     Initializes the game by stating the base funding and outputs the final
     earnings if any.
 
+    :param renderer: how spins are displayed, animated if None
+    :type renderer: SpinRenderer | None
+    :param audit: records every spin, see `SlotSession`
+    :type audit: Any
     :return: None
     :rtype: NoneType
     """
     print("Starting Jackpot")
     # Ask once for the initial balance
     funds: int = initial_deposit()
-    earnings: int = bet_or_cash(funds)
+    earnings: int = bet_or_cash(funds, renderer, audit)
     if earnings > 0:
         print(f"You're final funds are ${earnings}")
     else:
@@ -321,7 +559,20 @@ def start_game() -> None:
 
 
 def main() -> None:
-    start_game()
+    parser = argparse.ArgumentParser(description="Text based slot machine")
+    parser.add_argument("--turbo", action="store_true",
+                        help="skip the spin animation")
+    parser.add_argument("--audit", metavar="LOG",
+                        help="append every spin to a binary audit log")
+    args = parser.parse_args()
+    renderer = SpinRenderer(turbo=args.turbo)
+    if args.audit is None:
+        start_game(renderer)
+        return
+    # Imported here since the log builds on this module
+    from slot_audit import AuditLog
+    with AuditLog(args.audit) as audit:
+        start_game(renderer, audit)
 
 
 if __name__ == "__main__":
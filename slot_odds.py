@@ -0,0 +1,186 @@
+"""Exact payout distribution of the slot machine.
+
+Counts every outcome of the `predefined_symbols` draw combinatorially instead
+of sampling it, so even the rarest jackpot comes out as an exact fraction.
+"""
+import argparse
+from fractions import Fraction
+from functools import lru_cache
+from math import comb, perm
+
+from slot_machine import MAX_LINES, MIN_LINES, REELS, ROWS, SYMBOLS
+
+
+@lru_cache(maxsize=None)
+def reel_match_counts(total_symbols: int, lines: int) -> tuple[int, ...]:
+    """
+    How many draws of a reel agree with a given reel on exactly a set of lines
+
+    Only the first `lines` rows of a reel are ever scored and they are an
+    ordered selection of distinct symbols. Inclusion-exclusion over the lines
+    that are forced to match gives the count for every exact match mask.
+
+    :param total_symbols: number of different symbols on a reel
+    :type total_symbols: int
+    :param lines: lines bet in
+    :type lines: int
+    :return: draw count indexed by the mask of matching lines
+    :rtype: tuple[int, ...]
+    """
+    counts: list[int] = []
+    for mask in range(1 << lines):
+        count: int = 0
+        for superset in range(1 << lines):
+            if superset & mask != mask:
+                continue
+            forced: int = superset.bit_count()
+            sign: int = -1 if (forced - mask.bit_count()) % 2 else 1
+            count += sign * perm(total_symbols - forced, lines - forced)
+        counts.append(count)
+
+    return tuple(counts)
+
+
+@lru_cache(maxsize=None)
+def win_mask_distribution(total_symbols: int, lines: int,
+                          reels: int) -> tuple[Fraction, ...]:
+    """
+    Probability of every set of winning lines, whatever the symbols are
+
+    A line pays when every reel matches the first one on it, so the winning
+    mask is the bitwise and of the match masks of the remaining reels. It does
+    not depend on the symbol values, which keeps it cached across paytables.
+
+    :param total_symbols: number of different symbols on a reel
+    :type total_symbols: int
+    :param lines: lines bet in
+    :type lines: int
+    :param reels: constant value of total reels
+    :type reels: int
+    :return: probability indexed by the mask of winning lines
+    :rtype: tuple[Fraction, ...]
+    """
+    draws: int = perm(total_symbols, lines)
+    single: list[Fraction] = [Fraction(count, draws) for count in
+                              reel_match_counts(total_symbols, lines)]
+    masks: list[Fraction] = [Fraction(0)] * (1 << lines)
+    masks[-1] = Fraction(1)
+    for _ in range(reels - 1):
+        combined: list[Fraction] = [Fraction(0)] * (1 << lines)
+        for mask, prob in enumerate(masks):
+            if not prob:
+                continue
+            for match, match_prob in enumerate(single):
+                combined[mask & match] += prob * match_prob
+        masks = combined
+
+    return tuple(masks)
+
+
+@lru_cache(maxsize=None)
+def value_sum_counts(values: tuple[int, ...],
+                     size: int) -> tuple[tuple[int, int], ...]:
+    """
+    How many sets of `size` distinct symbols add up to every possible value
+
+    :param values: value of every symbol
+    :type values: tuple[int, ...]
+    :param size: number of symbols in a set
+    :type size: int
+    :return: pairs of total value and number of sets reaching it
+    :rtype: tuple[tuple[int, int], ...]
+    """
+    # sums[k] maps the total value of k chosen symbols to how many sets add up
+    sums: list[dict[int, int]] = [{0: 1}] + [{} for _ in range(size)]
+    for value in values:
+        for taken in range(size, 0, -1):
+            for total, count in sums[taken - 1].items():
+                key: int = total + value
+                sums[taken][key] = sums[taken].get(key, 0) + count
+
+    return tuple(sorted(sums[size].items()))
+
+
+def payout_distribution(symbols: dict = SYMBOLS, reels: int = REELS,
+                        rows: int = ROWS,
+                        lines: int = MAX_LINES) -> dict[int, Fraction]:
+    """
+    Exact probability of every payout of a single spin
+
+    :param symbols: associated symbol with its unicode representation, count
+                    and value
+    :type symbols: dict[str, dict]
+    :param reels: constant value of total reels
+    :type reels: int
+    :param rows: constant value of total rows
+    :type rows: int
+    :param lines: lines bet in, from the top one down
+    :type lines: int
+    :return: probability of each payout, measured in total bets
+    :rtype: dict[int, Fraction]
+    """
+    if not 1 <= lines <= rows:
+        raise ValueError(f"Lines must be between 1 and {rows}")
+    if rows > len(symbols):
+        raise ValueError("Not enough symbols to fill every row of a reel")
+    values: tuple[int, ...] = tuple(sym["value"] for sym in symbols.values())
+    distribution: dict[int, Fraction] = {}
+    masks = win_mask_distribution(len(values), lines, reels)
+    for mask, prob in enumerate(masks):
+        if not prob:
+            continue
+        # The winning lines show distinct symbols, every set equally likely
+        size: int = mask.bit_count()
+        sets: int = comb(len(values), size)
+        for total, count in value_sum_counts(values, size):
+            distribution[total] = (distribution.get(total, Fraction(0))
+                                   + prob * Fraction(count, sets))
+
+    return dict(sorted(distribution.items()))
+
+
+def line_odds(symbols: dict = SYMBOLS,
+              reels: int = REELS) -> tuple[Fraction, Fraction]:
+    """
+    Exact win probability and expected payout of a single line
+
+    Every row of a reel shows each symbol with the same probability, so a line
+    pays a given symbol with probability `1 / len(symbols) ** reels`. A winning
+    line pays the total bet times the value of its symbol.
+
+    :param symbols: associated symbol with its unicode representation, count
+                    and value
+    :type symbols: dict[str, dict]
+    :param reels: constant value of total reels
+    :type reels: int
+    :return: win probability and expected payout, in total bets, of one line
+    :rtype: tuple[Fraction, Fraction]
+    """
+    single: Fraction = Fraction(1, len(symbols) ** reels)
+    win: Fraction = len(symbols) * single
+    expected: Fraction = sum(sym["value"] for sym in symbols.values()) * single
+
+    return win, expected
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-l", "--lines", type=int, default=MAX_LINES,
+                        choices=range(MIN_LINES, MAX_LINES + 1))
+    args = parser.parse_args()
+
+    win, expected = line_odds()
+    distribution: dict[int, Fraction] = payout_distribution(lines=args.lines)
+    print(f"Line win probability: {win} ({float(win):.6%})")
+    print(f"Line expected payout: {expected} "
+          f"({float(expected):.6f} total bets)")
+    # Lines pay independently of each other in expectation
+    print(f"RTP on {args.lines} lines:       "
+          f"{float(args.lines * expected):.6%}")
+    print(f"Payout distribution on {args.lines} lines:")
+    for payout, prob in distribution.items():
+        print(f"{payout:>6} x total bet  {float(prob):.10f}  ({prob})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Vectorized payline evaluation for larger reel geometries.
+
+Paylines are tables holding the row every reel shows along the line, as
+`PAYLINES` in `slot_machine`. They are turned once into an array of grid
+indices, so every payline of millions of spins is scored by one gather
+and comparison per reel instead of walking the lines symbol by symbol.
+"""
+import argparse
+from itertools import product
+from time import perf_counter
+
+import numpy as np
+
+from slot_machine import SYMBOLS
+from slot_simulator import reel_table
+
+# Reels x rows geometries covered by the benchmark
+GEOMETRIES: tuple[tuple[int, int], ...] = ((3, 3), (4, 3), (5, 3), (4, 4),
+                                           (5, 4), (5, 5))
+# Spins scored per vectorized pass
+CHUNK: int = 1 << 16
+
+
+def make_paylines(reels: int, rows: int,
+                  count: int) -> tuple[tuple[int, ...], ...]:
+    """
+    Payline table with straight lines first, then zig-zags
+
+    Lines moving at most one row between neighbouring reels come first, with
+    the fewest changes of row, as machines usually number them. Any other
+    line is only used when those run out.
+
+    :param reels: number of reels
+    :type reels: int
+    :param rows: number of rows
+    :type rows: int
+    :param count: paylines wanted, capped to the distinct lines available
+    :type count: int
+    :return: row of every reel along each payline
+    :rtype: tuple[tuple[int, ...], ...]
+    """
+    def rank(line: tuple[int, ...]) -> tuple:
+        steps: list[int] = [abs(a - b) for a, b in zip(line, line[1:])]
+        changes: int = sum(step > 0 for step in steps)
+        return max(steps, default=0) > 1, changes, line
+
+    return tuple(sorted(product(range(rows), repeat=reels), key=rank)[:count])
+
+
+def payline_positions(paylines: tuple[tuple[int, ...], ...],
+                      rows: int) -> np.ndarray:
+    """
+    Position in a flattened spin of every symbol along each payline
+
+    :param paylines: row of every reel along each payline
+    :type paylines: tuple[tuple[int, ...], ...]
+    :param rows: number of rows
+    :type rows: int
+    :return: array of paylines by reels
+    :rtype: np.ndarray
+    """
+    lines = np.array(paylines, dtype=np.intp)
+    return np.arange(lines.shape[1]) * rows + lines
+
+
+def draw_grids(rng: np.random.Generator, spins: int, table: np.ndarray,
+               reels: int) -> np.ndarray:
+    """
+    Random spins laid out like `predefined_symbols`, reel after reel
+
+    :param rng: NumPy random generator used for the reel draws
+    :type rng: np.random.Generator
+    :param spins: number of spins to draw
+    :type spins: int
+    :param table: returned value from `reel_table()` function
+    :type table: np.ndarray
+    :param reels: number of reels
+    :type reels: int
+    :return: symbol ids, one row per spin
+    :rtype: np.ndarray
+    """
+    draws = rng.integers(0, len(table), size=(spins, reels))
+    return table[draws].reshape(spins, -1)
+
+
+def score_grids(grids: np.ndarray, positions: np.ndarray,
+                values: np.ndarray) -> np.ndarray:
+    """
+    Payout of every spin over all paylines, in units of the total bet
+
+    :param grids: returned value from `draw_grids()` function
+    :type grids: np.ndarray
+    :param positions: returned value from `payline_positions()` function
+    :type positions: np.ndarray
+    :param values: value of every symbol id
+    :type values: np.ndarray
+    :return: payout of every spin
+    :rtype: np.ndarray
+    """
+    first = grids[:, positions[:, 0]]
+    wins = grids[:, positions[:, 1]] == first
+    for reel in range(2, positions.shape[1]):
+        wins &= grids[:, positions[:, reel]] == first
+
+    return (values[first] * wins).sum(axis=1)
+
+
+def benchmark(reels: int, rows: int, lines: int, spins: int,
+              symbols: dict = SYMBOLS, seed: int | None = None) -> dict:
+    """
+    Scores random spins of a geometry, measuring throughput and RTP
+
+    :param reels: number of reels
+    :type reels: int
+    :param rows: number of rows
+    :type rows: int
+    :param lines: paylines bet in
+    :type lines: int
+    :param spins: spins to score
+    :type spins: int
+    :param symbols: associated symbol with its unicode representation, count
+                    and value
+    :type symbols: dict[str, dict]
+    :param seed: seed for a reproducible run, random if None
+    :type seed: int | None
+    :return: lines actually used, RTP and spins scored per second
+    :rtype: dict
+    """
+    paylines = make_paylines(reels, rows, lines)
+    positions: np.ndarray = payline_positions(paylines, rows)
+    values = np.array([sym["value"] for sym in symbols.values()],
+                      dtype=np.int32)
+    table: np.ndarray = reel_table(symbols, rows)
+    rng: np.random.Generator = np.random.default_rng(seed)
+
+    total: int = 0
+    elapsed: float = 0.0
+    for done in range(0, spins, CHUNK):
+        grids = draw_grids(rng, min(CHUNK, spins - done), table, reels)
+        start: float = perf_counter()
+        total += int(score_grids(grids, positions, values).sum())
+        elapsed += perf_counter() - start
+
+    return {"lines": len(paylines), "rtp": total / spins,
+            "spins_per_second": spins / elapsed}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--spins", type=int, default=1_000_000)
+    parser.add_argument("-l", "--lines", type=int, default=50)
+    parser.add_argument("-s", "--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    for reels, rows in GEOMETRIES:
+        stats: dict = benchmark(reels, rows, args.lines, args.spins,
+                                seed=args.seed)
+        print(f"{reels}x{rows} {stats['lines']:>3} lines: "
+              f"{stats['spins_per_second']:>12,.0f} spins/s  "
+              f"RTP {stats['rtp']:.4%}")
+
+
+if __name__ == "__main__":
+    main()
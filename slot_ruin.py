@@ -0,0 +1,145 @@
+"""Probability of ruin and expected session length of the slot machine.
+
+Funds follow a Markov chain: every spin costs `lines * bet` and, like
+`score_spin`, pays back that total bet times a payout drawn from the exact
+distribution of `slot_odds`.
+Instead of simulating sessions, the absorption probabilities and times of
+that chain are solved directly for every starting deposit at once.
+"""
+import argparse
+from time import perf_counter
+
+import numpy as np
+from scipy.sparse import coo_matrix, csc_matrix, identity
+from scipy.sparse.linalg import splu
+
+from slot_machine import MAX_BET, MAX_LINES, MIN_BET, MIN_LINES
+from slot_odds import payout_distribution
+
+
+def stakes(funds: np.ndarray, lines: int,
+           bet: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Lines and bet per line actually played with every amount of funds
+
+    `set_bet` refuses a total bet above the funds, so the number of lines is
+    lowered to what the funds cover at `MIN_BET`, then the bet per line to
+    what they cover on those lines.
+
+    :param funds: funds before the spin, at least `MIN_BET` each
+    :type funds: np.ndarray
+    :param lines: lines the player would like to bet in
+    :type lines: int
+    :param bet: bet per line the player would like to place
+    :type bet: int
+    :return: lines and bet per line for every amount of funds
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    played_lines = np.minimum(lines, funds // MIN_BET)
+    return played_lines, np.minimum(bet, funds // played_lines)
+
+
+def transitions(target: int, lines: int,
+                bet: int) -> tuple[csc_matrix, np.ndarray]:
+    """
+    Sparse one-spin transitions between the funds a session can still play
+
+    Funds from `MIN_BET` to `target - 1` are the playing states. Falling
+    under `MIN_BET` ends the session, as no bet can be placed anymore and
+    `bet_or_cash` ends the game once funds reach 0, while reaching `target`
+    cashes out.
+
+    :param target: funds at which the player cashes out
+    :type target: int
+    :param lines: lines the player would like to bet in
+    :type lines: int
+    :param bet: bet per line the player would like to place
+    :type bet: int
+    :return: transitions between playing states and probability of being
+             ruined by the next spin from each of them
+    :rtype: tuple[csc_matrix, np.ndarray]
+    """
+    funds = np.arange(MIN_BET, target)
+    played_lines, played_bet = stakes(funds, lines, bet)
+    rows: list[np.ndarray] = []
+    cols: list[np.ndarray] = []
+    probs: list[np.ndarray] = []
+    ruin = np.zeros(len(funds))
+    for count in range(MIN_LINES, lines + 1):
+        state = np.flatnonzero(played_lines == count)
+        stake = played_bet[state]
+        for payout, prob in payout_distribution(lines=count).items():
+            # Every winning line pays the total bet times its multiplier
+            after = funds[state] + stake * count * (payout - 1)
+            playing = (after >= MIN_BET) & (after < target)
+            rows.append(state[playing])
+            cols.append(after[playing] - MIN_BET)
+            probs.append(np.full(int(playing.sum()), float(prob)))
+            np.add.at(ruin, state[after < MIN_BET], float(prob))
+
+    size: int = len(funds)
+    matrix = coo_matrix((np.concatenate(probs),
+                         (np.concatenate(rows), np.concatenate(cols))),
+                        shape=(size, size))
+    return matrix.tocsc(), ruin
+
+
+def solve(target: int, lines: int = MAX_LINES,
+          bet: int = MIN_BET) -> dict[str, np.ndarray]:
+    """
+    Ruin probability and expected spins for every deposit below the target
+
+    :param target: funds at which the player cashes out
+    :type target: int
+    :param lines: lines the player would like to bet in
+    :type lines: int
+    :param bet: bet per line the player would like to place
+    :type bet: int
+    :return: deposits with their ruin probability and expected spins
+    :rtype: dict[str, np.ndarray]
+    """
+    if not MIN_LINES <= lines <= MAX_LINES:
+        raise ValueError(f"Lines must be between {MIN_LINES} and {MAX_LINES}")
+    if not MIN_BET <= bet <= MAX_BET:
+        raise ValueError(f"Bet must be between ${MIN_BET} - ${MAX_BET}")
+    if target <= MIN_BET:
+        raise ValueError(f"Target must be above ${MIN_BET}")
+    matrix, ruin = transitions(target, lines, bet)
+    # Absorption of the chain: (I - Q) x = b, factorized once for both
+    system = splu(identity(matrix.shape[0], format="csc") - matrix)
+    deposits = np.arange(target)
+    ruined = np.ones(target)
+    spins = np.zeros(target)
+    ruined[MIN_BET:] = system.solve(ruin)
+    spins[MIN_BET:] = system.solve(np.ones(matrix.shape[0]))
+
+    return {"deposit": deposits, "ruin_probability": ruined,
+            "expected_spins": spins}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("deposit", type=int, nargs="+")
+    parser.add_argument("-t", "--target", type=int, default=None,
+                        help="cash out funds, twice the largest deposit "
+                             "by default")
+    parser.add_argument("-l", "--lines", type=int, default=MAX_LINES,
+                        choices=range(MIN_LINES, MAX_LINES + 1))
+    parser.add_argument("-b", "--bet", type=int, default=MIN_BET)
+    args = parser.parse_args()
+
+    target: int = args.target or 2 * max(args.deposit)
+    start: float = perf_counter()
+    result: dict[str, np.ndarray] = solve(target, args.lines, args.bet)
+    elapsed: float = perf_counter() - start
+    print(f"Solved {target:,} funds states in {elapsed:.3f}s")
+    for deposit in args.deposit:
+        if deposit >= target:
+            print(f"${deposit}: already at the ${target} target")
+            continue
+        print(f"${deposit}: ruin {result['ruin_probability'][deposit]:.6%}, "
+              f"{result['expected_spins'][deposit]:,.2f} spins expected")
+
+
+if __name__ == "__main__":
+    main()
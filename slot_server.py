@@ -0,0 +1,167 @@
+"""Asyncio TCP server hosting a slot machine session per connection.
+
+Line based protocol, one reply line per command:
+
+    DEPOSIT <amount>    OK <funds>                     initial funds, once
+    BET <lines> <bet>   OK <lines> <bet>               lines and bet per line
+    SPIN [n]            OK <funds> <spin> [<spin>...]  n spins, 1 by default
+    FUNDS               OK <funds>
+    QUIT                OK <funds>                     closes the connection
+
+Every spin is written as `<reels>:<earnings>:<winning lines>`, the reels being
+the hex encoded symbol ids and the winning lines separated by commas. Errors
+are replied as `ERR <message>` and leave the session untouched.
+"""
+import argparse
+import asyncio
+
+from slot_machine import SlotSession, Spin
+
+HOST: str = "127.0.0.1"
+PORT: int = 8737
+MIN_DEPOSIT: int = 100
+# Spins allowed per SPIN command
+MAX_SPINS: int = 1000
+# Larger batches are spun on a worker thread to keep the event loop free
+INLINE_SPINS: int = 16
+
+
+def format_spin(spin: Spin) -> str:
+    """
+    Wire representation of a spin
+
+    :param spin: a spin returned by `SlotSession.spin()`
+    :type spin: Spin
+    :return: reels, earnings and winning lines separated by colons
+    :rtype: str
+    """
+    lines: str = ",".join(str(line) for line in spin.winning_lines)
+    return f"{spin.reels.hex()}:{spin.earnings}:{lines}"
+
+
+async def execute(session: SlotSession | None,
+                  words: list[str]) -> tuple[SlotSession | None, str]:
+    """
+    Runs a single protocol command against the session of a connection
+
+    :param session: session of the connection, None until the deposit
+    :type session: SlotSession | None
+    :param words: the command and its arguments
+    :type words: list[str]
+    :return: the session after the command and the reply line
+    :rtype: tuple[SlotSession | None, str]
+    """
+    command: str = words[0].upper() if words else ""
+    args: list[str] = words[1:]
+    # isdigit() alone lets through "²", which int() rejects
+    if not all(arg.isascii() and arg.isdigit() for arg in args):
+        return session, "ERR Invalid entry."
+
+    if command == "DEPOSIT" and len(args) == 1:
+        if session is not None:
+            return session, "ERR Deposit already made."
+        if int(args[0]) < MIN_DEPOSIT:
+            return session, "ERR Initial deposit must be at least $100.00"
+        session = SlotSession(int(args[0]))
+        return session, f"OK {session.funds}"
+    if command not in ("BET", "SPIN", "FUNDS", "QUIT"):
+        return session, "ERR Unknown command."
+    if session is None:
+        return session, "ERR Enter money first."
+
+    if command == "BET" and len(args) == 2:
+        try:
+            session.set_bet(int(args[0]), int(args[1]))
+        except ValueError as error:
+            return session, f"ERR {error}"
+        return session, f"OK {session.lines} {session.bet}"
+    if command == "SPIN" and len(args) <= 1:
+        count: int = int(args[0]) if args else 1
+        if not 1 <= count <= MAX_SPINS:
+            return session, f"ERR Spins must be between 1 and {MAX_SPINS}"
+        if session.game_over:
+            return session, "ERR Game over!"
+        if count <= INLINE_SPINS:
+            spins: list[Spin] = session.spin(count)
+        else:
+            spins = await asyncio.to_thread(session.spin, count)
+        if not spins:
+            return session, (f"ERR Insufficient funds for bet. "
+                             f"Current funds: ${session.funds}")
+        return session, " ".join(["OK", str(session.funds),
+                                  *map(format_spin, spins)])
+    if command in ("FUNDS", "QUIT") and not args:
+        return session, f"OK {session.funds}"
+
+    return session, "ERR Invalid entry."
+
+
+async def handle(reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter) -> None:
+    """
+    Serves the commands of one player until QUIT or disconnection
+
+    :param reader: incoming side of the connection
+    :type reader: asyncio.StreamReader
+    :param writer: outgoing side of the connection
+    :type writer: asyncio.StreamWriter
+    :return: None
+    :rtype: NoneType
+    """
+    session: SlotSession | None = None
+    try:
+        while line := await reader.readline():
+            words: list[str] = line.decode(errors="replace").split()
+            session, reply = await execute(session, words)
+            writer.write(reply.encode() + b"\n")
+            await writer.drain()
+            if words and words[0].upper() == "QUIT" and reply[:2] == "OK":
+                break
+    except ValueError:
+        # A line past the reader's limit, what follows it can't be trusted
+        # to start a command, so the connection is dropped
+        try:
+            writer.write(b"ERR Line too long.\n")
+            await writer.drain()
+        except ConnectionError:
+            pass
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def serve(host: str = HOST, port: int = PORT) -> None:
+    """
+    Accepts players until cancelled
+
+    :param host: address to listen on
+    :type host: str
+    :param port: port to listen on
+    :type port: int
+    :return: None
+    :rtype: NoneType
+    """
+    server = await asyncio.start_server(handle, host, port, backlog=4096)
+    print(f"Serving slots on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
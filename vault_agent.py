@@ -0,0 +1,298 @@
+"""Unlock agent keeping the main key in memory, in the spirit of ssh-agent.
+
+`start` asks for the MPass once, then keeps the unlocked key in a background
+process listening on a Unix socket only the current user can reach. Later
+`get` calls ask the agent instead of reading the `.key` file and deriving
+anything again. The agent forgets the key and exits after a period without
+requests, or on `stop`.
+
+Requests and replies are single JSON lines:
+
+    {"cmd": "get", "account": "github"}  ->  {"ok": true, "passwords": [..]}
+    {"cmd": "ping"}                      ->  {"ok": true}
+    {"cmd": "stop"}                      ->  {"ok": true}
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import tempfile
+from getpass import getpass
+from os.path import exists
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from vault_index import KEYS_FILE, index_key, lookup
+from vault_sqlite import VAULT_DB, SQLiteVault
+
+KEY_FILE: str = "key.key"
+# Seconds without requests before the agent locks itself
+IDLE_TIMEOUT: float = 900.0
+
+
+# pid, uid and gid of the other end of a Unix socket
+PEERCRED: struct.Struct = struct.Struct("3i")
+
+
+def private_dir() -> str:
+    """
+    Directory only the current user can use, `XDG_RUNTIME_DIR` or one made
+    in the temporary directory
+
+    :return: path of the directory
+    :rtype: str
+    """
+    runtime: str | None = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return runtime
+    folder: str = os.path.join(tempfile.gettempdir(),
+                               f"keys-agent-{os.getuid()}")
+    try:
+        os.mkdir(folder, 0o700)
+    except FileExistsError:
+        pass
+    # Someone else may have made it first, in a shared /tmp
+    info: os.stat_result = os.lstat(folder)
+    if (not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid()
+            or info.st_mode & 0o077):
+        raise PermissionError(f"'{folder}' is not a private directory")
+    return folder
+
+
+def socket_path() -> str:
+    """
+    Socket of the agent, `KEYS_AGENT_SOCK` or a per user default
+
+    :return: path of the Unix socket
+    :rtype: str
+    """
+    sock: str | None = os.environ.get("KEYS_AGENT_SOCK")
+    return sock or os.path.join(private_dir(), "keys-agent.sock")
+
+
+def peer_uid(sock: socket.socket) -> int | None:
+    """
+    User on the other end of a Unix socket
+
+    :param sock: connected Unix socket
+    :type sock: socket.socket
+    :return: uid of the peer, None where the platform can't tell
+    :rtype: int | None
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    creds: bytes = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                   PEERCRED.size)
+    return PEERCRED.unpack(creds)[1]
+
+
+class Agent:
+    """
+    Serves lookups with the unlocked key until idle for `timeout` seconds
+    """
+
+    def __init__(self, key: bytes, timeout: float = IDLE_TIMEOUT) -> None:
+        self.fer: Fernet = Fernet(key)
+        self.idx_key: bytes = index_key(key)
+        self.vault: SQLiteVault | None = (SQLiteVault() if exists(VAULT_DB)
+                                          else None)
+        self.timeout: float = timeout
+        self.idle: asyncio.TimerHandle | None = None
+        self.done: asyncio.Event = asyncio.Event()
+        self.clients: dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    def touch(self) -> None:
+        """
+        Restarts the idle countdown
+
+        :return: None
+        :rtype: NoneType
+        """
+        if self.idle is not None:
+            self.idle.cancel()
+        loop = asyncio.get_running_loop()
+        self.idle = loop.call_later(self.timeout, self.done.set)
+
+    def answer(self, request: dict) -> dict:
+        """
+        Reply to a single request
+
+        :param request: decoded request line
+        :type request: dict
+        :return: reply to encode
+        :rtype: dict
+        """
+        command = request.get("cmd")
+        if command == "ping":
+            return {"ok": True}
+        if command == "stop":
+            self.done.set()
+            return {"ok": True}
+        if command == "get" and isinstance(request.get("account"), str):
+            account: str = request["account"]
+            try:
+                if self.vault is not None:
+                    passwords: list[str] = [
+                        self.fer.decrypt(token).decode()
+                        for token in self.vault.get(account)
+                    ]
+                elif exists(KEYS_FILE):
+                    passwords = lookup(self.fer, self.idx_key, account)
+                else:
+                    passwords = []
+            except InvalidToken:
+                return {"ok": False,
+                        "error": "Entry not encrypted with the unlocked key"}
+            return {"ok": True, "passwords": passwords}
+
+        return {"ok": False, "error": "Invalid request"}
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        self.clients[writer] = asyncio.current_task()
+        try:
+            if peer_uid(writer.get_extra_info("socket")) not in (
+                    None, os.getuid()):
+                return
+            while line := await reader.readline():
+                self.touch()
+                try:
+                    reply: dict = self.answer(json.loads(line))
+                except (ValueError, AttributeError):
+                    reply = {"ok": False, "error": "Invalid request"}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            del self.clients[writer]
+            writer.close()
+
+    async def serve(self, path: str) -> None:
+        """
+        Listens on `path` until idle or stopped, then removes the socket
+
+        :param path: path of the Unix socket
+        :type path: str
+        :return: None
+        :rtype: NoneType
+        """
+        if exists(path):
+            os.remove(path)
+        # Nobody but the owner can connect to the socket
+        old_mask: int = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self.handle, path)
+        finally:
+            os.umask(old_mask)
+        self.touch()
+        async with server:
+            await self.done.wait()
+            # Hanging up lets every connection end on its own
+            for writer in self.clients:
+                writer.close()
+            await asyncio.gather(*self.clients.values())
+        os.remove(path)
+        if self.vault is not None:
+            self.vault.close()
+
+
+def request(message: dict, path: str | None = None) -> dict:
+    """
+    Sends one request to a running agent
+
+    :param message: request to encode
+    :type message: dict
+    :param path: path of the Unix socket, `socket_path()` if None
+    :type path: str | None
+    :return: decoded reply
+    :rtype: dict
+    """
+    path = path or socket_path()
+    # Nothing is sent to a socket another user could have put in place
+    if os.lstat(path).st_uid != os.getuid():
+        raise PermissionError(f"'{path}' belongs to another user")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        if peer_uid(client) not in (None, os.getuid()):
+            raise PermissionError("The agent runs as another user")
+        client.sendall(json.dumps(message).encode() + b"\n")
+        with client.makefile("rb") as reply:
+            return json.loads(reply.readline())
+
+
+def start(timeout: float, foreground: bool) -> None:
+    """
+    Unlocks the vault and runs the agent, in the background by default
+
+    :param timeout: seconds without requests before locking
+    :type timeout: float
+    :param foreground: keep the agent attached to the terminal
+    :type foreground: bool
+    :return: None
+    :rtype: NoneType
+    """
+    # Imported here so the agent module stays free of the interactive script
+    from password_manager import unlock
+
+    if not exists(KEY_FILE):
+        print(f"Unable to find '{KEY_FILE}'")
+        sys.exit(1)
+    key: bytes | None = unlock(getpass("Enter MPass: "), KEY_FILE)
+    if key is None:
+        print("Invalid MPass")
+        sys.exit(1)
+    path: str = socket_path()
+    print(f"KEYS_AGENT_SOCK={path}; export KEYS_AGENT_SOCK;")
+    if not foreground:
+        if os.fork() > 0:
+            return
+        os.setsid()
+        with open(os.devnull, "r+b") as devnull:
+            for stream in (sys.stdin, sys.stdout, sys.stderr):
+                os.dup2(devnull.fileno(), stream.fileno())
+    asyncio.run(Agent(key, timeout).serve(path))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    starting = commands.add_parser("start", help="unlock and run the agent")
+    starting.add_argument("-t", "--timeout", type=float, default=IDLE_TIMEOUT,
+                          help="seconds idle before locking")
+    starting.add_argument("-f", "--foreground", action="store_true")
+    getting = commands.add_parser("get", help="print an account password")
+    getting.add_argument("account")
+    commands.add_parser("stop", help="lock and stop the agent")
+    args = parser.parse_args()
+
+    if args.command == "start":
+        start(args.timeout, args.foreground)
+        return
+    try:
+        if args.command == "stop":
+            request({"cmd": "stop"})
+            return
+        reply: dict = request({"cmd": "get", "account": args.account})
+    except (FileNotFoundError, ConnectionRefusedError):
+        print("No agent running, start one with 'start'")
+        sys.exit(1)
+    except PermissionError as error:
+        print(f"Refusing to talk to the agent: {error}")
+        sys.exit(1)
+    if not reply.get("ok"):
+        print(reply.get("error", "Invalid reply"))
+        sys.exit(1)
+    if not reply.get("passwords"):
+        print(f"No entry found for '{args.account}'")
+        sys.exit(1)
+    for pwd in reply["passwords"]:
+        print(args.account, pwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,623 @@
+"""Compact binary format for the vault, read without copies.
+
+keys.txt stores every Fernet token in base64 text next to its account, so
+each line is a third larger than the token and is decoded, split and encoded
+again on every read. keys.bin stores the same entries as records of raw
+bytes between a versioned header and a footer:
+
+    header   8s magic, H version, 6x padding
+    record   H account length, I token length, account, raw token
+    footer   Q offset of every record
+    trailer  Q records, Q offset of the footer, 8s end magic
+
+The reader maps the file and locates every record at once from the footer
+with numpy, falling back to walking the length prefixes when the footer is
+missing. Entries are handed out as `memoryview` slices of the map, so
+nothing is copied until it is used.
+
+Full passes run with numpy. Looking up an account compares the names of
+every record a byte at a time. Tokens are checked and decrypted a page of
+records at a time, as raw bytes, without the base64 round trip of
+`Fernet.decrypt`. Each HMAC is checked on its own. Then the AES-CBC blocks of
+the whole page are deciphered in one call and xor-ed with the blocks before
+them.
+"""
+import argparse
+import base64
+import hmac
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from itertools import islice
+from os.path import exists
+from time import perf_counter
+from typing import Iterable, Iterator
+
+import numpy as np
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from vault_commit import locked
+from vault_import import sync_directory
+from vault_index import KEYS_FILE
+from vault_rotate import remove_sidecars
+
+BINARY_FILE: str = "keys.bin"
+MAGIC: bytes = b"KEYSBIN\x00"
+VERSION: int = 1
+HEADER: struct.Struct = struct.Struct("<8sH6x")
+# Account length and token length, followed by both
+RECORD: struct.Struct = struct.Struct("<HI")
+END_MAGIC: bytes = b"KEYSEND\x00"
+# Records, offset of the footer and end magic
+TRAILER: struct.Struct = struct.Struct("<QQ8s")
+WRITE_BUFFER: int = 1 << 20
+# Records handled at a time by the readers
+SPAN_PAGE: int = 4096
+# Version, timestamp and IV before the ciphertext of a Fernet token, HMAC
+# after it, and the AES block size
+TOKEN_HEAD: int = 25
+TOKEN_MAC: int = 32
+BLOCK: int = 16
+# Entries decrypted by the benchmark, decrypting is too slow for all of them
+DECRYPT_SAMPLE: int = 20_000
+# Runs of every benchmark measure, the fastest is kept
+REPEATS: int = 3
+
+
+def pack_record(account: bytes, token: bytes) -> bytes:
+    """
+    Binary record of an entry
+
+    :param account: account name, utf-8 encoded
+    :type account: bytes
+    :param token: raw Fernet token, base64 decoded
+    :type token: bytes
+    :return: length prefixes, account and token
+    :rtype: bytes
+    """
+    return RECORD.pack(len(account), len(token)) + account + token
+
+
+def walk(data: memoryview, end: int) -> np.ndarray:
+    """
+    Offsets of every record, following the length prefixes one by one
+
+    :param data: whole keys.bin, header included
+    :type data: memoryview
+    :param end: where the records stop
+    :type end: int
+    :return: record offsets
+    :rtype: np.ndarray
+    """
+    offsets: array = array("Q")
+    unpack = RECORD.unpack_from
+    pos: int = HEADER.size
+    while pos < end:
+        offsets.append(pos)
+        account_size, token_size = unpack(data, pos)
+        pos += RECORD.size + account_size + token_size
+    return np.array(offsets, dtype=np.int64)
+
+
+def spans(data: memoryview) -> np.ndarray:
+    """
+    Where the account and token of every record start and end
+
+    :param data: whole keys.bin, header included
+    :type data: memoryview
+    :return: one row per record: account start, token start, token end
+    :rtype: np.ndarray
+    """
+    magic, version = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a version {VERSION} binary vault")
+    end: int = len(data)
+    offsets: np.ndarray | None = None
+    if end >= HEADER.size + TRAILER.size:
+        count, footer, end_magic = TRAILER.unpack_from(data,
+                                                       end - TRAILER.size)
+        if (end_magic == END_MAGIC
+                and footer + 8 * count + TRAILER.size == end):
+            offsets = np.frombuffer(data, dtype="<u8", count=count,
+                                    offset=footer).astype(np.int64)
+            end = footer
+    if offsets is None:
+        offsets = walk(data, end)
+    raw: np.ndarray = np.frombuffer(data, dtype=np.uint8, count=end)
+    # Records follow each other, so a token ends where the next record
+    # starts and only the little-endian account lengths are read
+    account_size: np.ndarray = (raw[offsets].astype(np.int64)
+                                | raw[offsets + 1].astype(np.int64) << 8)
+    del raw
+    account_start: np.ndarray = offsets + RECORD.size
+    token_start: np.ndarray = account_start + account_size
+    token_end: np.ndarray = np.append(offsets[1:], end)
+
+    return np.stack([account_start, token_start, token_end], axis=1)
+
+
+def gather(raw: np.ndarray, starts: np.ndarray,
+           ends: np.ndarray) -> np.ndarray:
+    """
+    Bytes of every range, one after the other
+
+    :param raw: bytes to read from
+    :type raw: np.ndarray
+    :param starts: first byte of every range, none of them empty
+    :type starts: np.ndarray
+    :param ends: byte after the last one of every range
+    :type ends: np.ndarray
+    :return: concatenated ranges
+    :rtype: np.ndarray
+    """
+    bounds: np.ndarray = np.cumsum(ends - starts)
+    # Steps of one inside a range, a jump to the next range after its end
+    steps: np.ndarray = np.ones(int(bounds[-1]), dtype=np.int64)
+    steps[0] = starts[0]
+    steps[bounds[:-1]] = starts[1:] - ends[:-1] + 1
+    return raw[np.cumsum(steps)]
+
+
+def records(data: memoryview) -> Iterator[tuple[memoryview, memoryview]]:
+    """
+    Account and raw token of every record, as slices of `data`
+
+    :param data: whole keys.bin, header included
+    :type data: memoryview
+    :return: generator of account and token views
+    :rtype: Iterator[tuple[memoryview, memoryview]]
+    """
+    for account, token, end in spans(data).tolist():
+        yield data[account:token], data[token:end]
+
+
+class BinaryVault:
+    """
+    Memory mapped keys.bin
+    """
+
+    def __init__(self, path: str = BINARY_FILE) -> None:
+        self.file = open(path, "rb")
+        self.map: mmap.mmap = mmap.mmap(self.file.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+        self.data: memoryview = memoryview(self.map)
+        self.spans: np.ndarray = spans(self.data)
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def entry(self, number: int) -> tuple[memoryview, memoryview]:
+        """
+        Account and raw token of the N-th entry
+
+        :param number: entry number, from 0
+        :type number: int
+        :return: account and token views
+        :rtype: tuple[memoryview, memoryview]
+        """
+        account, token, end = self.spans[number].tolist()
+        return self.data[account:token], self.data[token:end]
+
+    def __enter__(self) -> "BinaryVault":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # Arrays built on the map hold it too
+        self.spans = np.empty((0, 3), dtype=np.int64)
+        self.data.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # Views still held by the caller keep the map alive until they
+            # are dropped
+            pass
+        self.file.close()
+
+    def __iter__(self) -> Iterator[tuple[memoryview, memoryview]]:
+        # Converts the spans a page at a time, a partial walk stops early
+        for page in self.pages():
+            for account, token, end in page.tolist():
+                yield self.data[account:token], self.data[token:end]
+
+    def pages(self) -> Iterator[np.ndarray]:
+        """
+        Spans of the records, `SPAN_PAGE` at a time
+
+        :return: generator of account start, token start and token end rows
+        :rtype: Iterator[np.ndarray]
+        """
+        for first in range(0, len(self.spans), SPAN_PAGE):
+            yield self.spans[first:first + SPAN_PAGE]
+
+    def find(self, account: str) -> list[memoryview]:
+        """
+        Raw tokens of an account, oldest first
+
+        Compares the names of every record with numpy, a byte at a time,
+        keeping only the records that still match.
+
+        :param account: account/site name
+        :type account: str
+        :return: token views
+        :rtype: list[memoryview]
+        """
+        name: bytes = account.encode()
+        raw: np.ndarray = np.frombuffer(self.data, dtype=np.uint8)
+        found: np.ndarray = np.flatnonzero(
+            self.spans[:, 1] - self.spans[:, 0] == len(name)
+        )
+        positions: np.ndarray = self.spans[found, 0]
+        for byte in name:
+            same: np.ndarray = raw[positions] == byte
+            found = found[same]
+            positions = positions[same] + 1
+        del raw
+        return [self.data[token:end]
+                for token, end in self.spans[found, 1:].tolist()]
+
+    def lines(self) -> Iterator[bytes]:
+        """
+        Every entry formatted as a keys.txt line, for `export()`
+
+        Only the text format needs the tokens in base64; `decrypt()`
+        works on the raw tokens.
+
+        :return: generator of `account|token` lines
+        :rtype: Iterator[bytes]
+        """
+        for account, token in self:
+            yield (bytes(account) + b"|" + base64.urlsafe_b64encode(token)
+                   + b"\n")
+
+    def decrypt(self, key: bytes) -> Iterator[tuple[str, str]]:
+        """
+        Every account and its decrypted password
+
+        Applies the checks of `Fernet.decrypt` to the raw tokens: version,
+        HMAC, block alignment and padding, raising InvalidToken if any fail.
+
+        :param key: main key, as given to `Fernet`
+        :type key: bytes
+        :return: generator of account and password pairs
+        :rtype: Iterator[tuple[str, str]]
+        """
+        secret: bytes = base64.urlsafe_b64decode(key)
+        signing: bytes = secret[:16]
+        aes: algorithms.AES = algorithms.AES(secret[16:])
+        data: memoryview = self.data
+        for page in self.pages():
+            raw: np.ndarray = np.frombuffer(data, dtype=np.uint8)
+            starts: np.ndarray = page[:, 1]
+            ends: np.ndarray = page[:, 2]
+            sizes: np.ndarray = ends - starts - TOKEN_HEAD - TOKEN_MAC
+            if ((sizes < BLOCK) | (sizes % BLOCK != 0)
+                    | (raw[starts] != 0x80)).any():
+                raise InvalidToken
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                if not hmac.compare_digest(
+                    hmac.digest(signing, data[start:end - TOKEN_MAC],
+                                "sha256"),
+                    data[end - TOKEN_MAC:end]
+                ):
+                    raise InvalidToken
+            # CBC decryption of every block only needs the block before it,
+            # so the blocks of the whole page go through AES in one call
+            ciphertext: np.ndarray = gather(raw, starts + TOKEN_HEAD,
+                                            ends - TOKEN_MAC)
+            chained: np.ndarray = gather(raw, starts + TOKEN_HEAD - BLOCK,
+                                         ends - TOKEN_MAC - BLOCK)
+            del raw
+            decryptor = Cipher(aes, modes.ECB()).decryptor()
+            padded: np.ndarray = chained ^ np.frombuffer(
+                decryptor.update(ciphertext.tobytes()), dtype=np.uint8
+            )
+            bounds: np.ndarray = np.cumsum(sizes)
+            pads: np.ndarray = padded[bounds - 1].astype(np.int64)
+            if ((pads < 1) | (pads > BLOCK)).any():
+                raise InvalidToken
+            for back in range(1, BLOCK):
+                inside: np.ndarray = pads > back
+                if (padded[bounds[inside] - 1 - back]
+                        != pads[inside]).any():
+                    raise InvalidToken
+            plain: bytes = padded.tobytes()
+            for account, token, first, last in zip(
+                page[:, 0].tolist(), starts.tolist(),
+                (bounds - sizes).tolist(), (bounds - pads).tolist()
+            ):
+                yield (str(data[account:token], "utf-8"),
+                       str(plain[first:last], "utf-8"))
+
+
+def write_binary(entries: Iterable[tuple[bytes, bytes]], path: str) -> int:
+    """
+    Writes keys.bin from account and raw token pairs
+
+    :param entries: account and raw token pairs
+    :type entries: Iterable[tuple[bytes, bytes]]
+    :param path: binary file to write
+    :type path: str
+    :return: entries written
+    :rtype: int
+    """
+    offsets: array = array("Q")
+    pos: int = HEADER.size
+    with open(path, "wb", buffering=WRITE_BUFFER) as out:
+        out.write(HEADER.pack(MAGIC, VERSION))
+        for account, token in entries:
+            offsets.append(pos)
+            pos += out.write(pack_record(account, token))
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        out.write(offsets.tobytes())
+        out.write(TRAILER.pack(len(offsets), pos, END_MAGIC))
+
+    return len(offsets)
+
+
+def text_entries(keys_file: str = KEYS_FILE) -> Iterator[tuple[bytes, bytes]]:
+    """
+    Account and raw token of every line of keys.txt
+
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :return: generator of account and raw token pairs
+    :rtype: Iterator[tuple[bytes, bytes]]
+    """
+    with open(keys_file, "rb") as keys:
+        for line in keys:
+            usr, _, pwd = line.rstrip().partition(b"|")
+            if usr:
+                yield usr, base64.urlsafe_b64decode(pwd)
+
+
+def to_binary(keys_file: str = KEYS_FILE, path: str = BINARY_FILE) -> int:
+    """
+    Converts keys.txt into keys.bin
+
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param path: binary file to write
+    :type path: str
+    :return: entries converted
+    :rtype: int
+    """
+    return write_binary(text_entries(keys_file), path)
+
+
+def to_text(path: str = BINARY_FILE, keys_file: str = KEYS_FILE) -> int:
+    """
+    Converts keys.bin back into keys.txt, through a synced temporary file
+
+    :param path: binary file to read
+    :type path: str
+    :param keys_file: path of the passwords file to write
+    :type keys_file: str
+    :return: entries converted
+    :rtype: int
+    """
+    folder: str = os.path.dirname(os.path.abspath(keys_file))
+    count: int = 0
+    handle, tmp = tempfile.mkstemp(dir=folder, prefix=".keys-", suffix=".tmp")
+    # Appends made while converting would be lost by the rename
+    with locked(keys_file):
+        try:
+            with BinaryVault(path) as vault, \
+                    open(handle, "wb", buffering=WRITE_BUFFER) as out:
+                for line in vault.lines():
+                    out.write(line)
+                    count += 1
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, keys_file)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        # Their offsets point into the keys.txt just replaced
+        remove_sidecars(keys_file)
+    sync_directory(folder)
+
+    return count
+
+
+def scan_text(keys_file: str, account: str) -> int:
+    """
+    Looks an account up in keys.txt the way the text readers do without an
+    index, splitting every line
+
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param account: account/site name
+    :type account: str
+    :return: entries of the account
+    :rtype: int
+    """
+    found: int = 0
+    with open(keys_file, "rb") as keys:
+        for line in keys:
+            usr, _, pwd = line.rstrip().partition(b"|")
+            if usr.decode() == account:
+                found += 1
+    return found
+
+
+def locate_binary(path: str) -> int:
+    """
+    Opens keys.bin and locates every record, touching no token
+
+    Not a scan: it only measures what opening the vault costs.
+
+    :param path: binary file to read
+    :type path: str
+    :return: records located
+    :rtype: int
+    """
+    with BinaryVault(path) as vault:
+        return len(vault)
+
+
+def scan_binary(path: str, account: str) -> int:
+    """
+    Looks an account up in keys.bin
+
+    :param path: binary file to read
+    :type path: str
+    :param account: account/site name
+    :type account: str
+    :return: entries of the account
+    :rtype: int
+    """
+    with BinaryVault(path) as vault:
+        return len(vault.find(account))
+
+
+def decrypt_text(fer: Fernet, keys_file: str, limit: int) -> int:
+    """
+    Decrypts the first entries of keys.txt
+
+    :param fer: Fernet wrapper from main key
+    :type fer: Fernet
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param limit: entries to decrypt
+    :type limit: int
+    :return: total password bytes
+    :rtype: int
+    """
+    total: int = 0
+    with open(keys_file, "rb") as keys:
+        for line in islice(keys, limit):
+            usr, _, pwd = line.rstrip().partition(b"|")
+            total += len(fer.decrypt(pwd))
+    return total
+
+
+def decrypt_binary(key: bytes, path: str, limit: int) -> int:
+    """
+    Decrypts the first entries of keys.bin
+
+    :param key: main key
+    :type key: bytes
+    :param path: binary file to read
+    :type path: str
+    :param limit: entries to decrypt
+    :type limit: int
+    :return: total password bytes
+    :rtype: int
+    """
+    total: int = 0
+    with BinaryVault(path) as vault:
+        for _, password in islice(vault.decrypt(key), limit):
+            total += len(password)
+    return total
+
+
+def best_time(measure, *args) -> float:
+    """
+    Fastest of `REPEATS` runs of a benchmark measure
+
+    :param measure: function to time
+    :param args: its arguments
+    :return: seconds of the fastest run
+    :rtype: float
+    """
+    times: list[float] = []
+    for _ in range(REPEATS):
+        start: float = perf_counter()
+        measure(*args)
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def benchmark(count: int, folder: str) -> None:
+    """
+    Compares size, account lookup by full scan and decryption time of both
+    formats
+
+    :param count: entries in the generated vault
+    :type count: int
+    :param folder: where to write both files
+    :type folder: str
+    :return: None
+    :rtype: NoneType
+    """
+    key: bytes = Fernet.generate_key()
+    fer: Fernet = Fernet(key)
+    keys_file: str = os.path.join(folder, KEYS_FILE)
+    path: str = os.path.join(folder, BINARY_FILE)
+    # Encrypting is the slow part, tokens of equal size are reused
+    tokens: list[bytes] = [fer.encrypt(os.urandom(12).hex().encode())
+                           for _ in range(1000)]
+    with open(keys_file, "wb") as keys:
+        for i in range(count):
+            keys.write(f"account{i}.example.com|".encode()
+                       + tokens[i % len(tokens)] + b"\n")
+    start: float = perf_counter()
+    to_binary(keys_file, path)
+    converted: float = perf_counter() - start
+    text_size: int = os.path.getsize(keys_file)
+    binary_size: int = os.path.getsize(path)
+    print(f"{count} entries, converted in {converted:.2f} s")
+    print(f"keys.txt {text_size:,} bytes, keys.bin {binary_size:,} bytes "
+          f"({1 - binary_size / text_size:.0%} smaller)")
+    print(f"keys.bin opened, records located in "
+          f"{best_time(locate_binary, path) * 1000:.1f} ms")
+    # The last account, found after every name was compared
+    account: str = f"account{count - 1}.example.com"
+    for label, scan, target in (("text", scan_text, keys_file),
+                                ("binary", scan_binary, path)):
+        elapsed: float = best_time(scan, target, account)
+        print(f"{label:12} lookup by full scan {elapsed * 1000:8.1f} ms "
+              f"({count / elapsed:,.0f} entries/s)")
+    sample: int = min(count, DECRYPT_SAMPLE)
+    for label, decrypt, secret, target in (
+        ("text", decrypt_text, fer, keys_file),
+        ("binary", decrypt_binary, key, path)
+    ):
+        elapsed = best_time(decrypt, secret, target, sample)
+        print(f"{label:12} decrypt {sample:,} entries in "
+              f"{elapsed * 1000:8.1f} ms ({sample / elapsed:,.0f} entries/s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Convert between keys.txt and the binary keys.bin"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("to-binary", help="write keys.bin from keys.txt")
+    commands.add_parser("to-text", help="write keys.txt from keys.bin")
+    bench = commands.add_parser("bench", help="compare both formats")
+    bench.add_argument("-n", "--entries", type=int, default=1_000_000)
+    for command in commands.choices.values():
+        command.add_argument("--keys", default=KEYS_FILE)
+        command.add_argument("--binary", default=BINARY_FILE)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        with tempfile.TemporaryDirectory() as folder:
+            benchmark(args.entries, folder)
+        return
+    source: str = args.keys if args.command == "to-binary" else args.binary
+    target: str = args.binary if args.command == "to-binary" else args.keys
+    if not exists(source):
+        print(f"Unable to find '{source}'")
+        return
+    if exists(target):
+        print(f"'{target}' already exists, nothing converted")
+        return
+    if args.command == "to-binary":
+        count: int = to_binary(source, target)
+    else:
+        count = to_text(source, target)
+    print(f"Converted {count} entries into '{target}'")
+
+
+if __name__ == "__main__":
+    main()
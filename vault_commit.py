@@ -0,0 +1,271 @@
+"""Locked, durable appends to keys.txt with group commit.
+
+Every append takes an exclusive lock on keys.txt.lock, so lines written by
+concurrent shells never interleave, and returns once the data is synced to
+disk. Syncs are shared: the first writer to take the lock on keys.txt.sync
+syncs everything appended so far and records how far it got, and writers
+queued behind it find their data already covered and skip their own sync.
+
+Within a process, `GroupCommit` also merges the lines of concurrent threads
+arriving within a short window into a single write.
+
+Running this module is a stress test: many processes add entries at once,
+then every entry is checked to be present once and to decrypt correctly.
+"""
+import argparse
+import fcntl
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+from multiprocessing import Pool
+from time import perf_counter, sleep
+from typing import Iterator
+
+from cryptography.fernet import Fernet
+
+from vault_index import KEYS_FILE
+
+# Inode of keys.txt and how many of its bytes are known to be synced
+SYNCED: struct.Struct = struct.Struct("<QQ")
+# Seconds a group waits for more lines before committing
+WINDOW: float = 0.002
+
+
+@contextmanager
+def locked(keys_file: str = KEYS_FILE) -> Iterator[None]:
+    """
+    Holds the exclusive write lock of keys.txt
+
+    Anything rewriting keys.txt as a whole, like the bulk import or key
+    rotation, takes it too so no append falls in between.
+
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :return: context manager releasing the lock on exit
+    :rtype: Iterator[None]
+    """
+    with open(keys_file + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def append(data: bytes, keys_file: str = KEYS_FILE) -> tuple[int, int]:
+    """
+    Appends lines to keys.txt under the write lock, without syncing
+
+    :param data: complete `account|token` lines
+    :type data: bytes
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :return: inode of keys.txt and its size right after the write
+    :rtype: tuple[int, int]
+    """
+    with locked(keys_file):
+        handle: int = os.open(keys_file,
+                              os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            view: memoryview = memoryview(data)
+            while view:
+                view = view[os.write(handle, view):]
+            stat: os.stat_result = os.fstat(handle)
+        finally:
+            os.close(handle)
+
+    return stat.st_ino, stat.st_size
+
+
+def sync_to(inode: int, end: int, keys_file: str = KEYS_FILE) -> bool:
+    """
+    Makes keys.txt durable up to `end`, unless another writer already did
+
+    :param inode: inode of keys.txt when it was written
+    :type inode: int
+    :param end: size of keys.txt right after the write
+    :type end: int
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :return: True if this call synced the file itself
+    :rtype: bool
+    """
+    handle: int = os.open(keys_file + ".sync", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        state: bytes = os.pread(handle, SYNCED.size, 0)
+        if len(state) == SYNCED.size:
+            synced_inode, synced = SYNCED.unpack(state)
+            if synced_inode == inode and synced >= end:
+                return False
+        keys: int = os.open(keys_file, os.O_RDONLY)
+        try:
+            # Covers every append done so far, not only this one
+            stat: os.stat_result = os.fstat(keys)
+            os.fsync(keys)
+        finally:
+            os.close(keys)
+        os.pwrite(handle, SYNCED.pack(stat.st_ino, stat.st_size), 0)
+        return True
+    finally:
+        os.close(handle)
+
+
+def commit(data: bytes, keys_file: str = KEYS_FILE) -> bool:
+    """
+    Appends lines to keys.txt and returns once they are on disk
+
+    :param data: complete `account|token` lines
+    :type data: bytes
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :return: True if this call synced the file itself
+    :rtype: bool
+    """
+    return sync_to(*append(data, keys_file), keys_file)
+
+
+class GroupCommit:
+    """
+    Commits the lines of concurrent threads together, a write and a sync
+    per group
+    """
+
+    def __init__(self, keys_file: str = KEYS_FILE,
+                 window: float = WINDOW) -> None:
+        self.keys_file: str = keys_file
+        self.window: float = window
+        self.cond: threading.Condition = threading.Condition()
+        self.pending: list[bytes] = []
+        # Groups are numbered, a thread waits for the one holding its lines
+        self.group: int = 0
+        self.done: int = -1
+        self.error: tuple[int, BaseException] | None = None
+        self.leading: bool = False
+        # Groups written and syncs not shared with another process
+        self.commits: int = 0
+        self.syncs: int = 0
+
+    def submit(self, data: bytes) -> None:
+        """
+        Queues lines and returns once the group holding them is on disk
+
+        :param data: complete `account|token` lines
+        :type data: bytes
+        :return: None
+        :rtype: NoneType
+        """
+        with self.cond:
+            self.pending.append(data)
+            group: int = self.group
+            while self.done < group:
+                # Nobody is writing yet, this thread commits the group
+                if not self.leading:
+                    self.leading = True
+                    break
+                self.cond.wait()
+            else:
+                if self.error is not None and self.error[0] == group:
+                    raise self.error[1]
+                return
+        # Lets the other threads join the group before writing it
+        sleep(self.window)
+        with self.cond:
+            batch: bytes = b"".join(self.pending)
+            self.pending = []
+            self.group += 1
+        try:
+            if commit(batch, self.keys_file):
+                self.syncs += 1
+        except BaseException as error:
+            with self.cond:
+                self.error = (group, error)
+            raise
+        finally:
+            with self.cond:
+                self.commits += 1
+                self.done = group
+                self.leading = False
+                self.cond.notify_all()
+
+
+def stress_worker(args: tuple[str, bytes, int, int, int]) -> tuple[int, int]:
+    """
+    Adds `count` entries from `threads` threads of one process
+
+    :param args: keys file, Fernet key, process number, entries and threads
+    :type args: tuple[str, bytes, int, int, int]
+    :return: groups committed and syncs done by this process
+    :rtype: tuple[int, int]
+    """
+    keys_file, key, proc, count, threads = args
+    fer: Fernet = Fernet(key)
+    group: GroupCommit = GroupCommit(keys_file)
+
+    def add(thread: int) -> None:
+        for i in range(thread, count, threads):
+            account: str = f"p{proc}-{i}"
+            token: bytes = fer.encrypt(account.encode())
+            group.submit(account.encode() + b"|" + token + b"\n")
+
+    workers: list[threading.Thread] = [
+        threading.Thread(target=add, args=(thread,))
+        for thread in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return group.commits, group.syncs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Stress concurrent appends to keys.txt"
+    )
+    parser.add_argument("-p", "--processes", type=int, default=8)
+    parser.add_argument("-t", "--threads", type=int, default=4)
+    parser.add_argument("-n", "--entries", type=int, default=500,
+                        help="entries per process")
+    args = parser.parse_args()
+
+    key: bytes = Fernet.generate_key()
+    with tempfile.TemporaryDirectory() as folder:
+        keys_file: str = os.path.join(folder, KEYS_FILE)
+        jobs = [(keys_file, key, proc, args.entries, args.threads)
+                for proc in range(args.processes)]
+        start: float = perf_counter()
+        with Pool(args.processes) as pool:
+            results: list[tuple[int, int]] = pool.map(stress_worker, jobs)
+        elapsed: float = perf_counter() - start
+
+        fer: Fernet = Fernet(key)
+        seen: set[str] = set()
+        corrupt: int = 0
+        with open(keys_file, "rb") as keys:
+            for line in keys:
+                usr, _, pwd = line.rstrip(b"\n").partition(b"|")
+                try:
+                    if fer.decrypt(pwd) != usr:
+                        raise ValueError
+                except Exception:
+                    corrupt += 1
+                    continue
+                if usr.decode() in seen:
+                    corrupt += 1
+                seen.add(usr.decode())
+    commits: int = sum(groups for groups, _ in results)
+    syncs: int = sum(synced for _, synced in results)
+    total: int = args.processes * args.entries
+    print(f"{total} entries from {args.processes} processes x "
+          f"{args.threads} threads in {elapsed:.2f} s")
+    print(f"{total / elapsed:,.0f} entries/s, {commits} group commits "
+          f"({commits / elapsed:,.0f} commits/s, "
+          f"{total / commits:.1f} entries per commit), {syncs} fsyncs")
+    print(f"lost {total - len(seen)}, corrupt or duplicated {corrupt}")
+
+
+if __name__ == "__main__":
+    main()
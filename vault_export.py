@@ -0,0 +1,120 @@
+"""Streaming, multi-threaded export of every entry in keys.txt.
+
+keys.txt is read in chunks of lines that are decrypted on a thread pool, the
+cryptography backend releasing the GIL while it works, and written out in
+their original order. Only a few chunks are in flight at any time, so memory
+stays the same whatever the size of the vault.
+"""
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator, TextIO
+
+from cryptography.fernet import Fernet
+
+from vault_index import KEYS_FILE
+
+# Lines decrypted per task
+CHUNK_LINES: int = 2048
+
+
+def chunked(lines: Iterable[bytes],
+            size: int = CHUNK_LINES) -> Iterator[list[bytes]]:
+    """
+    Groups lines in lists of `size`
+
+    :param lines: raw `account|token` lines
+    :type lines: Iterable[bytes]
+    :param size: lines per chunk
+    :type size: int
+    :return: generator of chunks of lines
+    :rtype: Iterator[list[bytes]]
+    """
+    chunk: list[bytes] = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_chunks(keys_file: str = KEYS_FILE,
+                lines: int = CHUNK_LINES) -> Iterator[list[bytes]]:
+    """
+    Lines of keys.txt, a chunk at a time
+
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param lines: lines per chunk
+    :type lines: int
+    :return: generator of chunks of raw lines
+    :rtype: Iterator[list[bytes]]
+    """
+    with open(keys_file, "rb") as keys:
+        yield from chunked(keys, lines)
+
+
+def decrypt_chunk(fer: Fernet, chunk: list[bytes],
+                  target: Fernet | None = None) -> str:
+    """
+    Decrypts a chunk of lines, optionally encrypting them again
+
+    :param fer: Fernet wrapper from main key
+    :type fer: Fernet
+    :param chunk: raw lines of keys.txt
+    :type chunk: list[bytes]
+    :param target: key to encrypt the passwords with, plaintext if None
+    :type target: Fernet | None
+    :return: `account password` lines, or keys.txt lines under `target`
+    :rtype: str
+    """
+    out: list[str] = []
+    for line in chunk:
+        usr, _, pwd = line.rstrip().partition(b"|")
+        if not usr:
+            continue
+        plain: bytes = fer.decrypt(pwd)
+        if target is None:
+            out.append(f"{usr.decode()} {plain.decode()}\n")
+        else:
+            out.append(f"{usr.decode()}|{target.encrypt(plain).decode()}\n")
+
+    return "".join(out)
+
+
+def export(fer: Fernet, out: TextIO, keys_file: str = KEYS_FILE,
+           target: Fernet | None = None, workers: int | None = None,
+           lines: Iterable[bytes] | None = None) -> None:
+    """
+    Writes every entry of keys.txt, or of `lines`, to `out`, in order
+
+    :param fer: Fernet wrapper from main key
+    :type fer: Fernet
+    :param out: where to write the entries
+    :type out: TextIO
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param target: key to encrypt the passwords with, plaintext if None
+    :type target: Fernet | None
+    :param workers: decrypting threads, one per core if None
+    :type workers: int | None
+    :param lines: `account|token` lines read instead of keys.txt, like
+                  `SQLiteVault.lines()`
+    :type lines: Iterable[bytes] | None
+    :return: None
+    :rtype: NoneType
+    """
+    workers = workers or os.cpu_count() or 1
+    pending: deque[Future] = deque()
+    with ThreadPoolExecutor(workers) as pool:
+        chunks = read_chunks(keys_file) if lines is None else chunked(lines)
+        for chunk in chunks:
+            pending.append(pool.submit(decrypt_chunk, fer, chunk, target))
+            # Keeps every thread busy without reading ahead any further
+            if len(pending) >= 2 * workers:
+                out.write(pending.popleft().result())
+        while pending:
+            out.write(pending.popleft().result())
+    out.flush()
@@ -0,0 +1,194 @@
+"""Bulk import of credentials from CSV or JSON into keys.txt.
+
+Entries are encrypted in batches on a thread pool and written, after a copy
+of the current keys.txt, to a temporary file in large buffered writes. The
+file is synced once and renamed over keys.txt, so an interrupted import
+leaves the vault as it was.
+"""
+import csv
+import json
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from os.path import exists
+from time import perf_counter
+from typing import BinaryIO, Iterable, Iterator
+
+from cryptography.fernet import Fernet
+
+from vault_commit import locked
+from vault_index import KEYS_FILE
+
+# Entries encrypted per task
+BATCH: int = 1024
+# Size of the buffer in front of the temporary file
+WRITE_BUFFER: int = 1 << 20
+
+
+def sync_directory(folder: str) -> None:
+    """
+    Makes the files renamed into a folder durable, where the OS allows it
+
+    :param folder: folder holding the renamed files
+    :type folder: str
+    :return: None
+    :rtype: NoneType
+    """
+    if hasattr(os, "O_DIRECTORY"):
+        directory: int = os.open(folder, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+def text_entry(usr, pwd) -> tuple[str, str]:
+    """
+    An account and password pair, checked to be text
+
+    :param usr: account read from the file
+    :param pwd: password read from the file
+    :return: account and password
+    :rtype: tuple[str, str]
+    """
+    for value in (usr, pwd):
+        if not isinstance(value, str):
+            raise ValueError("Every entry needs an account and a password, "
+                             f"found {type(value).__name__}")
+    return usr, pwd
+
+
+def read_entries(path: str) -> Iterator[tuple[str, str]]:
+    """
+    Accounts and passwords of a CSV or JSON file
+
+    CSV files need `account` and `password` columns. JSON files hold either a
+    list of objects with those keys or an object mapping accounts to
+    passwords.
+
+    :param path: file exported from another password manager
+    :type path: str
+    :return: generator of account and password pairs
+    :rtype: Iterator[tuple[str, str]]
+    """
+    try:
+        if path.lower().endswith(".json"):
+            with open(path) as file:
+                data = json.load(file)
+            if isinstance(data, dict):
+                for usr, pwd in data.items():
+                    yield text_entry(usr, pwd)
+            else:
+                for entry in data:
+                    yield text_entry(entry["account"], entry["password"])
+            return
+        with open(path, newline="") as file:
+            # Missing cells read as None
+            for row in csv.DictReader(file):
+                yield text_entry(row["account"], row["password"])
+    except (KeyError, TypeError) as error:
+        raise ValueError("Every entry needs an account and a password, "
+                         f"missing {error}") from error
+    except csv.Error as error:
+        raise ValueError(f"Invalid CSV: {error}") from error
+
+
+def encrypt_batch(fer: Fernet, batch: list[tuple[str, str]]) -> str:
+    """
+    keys.txt lines of a batch of entries
+
+    :param fer: Fernet wrapper from main key
+    :type fer: Fernet
+    :param batch: account and password pairs
+    :type batch: list[tuple[str, str]]
+    :return: one `account|token` line per entry
+    :rtype: str
+    """
+    lines: list[str] = []
+    for usr, pwd in batch:
+        if "|" in usr or "\n" in usr or not usr:
+            raise ValueError(f"Invalid account name {usr!r}")
+        lines.append(usr + "|" + fer.encrypt(pwd.encode()).decode() + "\n")
+
+    return "".join(lines)
+
+
+def batches(entries: Iterable[tuple[str, str]],
+            size: int = BATCH) -> Iterator[list[tuple[str, str]]]:
+    """
+    Groups entries in lists of `size`
+
+    :param entries: account and password pairs
+    :type entries: Iterable[tuple[str, str]]
+    :param size: entries per list
+    :type size: int
+    :return: generator of batches
+    :rtype: Iterator[list[tuple[str, str]]]
+    """
+    batch: list[tuple[str, str]] = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_entries(fer: Fernet, entries: Iterable[tuple[str, str]],
+                   keys_file: str = KEYS_FILE,
+                   workers: int | None = None) -> tuple[int, float]:
+    """
+    Appends entries to keys.txt through a synced temporary file
+
+    :param fer: Fernet wrapper from main key
+    :type fer: Fernet
+    :param entries: account and password pairs
+    :type entries: Iterable[tuple[str, str]]
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param workers: encrypting threads, one per core if None
+    :type workers: int | None
+    :return: entries imported and entries per second
+    :rtype: tuple[int, float]
+    """
+    workers = workers or os.cpu_count() or 1
+    folder: str = os.path.dirname(os.path.abspath(keys_file))
+    start: float = perf_counter()
+    count: int = 0
+    handle, tmp = tempfile.mkstemp(dir=folder, prefix=".keys-", suffix=".tmp")
+    out: BinaryIO = open(handle, "wb", buffering=WRITE_BUFFER)
+    try:
+        # Appends made while copying keys.txt would be lost by the rename
+        with locked(keys_file):
+            with out:
+                if exists(keys_file):
+                    with open(keys_file, "rb") as keys:
+                        shutil.copyfileobj(keys, out, WRITE_BUFFER)
+                        # Keeps a last line without newline off the first
+                        # imported one
+                        if keys.tell():
+                            keys.seek(-1, os.SEEK_END)
+                            if keys.read(1) != b"\n":
+                                out.write(b"\n")
+                pending: deque[Future] = deque()
+                with ThreadPoolExecutor(workers) as pool:
+                    for batch in batches(entries):
+                        count += len(batch)
+                        pending.append(pool.submit(encrypt_batch, fer, batch))
+                        if len(pending) >= 2 * workers:
+                            out.write(pending.popleft().result().encode())
+                    while pending:
+                        out.write(pending.popleft().result().encode())
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, keys_file)
+    except BaseException:
+        out.close()
+        os.remove(tmp)
+        raise
+    sync_directory(folder)
+
+    return count, count / (perf_counter() - start)
@@ -0,0 +1,185 @@
+"""Persisted index of the accounts stored in keys.txt.
+
+Maps a keyed hash of every account name to the offset of its line in
+keys.txt, so looking up one account only reads and decrypts that line. The
+hash is an HMAC under a key derived from the main key, so the index reveals
+nothing about the account names without it.
+
+The index file starts with a header holding how many bytes of keys.txt it
+covers and how many records follow, each a fixed-width hash and offset.
+Lines appended to keys.txt since are indexed on the next update.
+"""
+import hashlib
+import hmac
+import os
+import struct
+from os.path import exists
+
+from cryptography.fernet import Fernet
+
+KEYS_FILE: str = "keys.txt"
+INDEX_FILE: str = "keys.idx"
+MAGIC: bytes = b"KEYSIDX\x01"
+# Magic, bytes of keys.txt covered by the index and number of records
+HEADER: struct.Struct = struct.Struct("<8sQQ")
+HASH_SIZE: int = 16
+# Account hash and offset of its line in keys.txt
+RECORD: struct.Struct = struct.Struct(f"<{HASH_SIZE}sQ")
+
+
+def index_key(key: bytes) -> bytes:
+    """
+    Derives the key hashing account names from the main key
+
+    :param key: main key, as stored in the `.key` file
+    :type key: bytes
+    :return: HMAC key of the index
+    :rtype: bytes
+    """
+    return hmac.new(key, b"keys.txt account index", hashlib.sha256).digest()
+
+
+def account_hash(idx_key: bytes, account: str) -> bytes:
+    """
+    Keyed hash of an account name, as stored in the index
+
+    :param idx_key: returned value from `index_key()` function
+    :type idx_key: bytes
+    :param account: account/site name
+    :type account: str
+    :return: truncated HMAC of the account
+    :rtype: bytes
+    """
+    digest: bytes = hmac.new(idx_key, account.encode(), hashlib.sha256)
+    return digest.digest()[:HASH_SIZE]
+
+
+def index_lines(idx_key: bytes, data: bytes,
+                offset: int) -> tuple[list[bytes], int]:
+    """
+    Index records of the complete lines in a chunk of keys.txt
+
+    :param idx_key: returned value from `index_key()` function
+    :type idx_key: bytes
+    :param data: content of keys.txt starting at `offset`
+    :type data: bytes
+    :param offset: position of `data` in keys.txt
+    :type offset: int
+    :return: packed records and the offset right after the last full line
+    :rtype: tuple[list[bytes], int]
+    """
+    records: list[bytes] = []
+    start: int = 0
+    while (end := data.find(b"\n", start)) != -1:
+        usr, _, _ = data[start:end].partition(b"|")
+        records.append(RECORD.pack(account_hash(idx_key, usr.decode()),
+                                   offset + start))
+        start = end + 1
+
+    return records, offset + start
+
+
+def update_index(idx_key: bytes, keys_file: str = KEYS_FILE,
+                 index_file: str = INDEX_FILE) -> None:
+    """
+    Indexes the lines appended to keys.txt since the last update, rebuilding
+    the index when keys.txt was rewritten or the index is unusable
+
+    :param idx_key: returned value from `index_key()` function
+    :type idx_key: bytes
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param index_file: path of the index
+    :type index_file: str
+    :return: None
+    :rtype: NoneType
+    """
+    size: int = os.path.getsize(keys_file) if exists(keys_file) else 0
+    covered: int = -1
+    count: int = 0
+    if exists(index_file):
+        with open(index_file, "rb") as idx:
+            header: bytes = idx.read(HEADER.size)
+        if len(header) == HEADER.size:
+            magic, covered, count = HEADER.unpack(header)
+            if magic != MAGIC:
+                covered = -1
+    if covered == size:
+        return
+    if not 0 <= covered < size:
+        # Shrunk or never indexed, start over
+        covered, count = 0, 0
+
+    with open(keys_file, "rb") as keys:
+        keys.seek(covered)
+        records, covered = index_lines(idx_key, keys.read(), covered)
+    mode: str = "r+b" if count else "wb"
+    with open(index_file, mode) as idx:
+        # Drops records left over by an update interrupted before its header
+        idx.seek(HEADER.size + count * RECORD.size)
+        idx.truncate()
+        idx.write(b"".join(records))
+        idx.flush()
+        idx.seek(0)
+        idx.write(HEADER.pack(MAGIC, covered, count + len(records)))
+
+
+def find_offsets(idx_key: bytes, account: str,
+                 index_file: str = INDEX_FILE) -> list[int]:
+    """
+    Offsets in keys.txt of every line stored for an account
+
+    :param idx_key: returned value from `index_key()` function
+    :type idx_key: bytes
+    :param account: account/site name
+    :type account: str
+    :param index_file: path of the index
+    :type index_file: str
+    :return: offsets in the order the lines were added
+    :rtype: list[int]
+    """
+    target: bytes = account_hash(idx_key, account)
+    with open(index_file, "rb") as idx:
+        data: bytes = idx.read()
+    end: int = HEADER.size + HEADER.unpack_from(data)[2] * RECORD.size
+    offsets: list[int] = []
+    pos: int = data.find(target, HEADER.size, end)
+    while pos != -1:
+        # Only a match at the start of a record counts
+        if (pos - HEADER.size) % RECORD.size == 0:
+            offsets.append(RECORD.unpack_from(data, pos)[1])
+        pos = data.find(target, pos + 1, end)
+
+    return offsets
+
+
+def lookup(fer: Fernet, idx_key: bytes, account: str,
+           keys_file: str = KEYS_FILE,
+           index_file: str = INDEX_FILE) -> list[str]:
+    """
+    Decrypted passwords of an account, decrypting only its own lines
+
+    :param fer: Fernet wrapper from main key
+    :type fer: Fernet
+    :param idx_key: returned value from `index_key()` function
+    :type idx_key: bytes
+    :param account: account/site name
+    :type account: str
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param index_file: path of the index
+    :type index_file: str
+    :return: passwords stored for the account, oldest first
+    :rtype: list[str]
+    """
+    update_index(idx_key, keys_file, index_file)
+    passwords: list[str] = []
+    with open(keys_file, "rb") as keys:
+        for offset in find_offsets(idx_key, account, index_file):
+            keys.seek(offset)
+            usr, _, pwd = keys.readline().rstrip().partition(b"|")
+            # Guards against a hash collision
+            if usr.decode() == account:
+                passwords.append(fer.decrypt(pwd).decode())
+
+    return passwords
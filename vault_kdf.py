@@ -0,0 +1,187 @@
+"""Pluggable key derivation for the main key, with per-host calibration.
+
+Both backends come with `cryptography`: PBKDF2-SHA256, tuned through its
+iteration count, and the memory-hard scrypt, tuned through its cost `n`.
+`calibrate()` times a derivation on this machine and scales the parameters
+to reach a target time.
+
+The algorithm, its parameters and the salt go on the fourth line of the
+`.key` file, as `name$param=value,...$salt`. Files written before that line
+existed derived their key with PBKDF2 at 600000 iterations.
+"""
+import argparse
+import base64
+import os
+from time import perf_counter
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+ALGORITHMS: tuple[str, ...] = ("pbkdf2", "scrypt")
+# Parameters of `.key` files holding no KDF line
+LEGACY: tuple[str, dict[str, int]] = ("pbkdf2", {"iterations": 600000})
+# Seconds a derivation should take once calibrated
+TARGET: float = 0.25
+# Largest scrypt cost tried, 128 * r * n bytes of memory: 1 GiB with r = 8
+MAX_SCRYPT_N: int = 1 << 20
+
+
+def derive(password: bytes, salt: bytes, algorithm: str,
+           params: dict[str, int]) -> bytes:
+    """
+    Derives a Fernet key from a password
+
+    :param password: secret to derive the key from
+    :type password: bytes
+    :param salt: random salt stored next to the parameters
+    :type salt: bytes
+    :param algorithm: one of `ALGORITHMS`
+    :type algorithm: str
+    :param params: `iterations` for pbkdf2, `n`, `r` and `p` for scrypt
+    :type params: dict[str, int]
+    :return: main key, base64 encoded
+    :rtype: bytes
+    """
+    if algorithm == "pbkdf2":
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt,
+                         iterations=params["iterations"])
+    elif algorithm == "scrypt":
+        kdf = Scrypt(salt=salt, length=32, n=params["n"], r=params["r"],
+                     p=params["p"])
+    else:
+        raise ValueError(f"Unknown key derivation {algorithm!r}")
+    return base64.urlsafe_b64encode(kdf.derive(password))
+
+
+def timed(algorithm: str, params: dict[str, int], repeat: int = 3) -> float:
+    """
+    Seconds a derivation takes on this machine, best of `repeat` runs
+
+    :param algorithm: one of `ALGORITHMS`
+    :type algorithm: str
+    :param params: parameters of the derivation
+    :type params: dict[str, int]
+    :param repeat: derivations timed
+    :type repeat: int
+    :return: shortest elapsed time
+    :rtype: float
+    """
+    best: float = float("inf")
+    for _ in range(repeat):
+        start: float = perf_counter()
+        derive(b"calibration", os.urandom(16), algorithm, params)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def calibrate(algorithm: str = "pbkdf2",
+              target: float = TARGET) -> dict[str, int]:
+    """
+    Parameters making a derivation take about `target` seconds here
+
+    PBKDF2 scales linearly with its iterations, so a short run is enough to
+    pick them. scrypt doubles `n`, and its memory, while it stays under.
+
+    :param algorithm: one of `ALGORITHMS`
+    :type algorithm: str
+    :param target: seconds a derivation should take
+    :type target: float
+    :return: parameters to give to `derive()`
+    :rtype: dict[str, int]
+    """
+    if algorithm == "pbkdf2":
+        probe: int = 50_000
+        elapsed: float = timed(algorithm, {"iterations": probe})
+        # Never below the iterations of existing vaults
+        iterations: int = max(int(probe * target / elapsed),
+                              LEGACY[1]["iterations"])
+        return {"iterations": iterations}
+    if algorithm == "scrypt":
+        params: dict[str, int] = {"n": 1 << 14, "r": 8, "p": 1}
+        # Stops at the largest cost staying under the target
+        while (params["n"] < MAX_SCRYPT_N
+               and 2 * timed(algorithm, params) <= target):
+            params["n"] <<= 1
+        return params
+    raise ValueError(f"Unknown key derivation {algorithm!r}")
+
+
+def dump_params(algorithm: str, params: dict[str, int], salt: bytes) -> bytes:
+    """
+    KDF line of the `.key` file
+
+    :param algorithm: one of `ALGORITHMS`
+    :type algorithm: str
+    :param params: parameters of the derivation
+    :type params: dict[str, int]
+    :param salt: salt of the derivation
+    :type salt: bytes
+    :return: `name$param=value,...$salt` without newline
+    :rtype: bytes
+    """
+    values: str = ",".join(f"{name}={value}"
+                           for name, value in params.items())
+    return (f"{algorithm}${values}$".encode()
+            + base64.urlsafe_b64encode(salt))
+
+
+def load_params(line: bytes) -> tuple[str, dict[str, int], bytes | None]:
+    """
+    Algorithm, parameters and salt of a KDF line, legacy ones if empty
+
+    :param line: fourth line of the `.key` file, possibly empty
+    :type line: bytes
+    :return: algorithm, parameters and salt, None when it was not recorded
+    :rtype: tuple[str, dict[str, int], bytes | None]
+    """
+    if not line.strip():
+        return LEGACY[0], dict(LEGACY[1]), None
+    algorithm, values, salt = line.strip().decode().split("$")
+    params: dict[str, int] = {}
+    for value in values.split(","):
+        name, _, number = value.partition("=")
+        params[name] = int(number)
+    return algorithm, params, base64.urlsafe_b64decode(salt)
+
+
+def read_params(file: str) -> tuple[str, dict[str, int], bytes | None]:
+    """
+    KDF recorded in a `.key` file
+
+    :param file: Name of `.key` file
+    :type file: str
+    :return: algorithm, parameters and salt, None when it was not recorded
+    :rtype: tuple[str, dict[str, int], bytes | None]
+    """
+    with open(file, "rb") as key_file:
+        content: list[bytes] = key_file.read().split(b"\n")
+    return load_params(content[3] if len(content) > 3 else b"")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the key derivations on this machine"
+    )
+    parser.add_argument("-a", "--algorithm", choices=ALGORITHMS,
+                        action="append", help="default: every algorithm")
+    parser.add_argument("-t", "--target", type=float, default=TARGET,
+                        help="seconds per derivation")
+    parser.add_argument("-k", "--key-file",
+                        help="also show the KDF recorded in this file")
+    args = parser.parse_args()
+
+    for algorithm in args.algorithm or ALGORITHMS:
+        params: dict[str, int] = calibrate(algorithm, args.target)
+        values: str = ", ".join(f"{name}={value}"
+                                for name, value in params.items())
+        print(f"{algorithm:7} {values:28} "
+              f"{timed(algorithm, params) * 1000:7.1f} ms")
+    if args.key_file:
+        algorithm, params, salt = read_params(args.key_file)
+        recorded: str = "" if salt is not None else " (legacy, not recorded)"
+        print(f"{args.key_file}: {algorithm} {params}{recorded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Random access to the entries of keys.txt through a memory map.
+
+A sidecar file keeps the offset of every line of keys.txt, so the N-th entry
+is a slice of the mapped file between two offsets. Opening the vault maps
+both files without reading them, and reading an entry or a page of entries
+only touches the pages of memory holding them, whatever the size of keys.txt.
+
+The offsets file starts with the same kind of header as the account index:
+how many bytes of keys.txt it covers and how many offsets follow. Lines
+appended since are indexed on the next open.
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+from os.path import exists
+from time import perf_counter
+
+from vault_index import KEYS_FILE
+
+OFFSETS_FILE: str = "keys.off"
+MAGIC: bytes = b"KEYSOFF\x01"
+# Magic, bytes of keys.txt covered and number of offsets
+HEADER: struct.Struct = struct.Struct("<8sQQ")
+OFFSET: struct.Struct = struct.Struct("<Q")
+
+
+def line_offsets(data: mmap.mmap, start: int) -> tuple[array, int]:
+    """
+    Offsets of the complete lines of a mapped file from `start`
+
+    :param data: keys.txt, memory mapped
+    :type data: mmap.mmap
+    :param start: offset of the first line to index
+    :type start: int
+    :return: line offsets, 8 bytes each, and the offset right after the
+             last full line
+    :rtype: tuple[array, int]
+    """
+    offsets: array = array("Q")
+    while (end := data.find(b"\n", start)) != -1:
+        offsets.append(start)
+        start = end + 1
+
+    return offsets, start
+
+
+def update_offsets(keys_file: str = KEYS_FILE,
+                   offsets_file: str = OFFSETS_FILE) -> None:
+    """
+    Indexes the lines appended to keys.txt since the last update, rebuilding
+    the offsets when keys.txt shrank or the file is unusable
+
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param offsets_file: path of the offsets file
+    :type offsets_file: str
+    :return: None
+    :rtype: NoneType
+    """
+    size: int = os.path.getsize(keys_file) if exists(keys_file) else 0
+    covered: int = -1
+    count: int = 0
+    if exists(offsets_file):
+        with open(offsets_file, "rb") as off:
+            header: bytes = off.read(HEADER.size)
+        if len(header) == HEADER.size:
+            magic, covered, count = HEADER.unpack(header)
+            if magic != MAGIC:
+                covered = -1
+    if covered == size:
+        return
+    if not 0 <= covered < size:
+        covered, count = 0, 0
+
+    offsets: array = array("Q")
+    # Empty files can't be mapped
+    if size:
+        with open(keys_file, "rb") as keys:
+            with mmap.mmap(keys.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                offsets, covered = line_offsets(data, covered)
+    mode: str = "r+b" if count else "wb"
+    with open(offsets_file, mode) as off:
+        # Drops offsets left over by an update interrupted before its header
+        off.seek(HEADER.size + count * OFFSET.size)
+        off.truncate()
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        off.write(offsets.tobytes())
+        off.flush()
+        off.seek(0)
+        off.write(HEADER.pack(MAGIC, covered, count + len(offsets)))
+
+
+class MappedVault:
+    """
+    Entries of keys.txt by number, read straight from the memory map
+    """
+
+    def __init__(self, keys_file: str = KEYS_FILE,
+                 offsets_file: str = OFFSETS_FILE) -> None:
+        update_offsets(keys_file, offsets_file)
+        self.keys = open(keys_file, "rb")
+        self.offsets_file = open(offsets_file, "rb")
+        self.data: mmap.mmap | bytes = b""
+        self.offsets: mmap.mmap | bytes = b""
+        if os.path.getsize(keys_file):
+            self.data = mmap.mmap(self.keys.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            self.offsets = mmap.mmap(self.offsets_file.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+        self.covered: int = 0
+        self.count: int = 0
+        if self.offsets:
+            _, self.covered, self.count = HEADER.unpack_from(self.offsets)
+
+    def __enter__(self) -> "MappedVault":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        for mapped in (self.data, self.offsets):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        self.keys.close()
+        self.offsets_file.close()
+
+    def span(self, start: int, stop: int) -> list[int]:
+        """
+        Offsets of entries `start` to `stop` and the end of the last one
+
+        :param start: number of the first entry
+        :type start: int
+        :param stop: number after the last entry, at most `len(self)`
+        :type stop: int
+        :return: `stop - start + 1` offsets in keys.txt
+        :rtype: list[int]
+        """
+        last: int = min(stop, self.count - 1)
+        offsets: list[int] = list(struct.unpack_from(
+            f"<{last - start + 1}Q", self.offsets,
+            HEADER.size + start * OFFSET.size
+        ))
+        if last < stop:
+            offsets.append(self.covered)
+        return offsets
+
+    def page(self, start: int, count: int) -> list[bytes]:
+        """
+        Raw `account|token` lines of up to `count` entries from `start`
+
+        :param start: number of the first entry
+        :type start: int
+        :param count: entries to read
+        :type count: int
+        :return: lines, newline included
+        :rtype: list[bytes]
+        """
+        stop: int = min(start + count, self.count)
+        if not 0 <= start < stop:
+            return []
+        offsets: list[int] = self.span(start, stop)
+        return [self.data[begin:end]
+                for begin, end in zip(offsets, offsets[1:])]
+
+    def entry(self, number: int) -> tuple[str, bytes]:
+        """
+        Account and encrypted password of the N-th entry
+
+        :param number: entry number, from 0
+        :type number: int
+        :return: account and Fernet token
+        :rtype: tuple[str, bytes]
+        """
+        if not 0 <= number < self.count:
+            raise IndexError(f"No entry {number} in {self.count} entries")
+        usr, _, pwd = self.page(number, 1)[0].rstrip().partition(b"|")
+        return usr.decode(), pwd
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Time random reads of keys.txt through the memory map"
+    )
+    parser.add_argument("--keys", default=KEYS_FILE)
+    parser.add_argument("--offsets", default=OFFSETS_FILE)
+    parser.add_argument("-n", "--reads", type=int, default=10_000)
+    args = parser.parse_args()
+
+    if not exists(args.keys):
+        print(f"Unable to find '{args.keys}'")
+        return
+    start: float = perf_counter()
+    update_offsets(args.keys, args.offsets)
+    indexed: float = perf_counter() - start
+    start = perf_counter()
+    with MappedVault(args.keys, args.offsets) as vault:
+        opened: float = perf_counter() - start
+        if not len(vault):
+            print("No entries")
+            return
+        step: int = max(len(vault) // args.reads, 1)
+        start = perf_counter()
+        for number in range(0, step * args.reads, step):
+            vault.entry(number % len(vault))
+        elapsed: float = perf_counter() - start
+        print(f"{len(vault)} entries, {os.path.getsize(args.keys):,} bytes")
+    print(f"index update {indexed * 1000:.1f} ms, "
+          f"open {opened * 1000:.2f} ms, "
+          f"{elapsed / args.reads * 1e6:.2f} us per entry read")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""Rotation of the main key, re-encrypting every entry of the vault.
+
+A new main key is derived with a fresh salt and the KDF recorded in the
+`.key` file. Entries are streamed in chunks through `MultiFernet.rotate` on a
+thread pool, with only a few chunks in flight, into a temporary copy of
+keys.txt that is synced and renamed over it. With the SQLite vault, tokens
+are replaced page by page in a single transaction.
+
+The new `.key` file is written and synced as `key.key.new` before the vault
+changes, then renamed over `key.key` once the vault is rotated. If rotation
+stops between both renames, the next run finishes it.
+"""
+import argparse
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from getpass import getpass
+from os.path import exists
+from time import perf_counter
+from typing import Iterator
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+from vault_commit import locked
+from vault_export import read_chunks
+from vault_import import WRITE_BUFFER, sync_directory
+from vault_index import INDEX_FILE, KEYS_FILE
+from vault_kdf import derive, dump_params, read_params
+from vault_mmap import OFFSETS_FILE
+from vault_search import SEARCH_FILE
+from vault_sqlite import VAULT_DB, SQLiteVault
+
+KEY_FILE: str = "key.key"
+PENDING_SUFFIX: str = ".new"
+
+
+def rotate_chunk(multi: MultiFernet, chunk: list[bytes]) -> bytes:
+    """
+    keys.txt lines with their tokens encrypted again under the newest key
+
+    :param multi: new key first, then the current one
+    :type multi: MultiFernet
+    :param chunk: raw lines of keys.txt
+    :type chunk: list[bytes]
+    :return: rotated lines
+    :rtype: bytes
+    """
+    out: list[bytes] = []
+    for line in chunk:
+        usr, _, pwd = line.rstrip().partition(b"|")
+        if usr:
+            out.append(usr + b"|" + multi.rotate(pwd) + b"\n")
+
+    return b"".join(out)
+
+
+def rotate_tokens(multi: MultiFernet,
+                  rows: list[tuple[int, bytes]]) -> list[tuple[bytes, int]]:
+    """
+    SQLite rows with their tokens encrypted again under the newest key
+
+    :param multi: new key first, then the current one
+    :type multi: MultiFernet
+    :param rows: id and token pairs
+    :type rows: list[tuple[int, bytes]]
+    :return: new token and id pairs
+    :rtype: list[tuple[bytes, int]]
+    """
+    return [(multi.rotate(bytes(token)), id_) for id_, token in rows]
+
+
+def ordered(pool: ThreadPoolExecutor, workers: int, task,
+            multi: MultiFernet, chunks: Iterator) -> Iterator:
+    """
+    Results of `task` over every chunk, in order, with a bounded read-ahead
+
+    :param pool: threads running the task
+    :type pool: ThreadPoolExecutor
+    :param workers: threads in the pool
+    :type workers: int
+    :param task: `rotate_chunk()` or `rotate_tokens()`
+    :param multi: new key first, then the current one
+    :type multi: MultiFernet
+    :param chunks: inputs of the task
+    :type chunks: Iterator
+    :return: generator of results
+    :rtype: Iterator
+    """
+    pending: deque[Future] = deque()
+    for chunk in chunks:
+        pending.append(pool.submit(task, multi, chunk))
+        if len(pending) >= 2 * workers:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def rotate_file(multi: MultiFernet, keys_file: str = KEYS_FILE,
+                workers: int | None = None) -> int:
+    """
+    Re-encrypts keys.txt through a synced temporary file
+
+    :param multi: new key first, then the current one
+    :type multi: MultiFernet
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param workers: encrypting threads, one per core if None
+    :type workers: int | None
+    :return: bytes written
+    :rtype: int
+    """
+    workers = workers or os.cpu_count() or 1
+    folder: str = os.path.dirname(os.path.abspath(keys_file))
+    written: int = 0
+    handle, tmp = tempfile.mkstemp(dir=folder, prefix=".keys-", suffix=".tmp")
+    # Appends made while rotating would be lost by the rename
+    with locked(keys_file):
+        try:
+            with open(handle, "wb", buffering=WRITE_BUFFER) as out:
+                with ThreadPoolExecutor(workers) as pool:
+                    for data in ordered(pool, workers, rotate_chunk, multi,
+                                        read_chunks(keys_file)):
+                        written += out.write(data)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, keys_file)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    sync_directory(folder)
+
+    return written
+
+
+def rotate_db(multi: MultiFernet, vault: SQLiteVault,
+              workers: int | None = None) -> None:
+    """
+    Re-encrypts every token of the SQLite vault in one transaction
+
+    :param multi: new key first, then the current one
+    :type multi: MultiFernet
+    :param vault: SQLite vault to rotate
+    :type vault: SQLiteVault
+    :param workers: encrypting threads, one per core if None
+    :type workers: int | None
+    :return: None
+    :rtype: NoneType
+    """
+    workers = workers or os.cpu_count() or 1
+    with vault.db, ThreadPoolExecutor(workers) as pool:
+        for rows in ordered(pool, workers, rotate_tokens, multi,
+                            vault.token_pages()):
+            vault.set_tokens(rows)
+
+
+def write_key_file(file: str, lines: list[bytes]) -> None:
+    """
+    Writes and syncs a `.key` file
+
+    :param file: Name of the `.key` file
+    :type file: str
+    :param lines: lines of the file, without newlines
+    :type lines: list[bytes]
+    :return: None
+    :rtype: NoneType
+    """
+    with open(file, "wb") as key_file:
+        key_file.write(b"".join(line + b"\n" for line in lines))
+        key_file.flush()
+        os.fsync(key_file.fileno())
+
+
+def first_token(keys_file: str = KEYS_FILE,
+                db: str = VAULT_DB) -> bytes | None:
+    """
+    Token of the first entry of the vault in use, None if it's empty
+
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param db: path of the SQLite vault, used instead of keys.txt if found
+    :type db: str
+    :return: Fernet token
+    :rtype: bytes | None
+    """
+    if exists(db):
+        with SQLiteVault(db) as vault:
+            for rows in vault.token_pages(1):
+                return bytes(rows[0][1])
+        return None
+    if exists(keys_file):
+        with open(keys_file, "rb") as keys:
+            for line in keys:
+                usr, _, pwd = line.rstrip().partition(b"|")
+                if usr:
+                    return pwd
+    return None
+
+
+def remove_sidecars(keys_file: str = KEYS_FILE) -> None:
+    """
+    Removes the sidecars of keys.txt, rebuilt on next use
+
+    Account hashes and the search index are keyed with the main key and
+    dropped lines move the offsets, so none of them survive a rotation.
+
+    :param keys_file: path of the passwords file, the sidecars sit next to it
+    :type keys_file: str
+    :return: None
+    :rtype: NoneType
+    """
+    folder: str = os.path.dirname(keys_file)
+    for sidecar in (INDEX_FILE, OFFSETS_FILE, SEARCH_FILE):
+        path: str = os.path.join(folder, sidecar)
+        if exists(path):
+            os.remove(path)
+
+
+def finish_pending(key_file: str = KEY_FILE, keys_file: str = KEYS_FILE,
+                   db: str = VAULT_DB) -> bool:
+    """
+    Completes or drops a rotation stopped before renaming the `.key` file
+
+    :param key_file: Name of `.key` file
+    :type key_file: str
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param db: path of the SQLite vault
+    :type db: str
+    :return: True if the pending key was put in place
+    :rtype: bool
+    """
+    pending: str = key_file + PENDING_SUFFIX
+    if not exists(pending):
+        return False
+    with open(pending, "rb") as new:
+        new_key: bytes = new.read().split(b"\n")[0]
+    token: bytes | None = first_token(keys_file, db)
+    try:
+        if token is None:
+            raise InvalidToken
+        Fernet(new_key).decrypt(token)
+    except InvalidToken:
+        # The vault never changed, the current key still opens it
+        os.remove(pending)
+        return False
+    # The rotation may have stopped before dropping the sidecars
+    remove_sidecars(keys_file)
+    os.replace(pending, key_file)
+    sync_directory(os.path.dirname(os.path.abspath(key_file)))
+    return True
+
+
+def rotate(key_file: str = KEY_FILE, keys_file: str = KEYS_FILE,
+           db: str = VAULT_DB, workers: int | None = None) -> bytes:
+    """
+    Derives a new main key and re-encrypts the vault in use with it
+
+    The caller is expected to have validated the MPass already.
+
+    :param key_file: Name of `.key` file
+    :type key_file: str
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param db: path of the SQLite vault, rotated instead of keys.txt if found
+    :type db: str
+    :param workers: encrypting threads, one per core if None
+    :type workers: int | None
+    :return: new main key
+    :rtype: bytes
+    """
+    finish_pending(key_file, keys_file, db)
+    with open(key_file, "rb") as file:
+        content: list[bytes] = file.read().split(b"\n")
+    algorithm, params, _ = read_params(key_file)
+    salt: bytes = os.urandom(16)
+    new_key: bytes = derive(content[1], salt, algorithm, params)
+    write_key_file(key_file + PENDING_SUFFIX,
+                   [new_key, content[1], content[2],
+                    dump_params(algorithm, params, salt)])
+    multi: MultiFernet = MultiFernet([Fernet(new_key), Fernet(content[0])])
+
+    if exists(db):
+        with SQLiteVault(db) as vault:
+            rotate_db(multi, vault, workers)
+    elif exists(keys_file):
+        rotate_file(multi, keys_file, workers)
+        remove_sidecars(keys_file)
+    os.replace(key_file + PENDING_SUFFIX, key_file)
+    sync_directory(os.path.dirname(os.path.abspath(key_file)))
+
+    return new_key
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Rotate the main key and re-encrypt the vault"
+    )
+    parser.add_argument("--key-file", default=KEY_FILE)
+    parser.add_argument("-w", "--workers", type=int)
+    args = parser.parse_args()
+
+    # Imported here so this module stays free of the interactive script
+    from password_manager import unlock
+
+    if not exists(args.key_file):
+        print(f"Unable to find '{args.key_file}'")
+        return
+    if finish_pending(args.key_file):
+        print("Finished an interrupted rotation")
+    if unlock(getpass("Enter MPass: "), args.key_file) is None:
+        print("Invalid MPass")
+        return
+    start: float = perf_counter()
+    rotate(args.key_file, workers=args.workers)
+    print(f"Rotated in {perf_counter() - start:.2f} s, "
+          "restart any running agent")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,521 @@
+"""Prefix and typo-tolerant search over the account names of the vault.
+
+Account names are kept in a sorted list, walked with bisect for prefixes,
+and in a trigram index for fuzzy matches. Candidates sharing trigrams with
+the query are checked with an edit distance against every substring of the
+name, so "githb" finds "work.github.com". No password is ever decrypted.
+
+At rest, the names live in keys.search as Fernet tokens under the main key.
+The file starts with a header holding how many bytes of keys.txt it covers
+and where its last segment ends. Each segment is a length-prefixed token of
+a JSON list of names, so adding an account appends a single small segment.
+Segments are merged into one once there are too many of them.
+"""
+import argparse
+import json
+import os
+import struct
+import tempfile
+from bisect import bisect_left, insort
+from collections import defaultdict
+from os.path import exists
+from time import perf_counter
+from typing import Iterable
+
+import numpy as np
+from cryptography.fernet import Fernet
+
+from vault_index import KEYS_FILE
+
+SEARCH_FILE: str = "keys.search"
+MAGIC: bytes = b"KEYSRCH\x01"
+# Magic, bytes of keys.txt covered and end of the last segment
+HEADER: struct.Struct = struct.Struct("<8sQQ")
+SEGMENT: struct.Struct = struct.Struct("<I")
+# Segments read before they are merged into one
+MAX_SEGMENTS: int = 64
+LIMIT: int = 20
+# Names checked for typos per query, the ones sharing most trigrams first
+MAX_CHECKS: int = 32
+
+
+def trigrams(text: str) -> set[str]:
+    """
+    Every run of three characters of a lowercase text
+
+    :param text: account name or query, lowercase
+    :type text: str
+    :return: distinct trigrams
+    :rtype: set[str]
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def letter_masks(query: str) -> dict[str, int]:
+    """
+    Bit masks of the positions of every letter of a query
+
+    :param query: lowercase query
+    :type query: str
+    :return: letter and the bits of its positions
+    :rtype: dict[str, int]
+    """
+    masks: dict[str, int] = {}
+    for pos, letter in enumerate(query):
+        masks[letter] = masks.get(letter, 0) | 1 << pos
+    return masks
+
+
+def substring_distance(query: str, name: str, limit: int,
+                       masks: dict[str, int] | None = None) -> int | None:
+    """
+    Fewest edits turning `query` into some substring of `name`
+
+    Runs Myers' bit-parallel edit distance, a column of the dynamic
+    programming table per letter of the name held in two integers, with a
+    free start anywhere in the name.
+
+    :param query: lowercase query
+    :type query: str
+    :param name: lowercase account name
+    :type name: str
+    :param limit: largest distance of interest
+    :type limit: int
+    :param masks: returned value from `letter_masks(query)`, computed if None
+    :type masks: dict[str, int] | None
+    :return: edit distance, None if above `limit`
+    :rtype: int | None
+    """
+    if masks is None:
+        masks = letter_masks(query)
+    full: int = (1 << len(query)) - 1
+    last: int = 1 << (len(query) - 1)
+    # Vertical deltas of the column: all +1 against an empty name
+    plus: int = full
+    minus: int = 0
+    score: int = len(query)
+    best: int = score
+    for letter in name:
+        equal: int = masks.get(letter, 0)
+        vertical: int = equal | minus
+        horizontal: int = (((equal & plus) + plus) ^ plus) | equal
+        h_plus: int = minus | (~(horizontal | plus) & full)
+        h_minus: int = plus & horizontal
+        if h_plus & last:
+            score += 1
+        elif h_minus & last:
+            score -= 1
+        if score < best:
+            best = score
+        h_plus = (h_plus << 1) & full
+        h_minus = (h_minus << 1) & full
+        plus = h_minus | (~(vertical | h_plus) & full)
+        minus = h_plus & vertical
+
+    return best if best <= limit else None
+
+
+def typos(query: str) -> int:
+    """
+    Edits tolerated for a query of this length
+
+    :param query: lowercase query
+    :type query: str
+    :return: largest edit distance accepted
+    :rtype: int
+    """
+    if len(query) < 4:
+        return 0
+    return 1 if len(query) < 8 else 2
+
+
+class NameIndex:
+    """
+    Account names searchable by prefix or approximate substring
+    """
+
+    def __init__(self, names: Iterable[str] = ()) -> None:
+        self.names: list[str] = []
+        self.lowered: list[str] = []
+        self.known: set[str] = set()
+        self.grams: defaultdict[str, list[int]] = defaultdict(list)
+        self.arrays: dict[str, np.ndarray] = {}
+        for name in names:
+            self.insert(name, keep_sorted=False)
+        # Lowercase name and its number, for bisect
+        self.ordered: list[tuple[str, int]] = sorted(
+            (name, number) for number, name in enumerate(self.lowered)
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def insert(self, name: str, keep_sorted: bool = True) -> bool:
+        """
+        Adds an account name once
+
+        :param name: account/site name
+        :type name: str
+        :param keep_sorted: also place it in the prefix list
+        :type keep_sorted: bool
+        :return: False if the name was known already
+        :rtype: bool
+        """
+        if name in self.known:
+            return False
+        number: int = len(self.names)
+        self.names.append(name)
+        self.lowered.append(name.lower())
+        self.known.add(name)
+        for gram in trigrams(self.lowered[number]):
+            self.grams[gram].append(number)
+            self.arrays.pop(gram, None)
+        if keep_sorted:
+            insort(self.ordered, (self.lowered[number], number))
+        return True
+
+    def prefix(self, query: str, limit: int = LIMIT) -> list[str]:
+        """
+        Names starting with `query`, in alphabetical order
+
+        :param query: start of the account name, any case
+        :type query: str
+        :param limit: most names returned
+        :type limit: int
+        :return: matching names
+        :rtype: list[str]
+        """
+        query = query.lower()
+        found: list[str] = []
+        pos: int = bisect_left(self.ordered, (query,))
+        while (pos < len(self.ordered) and len(found) < limit
+               and self.ordered[pos][0].startswith(query)):
+            found.append(self.names[self.ordered[pos][1]])
+            pos += 1
+
+        return found
+
+    def fuzzy(self, query: str, limit: int = LIMIT) -> list[str]:
+        """
+        Names holding `query` up to a few typos, closest first
+
+        Exact substrings come first, shortest names first. Names needing
+        typos only fill the remaining places. Up to `MAX_CHECKS` of them are
+        checked, from the most trigrams shared with the query down to the
+        fewest a match within the tolerated typos can share.
+
+        :param query: part of the account name, any case
+        :type query: str
+        :param limit: most names returned
+        :type limit: int
+        :return: matching names
+        :rtype: list[str]
+        """
+        query = query.lower()
+        grams: set[str] = trigrams(query)
+        if not grams or not self.names:
+            return self.prefix(query, limit)
+        limit_typos: int = typos(query)
+        # Each typo breaks at most three trigrams of the query
+        needed: int = max(len(grams) - 3 * limit_typos, 1)
+        shared: np.ndarray = np.bincount(
+            np.concatenate([self.posting(gram) for gram in grams]),
+            minlength=len(self.names)
+        )
+        found: list[str] = []
+        # Names holding the query share every trigram with it
+        for number in np.flatnonzero(shared == len(grams)):
+            if self.lowered[number].find(query) != -1:
+                found.append(self.names[number])
+        found.sort(key=lambda name: (len(name), name))
+        if not limit_typos or len(found) >= limit:
+            return found[:limit]
+
+        candidates: np.ndarray = np.flatnonzero(shared >= needed)
+        # Most shared trigrams first
+        candidates = candidates[np.argsort(-shared[candidates],
+                                           kind="stable")][:MAX_CHECKS]
+        exact: set[str] = set(found)
+        masks: dict[str, int] = letter_masks(query)
+        close: list[tuple[int, str]] = []
+        for number in candidates:
+            if len(found) + len(close) >= limit:
+                break
+            name: str = self.names[number]
+            if name in exact:
+                continue
+            distance: int | None = substring_distance(
+                query, self.lowered[number], limit_typos, masks
+            )
+            if distance is not None:
+                close.append((distance, name))
+        close.sort()
+
+        return found + [name for _, name in close]
+
+    def posting(self, gram: str) -> np.ndarray:
+        """
+        Numbers of the names holding a trigram
+
+        :param gram: trigram of a query
+        :type gram: str
+        :return: name numbers, as an array cached until the next insert
+        :rtype: np.ndarray
+        """
+        if gram not in self.arrays:
+            self.arrays[gram] = np.array(self.grams.get(gram, ()),
+                                         dtype=np.int64)
+        return self.arrays[gram]
+
+    def search(self, query: str, limit: int = LIMIT) -> list[str]:
+        """
+        Prefix matches first, then fuzzy ones
+
+        :param query: account name or part of it, any case
+        :type query: str
+        :param limit: most names returned
+        :type limit: int
+        :return: matching names
+        :rtype: list[str]
+        """
+        found: list[str] = self.prefix(query, limit)
+        seen: set[str] = set(found)
+        for name in self.fuzzy(query, limit):
+            if len(found) == limit:
+                break
+            if name not in seen:
+                found.append(name)
+
+        return found
+
+
+def read_names(keys_file: str, start: int) -> tuple[list[str], int]:
+    """
+    Account names of the complete lines of keys.txt from `start`
+
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param start: offset of the first line to read
+    :type start: int
+    :return: names and the offset right after the last full line
+    :rtype: tuple[list[str], int]
+    """
+    names: list[str] = []
+    with open(keys_file, "rb") as keys:
+        keys.seek(start)
+        for line in keys:
+            if not line.endswith(b"\n"):
+                break
+            start += len(line)
+            usr, _, _ = line.partition(b"|")
+            if usr.strip():
+                names.append(usr.decode())
+
+    return names, start
+
+
+def append_segment(fer: Fernet, search_file: str, end: int,
+                   names: list[str], covered: int) -> int:
+    """
+    Appends an encrypted segment of names to keys.search
+
+    :param fer: Fernet wrapper from main key
+    :type fer: Fernet
+    :param search_file: path of the search index
+    :type search_file: str
+    :param end: end of the last segment, `HEADER.size` if there is none
+    :type end: int
+    :param names: names added since the last segment
+    :type names: list[str]
+    :param covered: bytes of keys.txt covered with this segment
+    :type covered: int
+    :return: end of the new segment
+    :rtype: int
+    """
+    token: bytes = fer.encrypt(json.dumps(names).encode())
+    mode: str = "r+b" if exists(search_file) else "wb"
+    with open(search_file, mode) as search:
+        # Drops a segment left over by an update interrupted before its
+        # header
+        search.seek(end)
+        search.truncate()
+        search.write(SEGMENT.pack(len(token)) + token)
+        search.flush()
+        end = search.tell()
+        search.seek(0)
+        search.write(HEADER.pack(MAGIC, covered, end))
+
+    return end
+
+
+class SearchIndex(NameIndex):
+    """
+    Name index of keys.txt, kept encrypted in keys.search
+    """
+
+    def __init__(self, fer: Fernet, keys_file: str = KEYS_FILE,
+                 search_file: str = SEARCH_FILE) -> None:
+        self.fer: Fernet = fer
+        self.keys_file: str = keys_file
+        self.search_file: str = search_file
+        self.covered: int = 0
+        self.end: int = HEADER.size
+        segments: list[list[str]] = self.load()
+        super().__init__(name for names in segments for name in names)
+        if len(segments) > MAX_SEGMENTS:
+            self.compact()
+        self.update()
+
+    def load(self) -> list[list[str]]:
+        """
+        Decrypted segments of keys.search, none if it's unusable
+
+        :return: lists of names, in the order they were added
+        :rtype: list[list[str]]
+        """
+        if not exists(self.search_file):
+            return []
+        with open(self.search_file, "rb") as search:
+            data: bytes = search.read()
+        if len(data) < HEADER.size:
+            return []
+        magic, covered, end = HEADER.unpack_from(data)
+        if magic != MAGIC or end > len(data):
+            return []
+        segments: list[list[str]] = []
+        pos: int = HEADER.size
+        while pos < end:
+            (size,) = SEGMENT.unpack_from(data, pos)
+            pos += SEGMENT.size
+            segments.append(json.loads(self.fer.decrypt(data[pos:pos + size])))
+            pos += size
+        self.covered, self.end = covered, end
+
+        return segments
+
+    def append(self, names: list[str], covered: int) -> None:
+        """
+        Stores a segment of names and the bytes of keys.txt now covered
+
+        :param names: names added since the last segment
+        :type names: list[str]
+        :param covered: bytes of keys.txt covered with this segment
+        :type covered: int
+        :return: None
+        :rtype: NoneType
+        """
+        self.end = append_segment(self.fer, self.search_file, self.end,
+                                  names, covered)
+        self.covered = covered
+
+    def compact(self) -> None:
+        """
+        Rewrites keys.search as a single segment holding every name
+
+        :return: None
+        :rtype: NoneType
+        """
+        token: bytes = self.fer.encrypt(json.dumps(self.names).encode())
+        folder: str = os.path.dirname(os.path.abspath(self.search_file))
+        handle, tmp = tempfile.mkstemp(dir=folder, prefix=".keys-",
+                                       suffix=".tmp")
+        with open(handle, "wb") as search:
+            self.end = HEADER.size + SEGMENT.size + len(token)
+            search.write(HEADER.pack(MAGIC, self.covered, self.end))
+            search.write(SEGMENT.pack(len(token)) + token)
+        os.replace(tmp, self.search_file)
+
+    def update(self) -> None:
+        """
+        Adds the names of the lines appended to keys.txt since the last
+        update, starting over when keys.txt shrank
+
+        :return: None
+        :rtype: NoneType
+        """
+        size: int = (os.path.getsize(self.keys_file)
+                     if exists(self.keys_file) else 0)
+        if self.covered == size:
+            return
+        if self.covered > size:
+            NameIndex.__init__(self)
+            self.covered, self.end = 0, HEADER.size
+        names, covered = read_names(self.keys_file, self.covered)
+        self.append([name for name in names if self.insert(name)], covered)
+
+
+def update_search(fer: Fernet, keys_file: str = KEYS_FILE,
+                  search_file: str = SEARCH_FILE) -> None:
+    """
+    Appends the names added to keys.txt to keys.search, without reading the
+    segments already stored
+
+    :param fer: Fernet wrapper from main key
+    :type fer: Fernet
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param search_file: path of the search index
+    :type search_file: str
+    :return: None
+    :rtype: NoneType
+    """
+    covered: int = -1
+    end: int = HEADER.size
+    if exists(search_file):
+        with open(search_file, "rb") as search:
+            header: bytes = search.read(HEADER.size)
+        if len(header) == HEADER.size:
+            magic, covered, end = HEADER.unpack(header)
+            if magic != MAGIC:
+                covered = -1
+    size: int = os.path.getsize(keys_file) if exists(keys_file) else 0
+    if covered == size:
+        return
+    if not 0 <= covered < size:
+        # Loading rebuilds the whole index
+        if exists(search_file):
+            os.remove(search_file)
+        SearchIndex(fer, keys_file, search_file)
+        return
+    names, covered = read_names(keys_file, covered)
+    # Duplicates are dropped when the segments are loaded
+    append_segment(fer, search_file, end, names, covered)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Time searches over random account names"
+    )
+    parser.add_argument("-n", "--names", type=int, default=100_000)
+    parser.add_argument("-q", "--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from random import Random
+
+    rng: Random = Random(args.seed)
+    syllables: list[str] = [a + b for a in "bcdfghklmnprstvwz"
+                            for b in "aeiou"]
+    tlds: list[str] = [".com", ".org", ".net", ".io", ".dev"]
+    names: list[str] = [
+        "".join(rng.choices(syllables, k=rng.randint(2, 4)))
+        + rng.choice(("", "-", ".")) + rng.choice(syllables)
+        + rng.choice(tlds) for _ in range(args.names)
+    ]
+    start: float = perf_counter()
+    index: NameIndex = NameIndex(names)
+    print(f"{len(index)} names indexed in {perf_counter() - start:.2f} s")
+    queries: list[str] = [rng.choice(names) for _ in range(args.queries)]
+    for label, search in (("prefix", lambda name: index.prefix(name[:6])),
+                          ("exact fuzzy", lambda name: index.fuzzy(name)),
+                          ("typo fuzzy",
+                           lambda name: index.fuzzy(name[:4] + name[5:]))):
+        start = perf_counter()
+        for name in queries:
+            search(name)
+        elapsed: float = perf_counter() - start
+        print(f"{label:12} {elapsed / len(queries) * 1000:.3f} ms per query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""Optional SQLite backend for the password vault.
+
+Stores the same account and Fernet token pairs as keys.txt in a table
+indexed on the account, so single accounts are read, updated or deleted in
+O(log n). The database runs in WAL mode, where readers never block the
+writer, and bulk inserts share a transaction per batch.
+
+Running this module migrates an existing keys.txt into keys.db once. Tokens
+are copied as they are, so no key is needed. The database is built under a
+temporary name and renamed into place once synced, so an interrupted
+migration never leaves a partial keys.db behind.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+from itertools import islice
+from os.path import exists
+from typing import Iterable, Iterator
+
+from vault_import import sync_directory
+from vault_index import KEYS_FILE
+
+VAULT_DB: str = "keys.db"
+# Entries inserted per transaction
+BATCH: int = 10_000
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    account TEXT NOT NULL,
+    token BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_account ON entries (account);
+"""
+
+
+class SQLiteVault:
+    """
+    Accounts and their encrypted passwords kept in a SQLite database
+    """
+
+    def __init__(self, path: str = VAULT_DB) -> None:
+        self.path: str = path
+        # Statements below are parameterized, so sqlite3 prepares each once
+        # and reuses it from its statement cache
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def __enter__(self) -> "SQLiteVault":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.db.close()
+
+    def add(self, account: str, token: bytes) -> None:
+        """
+        Stores a single entry
+
+        :param account: account/site name
+        :type account: str
+        :param token: password encrypted with the main key
+        :type token: bytes
+        :return: None
+        :rtype: NoneType
+        """
+        with self.db:
+            self.db.execute(
+                "INSERT INTO entries (account, token) VALUES (?, ?)",
+                (account, token)
+            )
+
+    def add_many(self, entries: Iterable[tuple[str, bytes]]) -> int:
+        """
+        Stores entries in transactions of `BATCH` inserts
+
+        :param entries: account and encrypted password pairs
+        :type entries: Iterable[tuple[str, bytes]]
+        :return: entries stored
+        :rtype: int
+        """
+        count: int = 0
+        entries = iter(entries)
+        while batch := list(islice(entries, BATCH)):
+            with self.db:
+                self.db.executemany(
+                    "INSERT INTO entries (account, token) VALUES (?, ?)",
+                    batch
+                )
+            count += len(batch)
+
+        return count
+
+    def get(self, account: str) -> list[bytes]:
+        """
+        Encrypted passwords of an account, oldest first
+
+        :param account: account/site name
+        :type account: str
+        :return: tokens stored for the account
+        :rtype: list[bytes]
+        """
+        rows = self.db.execute(
+            "SELECT token FROM entries WHERE account = ? ORDER BY id",
+            (account,)
+        )
+        return [token for (token,) in rows]
+
+    def accounts(self) -> Iterator[str]:
+        """
+        Every account name once, in the order of the account index
+
+        :return: generator of account names
+        :rtype: Iterator[str]
+        """
+        for (account,) in self.db.execute(
+            "SELECT DISTINCT account FROM entries ORDER BY account"
+        ):
+            yield account
+
+    def update(self, account: str, token: bytes) -> int:
+        """
+        Replaces the password of an account
+
+        :param account: account/site name
+        :type account: str
+        :param token: new password encrypted with the main key
+        :type token: bytes
+        :return: entries updated
+        :rtype: int
+        """
+        with self.db:
+            cursor = self.db.execute(
+                "UPDATE entries SET token = ? WHERE account = ?",
+                (token, account)
+            )
+        return cursor.rowcount
+
+    def delete(self, account: str) -> int:
+        """
+        Removes every entry of an account
+
+        :param account: account/site name
+        :type account: str
+        :return: entries removed
+        :rtype: int
+        """
+        with self.db:
+            cursor = self.db.execute(
+                "DELETE FROM entries WHERE account = ?", (account,)
+            )
+        return cursor.rowcount
+
+    def lines(self) -> Iterator[bytes]:
+        """
+        Every entry in the order added, formatted as a keys.txt line
+
+        :return: generator of `account|token` lines
+        :rtype: Iterator[bytes]
+        """
+        rows = self.db.execute("SELECT account, token FROM entries "
+                               "ORDER BY id")
+        for account, token in rows:
+            yield account.encode() + b"|" + bytes(token) + b"\n"
+
+    def token_pages(self,
+                    size: int = BATCH) -> Iterator[list[tuple[int, bytes]]]:
+        """
+        Ids and encrypted passwords of every entry, a page at a time
+
+        :param size: entries per page
+        :type size: int
+        :return: generator of pages of id and token pairs, in id order
+        :rtype: Iterator[list[tuple[int, bytes]]]
+        """
+        last: int = 0
+        # Seeks past the previous page through the primary key
+        while rows := self.db.execute(
+            "SELECT id, token FROM entries WHERE id > ? ORDER BY id LIMIT ?",
+            (last, size)
+        ).fetchall():
+            yield rows
+            last = rows[-1][0]
+
+    def set_tokens(self, rows: Iterable[tuple[bytes, int]]) -> None:
+        """
+        Replaces the token of entries by id, inside the caller's transaction
+
+        :param rows: new token and id pairs
+        :type rows: Iterable[tuple[bytes, int]]
+        :return: None
+        :rtype: NoneType
+        """
+        self.db.executemany("UPDATE entries SET token = ? WHERE id = ?", rows)
+
+    def migrate(self, keys_file: str = KEYS_FILE) -> int:
+        """
+        Copies every entry of keys.txt into the database, in a single
+        transaction
+
+        :param keys_file: path of the passwords file
+        :type keys_file: str
+        :return: entries copied
+        :rtype: int
+        """
+        def read() -> Iterator[tuple[str, bytes]]:
+            with open(keys_file, "rb") as keys:
+                for line in keys:
+                    usr, _, pwd = line.rstrip().partition(b"|")
+                    if usr:
+                        yield usr.decode(), pwd
+
+        with self.db:
+            cursor = self.db.executemany(
+                "INSERT INTO entries (account, token) VALUES (?, ?)", read()
+            )
+        return cursor.rowcount
+
+
+def migrate_file(keys_file: str = KEYS_FILE, path: str = VAULT_DB) -> int:
+    """
+    Builds keys.db from keys.txt under a temporary name, then syncs it and
+    renames it into place
+
+    :param keys_file: path of the passwords file
+    :type keys_file: str
+    :param path: path of the database to create
+    :type path: str
+    :return: entries copied
+    :rtype: int
+    """
+    folder: str = os.path.dirname(os.path.abspath(path))
+    handle, tmp = tempfile.mkstemp(dir=folder, prefix=".keys-", suffix=".db")
+    os.close(handle)
+    try:
+        # Closing checkpoints the WAL into the database file
+        with SQLiteVault(tmp) as vault:
+            count: int = vault.migrate(keys_file)
+        with open(tmp, "rb") as db:
+            os.fsync(db.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        for leftover in (tmp, tmp + "-wal", tmp + "-shm"):
+            if exists(leftover):
+                os.remove(leftover)
+        raise
+    sync_directory(folder)
+
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Migrate keys.txt into the SQLite vault"
+    )
+    parser.add_argument("--keys", default=KEYS_FILE)
+    parser.add_argument("--db", default=VAULT_DB)
+    args = parser.parse_args()
+
+    if not exists(args.keys):
+        print(f"Unable to find '{args.keys}'")
+        return
+    if exists(args.db):
+        print(f"'{args.db}' already exists, nothing migrated")
+        return
+    count: int = migrate_file(args.keys, args.db)
+    print(f"Migrated {count} entries into '{args.db}'")
+
+
+if __name__ == "__main__":
+    main()